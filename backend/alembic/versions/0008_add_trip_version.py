@@ -0,0 +1,28 @@
+"""add trips.version data version counter
+
+Revision ID: 0008_add_trip_version
+Revises: 0007_add_expenses
+Create Date: 2026-10-19 09:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0008_add_trip_version"
+down_revision = "0007_add_expenses"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("trips") as batch_op:
+        batch_op.add_column(
+            sa.Column("version", sa.Integer(), nullable=False, server_default="1")
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("trips") as batch_op:
+        batch_op.drop_column("version")
@@ -0,0 +1,71 @@
+"""add indexes for hot per-trip lookups
+
+Revision ID: 0009_add_hot_path_indexes
+Revises: 0008_add_trip_version
+Create Date: 2026-10-19 12:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0009_add_hot_path_indexes"
+down_revision = "0008_add_trip_version"
+branch_labels = None
+depends_on = None
+
+
+def _covered(table, columns):
+    """True if an existing index or unique constraint starts with ``columns``."""
+    inspector = sa.inspect(op.get_bind())
+    candidates = [ix["column_names"] for ix in inspector.get_indexes(table)]
+    candidates += [uq["column_names"] for uq in inspector.get_unique_constraints(table)]
+    return any(list(c[: len(columns)]) == list(columns) for c in candidates)
+
+
+def _created_here(table, name):
+    """True if ``name`` is a plain unique index, as upgrade creates, not a constraint."""
+    inspector = sa.inspect(op.get_bind())
+    constraints = {uq["name"] for uq in inspector.get_unique_constraints(table)}
+    return any(
+        ix["name"] == name and name not in constraints and not ix.get("duplicates_constraint")
+        for ix in inspector.get_indexes(table)
+    )
+
+
+def upgrade():
+    # 0006 created these as unique constraints; databases that were bootstrapped
+    # from the models before the constraints were declared there may lack them.
+    if not _covered("trip_dates", ["trip_id", "date"]):
+        op.create_index("uq_trip_date", "trip_dates", ["trip_id", "date"], unique=True)
+    if not _covered("user_availability", ["trip_date_id", "user_id"]):
+        op.create_index(
+            "uq_tripdate_user",
+            "user_availability",
+            ["trip_date_id", "user_id"],
+            unique=True,
+        )
+
+    # uq_user_trip is (user_id, trip_id) and cannot serve per-trip member lookups
+    op.create_index("ix_user_trips_trip_id", "user_trips", ["trip_id"])
+    op.create_index("ix_expense_shares_user_id", "expense_shares", ["user_id"])
+
+    # the composite index also serves plain trip_id lookups
+    op.create_index(
+        "ix_expenses_trip_id_created_at", "expenses", ["trip_id", "created_at"]
+    )
+    op.drop_index("ix_expenses_trip_id", table_name="expenses")
+
+
+def downgrade():
+    op.create_index("ix_expenses_trip_id", "expenses", ["trip_id"])
+    op.drop_index("ix_expenses_trip_id_created_at", table_name="expenses")
+    op.drop_index("ix_expense_shares_user_id", table_name="expense_shares")
+    op.drop_index("ix_user_trips_trip_id", table_name="user_trips")
+
+    # only what upgrade created; 0006's unique constraints are 0006's to drop
+    if _created_here("user_availability", "uq_tripdate_user"):
+        op.drop_index("uq_tripdate_user", table_name="user_availability")
+    if _created_here("trip_dates", "uq_trip_date"):
+        op.drop_index("uq_trip_date", table_name="trip_dates")
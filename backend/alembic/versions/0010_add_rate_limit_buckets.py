@@ -0,0 +1,33 @@
+"""add rate_limit_buckets for the shared rate limiter store
+
+Revision ID: 0010_add_rate_limit_buckets
+Revises: 0009_add_hot_path_indexes
+Create Date: 2026-10-19 12:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0010_add_rate_limit_buckets"
+down_revision = "0009_add_hot_path_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "rate_limit_buckets",
+        sa.Column("key", sa.String(length=128), primary_key=True),
+        sa.Column("tokens", sa.Float(), nullable=False),
+        sa.Column("updated_at", sa.Float(), nullable=False),
+    )
+    op.create_index(
+        "ix_rate_limit_buckets_updated_at", "rate_limit_buckets", ["updated_at"]
+    )
+
+
+def downgrade():
+    op.drop_index("ix_rate_limit_buckets_updated_at", table_name="rate_limit_buckets")
+    op.drop_table("rate_limit_buckets")
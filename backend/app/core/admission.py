@@ -0,0 +1,164 @@
+"""Admission control for scarce backends (the Ollama chat model).
+
+``AdmissionController`` caps the number of concurrent calls and parks the
+excess in a bounded wait queue. Waiters are served round-robin across trips,
+and round-robin across users within a trip, so a single busy trip or a single
+chatty user cannot monopolise the model. When the queue is full (overall or
+for the requesting user) the request is rejected immediately with a
+``Retry-After`` estimate instead of waiting for an HTTP timeout.
+
+All bookkeeping happens on the event loop thread, so no locks are needed.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, defaultdict, deque
+from contextlib import asynccontextmanager
+
+from app.core import metrics
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; maps to HTTP 429."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"admission rejected: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        max_queue: int,
+        max_queued_per_user: int,
+        queue_timeout: float,
+        initial_service_time: float = 5.0,
+    ):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.max_queued_per_user = max(1, max_queued_per_user)
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        # trip -> user -> deque of waiter futures; both levels rotate on dispatch
+        self._waiters: "OrderedDict[str, OrderedDict[str, deque]]" = OrderedDict()
+        self._queued_per_user = defaultdict(int)
+        # exponentially weighted average of slot hold time, for Retry-After
+        self._avg_service_time = initial_service_time
+
+        self._wait_seconds = metrics.histogram(
+            f"{name}_admission_wait_seconds",
+            "Time requests spent queued before being admitted.",
+        )
+        self._rejected = metrics.counter(
+            f"{name}_admission_rejected_total",
+            "Requests rejected by admission control.",
+            ("reason",),
+        )
+        self._admitted = metrics.counter(
+            f"{name}_admission_admitted_total", "Requests admitted by admission control."
+        )
+        metrics.gauge(
+            f"{name}_admission_in_flight", "Requests currently holding a slot."
+        ).set_function(lambda: self.in_flight)
+        metrics.gauge(
+            f"{name}_admission_queue_depth", "Requests waiting for a slot."
+        ).set_function(lambda: self.queued)
+
+    def retry_after(self) -> int:
+        """Rough number of seconds until a new request could be served."""
+        backlog = (self.queued + 1) / self.max_concurrency
+        return max(1, math.ceil(backlog * self._avg_service_time))
+
+    def _reject(self, reason: str):
+        self._rejected.inc(reason=reason)
+        raise AdmissionRejected(reason, self.retry_after())
+
+    async def acquire(self, trip_key, user_key):
+        trip_key, user_key = str(trip_key), str(user_key)
+        if self.in_flight < self.max_concurrency and self.queued == 0:
+            self.in_flight += 1
+            self._admitted.inc()
+            self._wait_seconds.observe(0.0)
+            return
+        if self.queued >= self.max_queue:
+            self._reject("queue_full")
+        if self._queued_per_user[user_key] >= self.max_queued_per_user:
+            self._reject("user_queue_full")
+
+        fut = asyncio.get_running_loop().create_future()
+        users = self._waiters.setdefault(trip_key, OrderedDict())
+        users.setdefault(user_key, deque()).append(fut)
+        self.queued += 1
+        self._queued_per_user[user_key] += 1
+        enqueued_at = time.monotonic()
+        try:
+            await asyncio.wait_for(fut, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if fut.done() and not fut.cancelled():
+                # the slot was handed over just as we gave up; pass it on
+                self._release_slot()
+            else:
+                self._discard(trip_key, user_key, fut)
+            if isinstance(exc, asyncio.TimeoutError):
+                self._reject("queue_timeout")
+            raise
+        self._admitted.inc()
+        self._wait_seconds.observe(time.monotonic() - enqueued_at)
+
+    def release(self, held_for: float = None):
+        if held_for is not None:
+            self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * held_for
+        self._release_slot()
+
+    @asynccontextmanager
+    async def slot(self, trip_key, user_key):
+        """Hold one concurrency slot for the duration of the ``async with`` block."""
+        await self.acquire(trip_key, user_key)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def _release_slot(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _discard(self, trip_key, user_key, fut):
+        users = self._waiters.get(trip_key)
+        queue = users.get(user_key) if users else None
+        if queue is None or fut not in queue:
+            return
+        queue.remove(fut)
+        self._forget(trip_key, user_key)
+
+    def _forget(self, trip_key, user_key):
+        self.queued -= 1
+        self._queued_per_user[user_key] -= 1
+        if self._queued_per_user[user_key] <= 0:
+            del self._queued_per_user[user_key]
+        users = self._waiters[trip_key]
+        if not users[user_key]:
+            del users[user_key]
+        if not users:
+            del self._waiters[trip_key]
+
+    def _dispatch(self):
+        while self.in_flight < self.max_concurrency and self._waiters:
+            trip_key, users = next(iter(self._waiters.items()))
+            user_key, queue = next(iter(users.items()))
+            fut = queue.popleft()
+            # rotate: this user goes behind the trip's other users, and this
+            # trip goes behind the other waiting trips
+            users.move_to_end(user_key)
+            self._waiters.move_to_end(trip_key)
+            self._forget(trip_key, user_key)
+            if fut.done():
+                continue
+            self.in_flight += 1
+            fut.set_result(None)
@@ -0,0 +1,163 @@
+"""Circuit breaker for calls to an unreliable downstream service.
+
+The breaker starts ``closed``. After ``failure_threshold`` consecutive failed
+or slow calls it ``open``s and every call fails fast with
+``CircuitOpenError``. It closes again when a health probe reports the
+service as healthy (see ``run_health_probe``); as a fallback, once
+``open_seconds`` have passed a single trial call is let through
+(``half_open``) and its outcome decides the next state.
+"""
+import asyncio
+import logging
+import math
+import time
+from typing import Awaitable, Callable
+
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the service while the circuit is open."""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"circuit '{name}' is open")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        slow_call_seconds: float,
+        open_seconds: float,
+    ):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.last_failure = None
+        self._trial_in_flight = False
+
+        self._rejected = metrics.counter(
+            f"{name}_breaker_rejected_total", "Calls rejected while the circuit was open."
+        )
+        self._transitions = metrics.counter(
+            f"{name}_breaker_transitions_total", "Circuit breaker state changes.", ("state",)
+        )
+        metrics.gauge(
+            f"{name}_breaker_state", "Circuit state: 0 closed, 1 half-open, 2 open."
+        ).set_function(lambda: _STATE_VALUES[self.state])
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        logger.warning("circuit %s: %s -> %s", self.name, self.state, state)
+        self.state = state
+        self._transitions.inc(state=state)
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        if state == CLOSED:
+            self.opened_at = None
+            self.consecutive_failures = 0
+        self._trial_in_flight = False
+
+    def retry_after(self) -> int:
+        if self.opened_at is None:
+            return 1
+        remaining = self.open_seconds - (time.monotonic() - self.opened_at)
+        return max(1, math.ceil(remaining))
+
+    def _trial_due(self) -> bool:
+        return (
+            self.state == OPEN
+            and time.monotonic() - self.opened_at >= self.open_seconds
+        )
+
+    def check(self):
+        """Fail fast if a call would currently be rejected (does not claim a trial)."""
+        if self.state == CLOSED or (self._trial_due() and not self._trial_in_flight):
+            return
+        if self.state == HALF_OPEN and not self._trial_in_flight:
+            return
+        self._rejected.inc()
+        raise CircuitOpenError(self.name, self.retry_after())
+
+    def before_call(self):
+        if self._trial_due():
+            self._transition(HALF_OPEN)
+        if self.state == CLOSED:
+            return
+        if self.state == HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return
+        self._rejected.inc()
+        raise CircuitOpenError(self.name, self.retry_after())
+
+    def record_success(self, duration: float = 0.0):
+        if duration >= self.slow_call_seconds:
+            self.record_failure(f"slow call ({duration:.1f}s)")
+            return
+        self.consecutive_failures = 0
+        self._transition(CLOSED)
+
+    def record_failure(self, reason: str = None):
+        self.last_failure = reason
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self._transition(OPEN)
+            # restart the open window even if we were already open
+            self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    async def call(self, fn: Callable[[], Awaitable], failure_types=(Exception,)):
+        """Run ``fn()`` under the breaker, recording its outcome."""
+        self.before_call()
+        started = time.monotonic()
+        try:
+            result = await fn()
+        except failure_types as e:
+            self.record_failure(type(e).__name__)
+            raise
+        except BaseException:
+            # cancellation etc. says nothing about the service; free the trial
+            self._trial_in_flight = False
+            raise
+        self.record_success(time.monotonic() - started)
+        return result
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "last_failure": self.last_failure,
+            "retry_after": self.retry_after() if self.state != CLOSED else None,
+        }
+
+
+async def run_health_probe(
+    breaker: CircuitBreaker, probe: Callable[[], Awaitable[bool]], interval: float
+):
+    """Background loop: while the breaker is not closed, probe the service and
+    close the breaker as soon as the probe succeeds."""
+    while True:
+        await asyncio.sleep(interval)
+        if breaker.state == CLOSED:
+            continue
+        try:
+            healthy = await probe()
+        except Exception:
+            healthy = False
+        if healthy:
+            breaker.record_success()
@@ -17,5 +17,153 @@ if not DATABASE_URL:
 		# fallback to a local sqlite file for development
 		DATABASE_URL = "sqlite:///./dev.db"
 
+
+def _async_database_url(url: str) -> str:
+	"""Map a sync SQLAlchemy URL to its asyncio driver (asyncpg / aiosqlite)."""
+	scheme, sep, rest = url.partition("://")
+	base = scheme.split("+", 1)[0]
+	if base in ("postgresql", "postgres"):
+		return f"postgresql+asyncpg{sep}{rest}"
+	if base == "sqlite":
+		return f"sqlite+aiosqlite{sep}{rest}"
+	return url
+
+
+# Async endpoints use a separate asyncio engine on the same database.
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_database_url(DATABASE_URL)
+
+# Optional read replica for safe GET handlers. Without it reads go to the
+# primary. After a write, a user is pinned to the primary for
+# READ_YOUR_WRITES_SECONDS so they never read data older than their own write.
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+ASYNC_DATABASE_READ_URL = os.getenv("ASYNC_DATABASE_READ_URL") or (
+	_async_database_url(DATABASE_READ_URL) if DATABASE_READ_URL else None
+)
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
 # CORS allowed origins for development
 ALLOW_ORIGINS: List[str] = ["http://localhost:3000", "http://127.0.0.1:3000", "*"]
+
+# Ollama chat backend
+OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://chat:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma:2b")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "60"))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+
+# Admission control in front of the chat backend. A single Ollama instance
+# only serves a few generations at once; excess requests wait in a bounded,
+# fair queue and are rejected with 429 once it is full.
+CHAT_MAX_CONCURRENCY = int(os.getenv("CHAT_MAX_CONCURRENCY", "2"))
+CHAT_MAX_QUEUE = int(os.getenv("CHAT_MAX_QUEUE", "16"))
+CHAT_MAX_QUEUED_PER_USER = int(os.getenv("CHAT_MAX_QUEUED_PER_USER", "2"))
+CHAT_QUEUE_TIMEOUT = float(os.getenv("CHAT_QUEUE_TIMEOUT", "30"))
+
+# Asynchronous chat jobs: prompts are queued and run by background workers,
+# results are kept in process memory for CHAT_JOB_TTL seconds.
+CHAT_JOB_WORKERS = int(os.getenv("CHAT_JOB_WORKERS", str(CHAT_MAX_CONCURRENCY)))
+CHAT_JOB_MAX_PENDING = int(os.getenv("CHAT_JOB_MAX_PENDING", "100"))
+CHAT_JOB_TTL = float(os.getenv("CHAT_JOB_TTL", "600"))
+CHAT_JOB_MAX_WAIT = float(os.getenv("CHAT_JOB_MAX_WAIT", "30"))
+
+# Circuit breaker around the chat backend: opens after consecutive failed or
+# slow calls, fails fast with 503 while open and closes again once the
+# background probe of /api/tags succeeds.
+CHAT_BREAKER_FAILURE_THRESHOLD = int(os.getenv("CHAT_BREAKER_FAILURE_THRESHOLD", "3"))
+CHAT_BREAKER_SLOW_CALL_SECONDS = float(os.getenv("CHAT_BREAKER_SLOW_CALL_SECONDS", "45"))
+CHAT_BREAKER_OPEN_SECONDS = float(os.getenv("CHAT_BREAKER_OPEN_SECONDS", "30"))
+CHAT_HEALTH_PROBE_INTERVAL = float(os.getenv("CHAT_HEALTH_PROBE_INTERVAL", "5"))
+
+# Number of per-trip AI context summaries kept in memory.
+CHAT_CONTEXT_CACHE_SIZE = int(os.getenv("CHAT_CONTEXT_CACHE_SIZE", "512"))
+
+# Model routing for chat. Short factual questions go to the small model,
+# long or planning-style prompts to the large one (when configured). If the
+# large model's recent p95 latency exceeds its budget, traffic falls back to
+# the small model until slow samples age out of the window.
+OLLAMA_SMALL_MODEL = os.getenv("OLLAMA_SMALL_MODEL", OLLAMA_MODEL)
+OLLAMA_LARGE_MODEL = os.getenv("OLLAMA_LARGE_MODEL", "")
+CHAT_LONG_PROMPT_CHARS = int(os.getenv("CHAT_LONG_PROMPT_CHARS", "280"))
+CHAT_LARGE_MODEL_P95_BUDGET = float(os.getenv("CHAT_LARGE_MODEL_P95_BUDGET", "20"))
+CHAT_LATENCY_WINDOW_SECONDS = float(os.getenv("CHAT_LATENCY_WINDOW_SECONDS", "300"))
+
+# Database connection pool. The sync threadpool used for `def` endpoints is
+# sized to pool_size + max_overflow unless THREADPOOL_SIZE is set, so worker
+# threads never queue on the pool.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "0")) or (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+
+# Per-request SQL accounting. Statement counts and DB time are reported in the
+# Server-Timing header; a warning is logged when one statement shape runs more
+# than SQL_REPEAT_WARN_THRESHOLD times in a single request (an N+1 pattern).
+SQL_REPEAT_WARN_THRESHOLD = int(os.getenv("SQL_REPEAT_WARN_THRESHOLD", "10"))
+
+# On-demand profiling. A request is profiled when it carries
+# `X-Profile: <PROFILING_TOKEN>` or when PROFILE_ALL_REQUESTS is set; results are
+# written to PROFILING_DIR as speedscope JSON ("sample") or pstats ("cprofile").
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILE_ALL_REQUESTS = os.getenv("PROFILE_ALL_REQUESTS", "false").lower() == "true"
+PROFILING_DIR = os.getenv("PROFILING_DIR", "./profiles")
+PROFILING_MODE = os.getenv("PROFILING_MODE", "sample")
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.002"))
+PROFILE_TRACEMALLOC = os.getenv("PROFILE_TRACEMALLOC", "false").lower() == "true"
+
+# Request tracing, off unless TRACE_EXPORTER is set. TRACE_SAMPLE_RATE of
+# requests are traced; a sampled W3C traceparent only forces a trace when the
+# client is in TRACE_TRUSTED_PARENTS (comma-separated addresses or networks,
+# "*" for any). Traces go to TRACE_FILE as OTLP/JSON lines ("file") or to an
+# OTLP/HTTP collector ("otlp").
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_TRUSTED_PARENTS = os.getenv("TRACE_TRUSTED_PARENTS", "")
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "")
+TRACE_FILE = os.getenv("TRACE_FILE", "./traces.jsonl")
+OTLP_ENDPOINT = os.getenv("OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "tip-trip-backend")
+
+# Per-trip response cache for read endpoints, keyed on the trip data version.
+# When an entry is out of date and the rebuild takes longer than
+# RESPONSE_CACHE_STALE_BUDGET seconds, the previous body is served while the
+# rebuild finishes in the background.
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+RESPONSE_CACHE_STALE_BUDGET = float(os.getenv("RESPONSE_CACHE_STALE_BUDGET", "0.25"))
+RESPONSE_CACHE_REFRESH_WORKERS = int(os.getenv("RESPONSE_CACHE_REFRESH_WORKERS", "2"))
+
+# POST /batch: most sub-requests accepted in one batch.
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "50"))
+
+# Opt-in fast path for hot list endpoints (currently GET .../expenses): payloads
+# are built from plain Core rows and encoded with orjson, skipping the
+# per-row Pydantic models. The output is byte-identical to the default path.
+FAST_JSON_LISTS = os.getenv("FAST_JSON_LISTS", "false").lower() == "true"
+
+# Response encoding. Bodies of at least COMPRESSION_MIN_BYTES are compressed
+# with brotli (if installed) or gzip, as negotiated via Accept-Encoding.
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+# Token-bucket rate limits for abuse-prone routes. A budget "N/S" allows bursts
+# of N requests, refilled at N per S seconds; empty disables it. Buckets are
+# kept per process ("memory") or in the rate_limit_buckets table ("sql"), on
+# RATE_LIMIT_DATABASE_URL or else the primary database, so they hold across
+# workers.
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_DATABASE_URL = os.getenv("RATE_LIMIT_DATABASE_URL", "")
+RATE_LIMIT_USER_CREATE_IP = os.getenv("RATE_LIMIT_USER_CREATE_IP", "20/60")
+RATE_LIMIT_CHAT_USER = os.getenv("RATE_LIMIT_CHAT_USER", "10/60")
+RATE_LIMIT_CHAT_TRIP = os.getenv("RATE_LIMIT_CHAT_TRIP", "30/60")
+RATE_LIMIT_AVAILABILITY_USER = os.getenv("RATE_LIMIT_AVAILABILITY_USER", "120/60")
+RATE_LIMIT_AVAILABILITY_TRIP = os.getenv("RATE_LIMIT_AVAILABILITY_TRIP", "600/60")
+
+# In-process Bloom filters over trip hashes and user tokens, built at startup.
+# Values the filter has not seen are checked against the primary in batches,
+# so a flood of unknown identifiers costs one query per round, not per request.
+# A request waits at most KNOWN_IDS_LOOKUP_TIMEOUT seconds for its round before
+# running its own query instead.
+KNOWN_IDS_FILTER = os.getenv("KNOWN_IDS_FILTER", "true").lower() == "true"
+KNOWN_IDS_ERROR_RATE = float(os.getenv("KNOWN_IDS_ERROR_RATE", "0.001"))
+KNOWN_IDS_LOOKUP_TIMEOUT = float(os.getenv("KNOWN_IDS_LOOKUP_TIMEOUT", "0.25"))
@@ -0,0 +1,225 @@
+"""Negotiated response encodings: MessagePack bodies and gzip/brotli compression.
+
+``MessagePackMiddleware`` re-encodes JSON responses as MessagePack for
+clients whose ``Accept`` asks for ``application/msgpack`` at least as
+strongly as for JSON. The document is decoded and packed as is, so every
+endpoint keeps its schema. ``CompressionMiddleware`` compresses bodies of at
+least ``COMPRESSION_MIN_BYTES`` with brotli or gzip, whichever
+``Accept-Encoding`` ranks higher (brotli on a tie).
+
+Both buffer the response and do the CPU work in a worker thread once the
+body is large enough to be worth the hop, so big calendars and ledgers don't
+stall the event loop. Streamed responses (several body messages) pass
+through untouched. A strong ETag is weakened on a re-encoded body, since its
+bytes no longer match the tagged representation; ``If-None-Match`` compares
+weakly, so revalidation keeps working.
+
+brotli and msgpack are optional; without them only gzip and JSON are offered.
+"""
+import gzip
+import json
+from typing import Dict, Optional
+
+from anyio import to_thread
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.core import metrics
+from app.core.config import COMPRESSION_MIN_BYTES, GZIP_LEVEL, BROTLI_QUALITY
+from app.core.etag import weaken
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+COMPRESSIBLE_TYPES = ("application/json", "application/msgpack", "text/")
+# below this, re-encoding costs less than handing the body to a thread
+INLINE_BYTES = 4 * 1024
+
+_ratio = metrics.histogram(
+    "http_response_compression_ratio",
+    "Encoded size over original size of re-encoded response bodies.",
+    ("encoding",),
+    buckets=(0.05, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.6, 0.8, 1.0),
+)
+_bytes = metrics.counter(
+    "http_response_encoded_bytes_total",
+    "Response body bytes before and after re-encoding.",
+    ("encoding", "stage"),
+)
+
+
+def parse_qvalues(value: Optional[str]) -> Dict[str, float]:
+    """``{token: q}`` of an Accept-style header; malformed weights count as 0."""
+    result = {}
+    for item in (value or "").split(","):
+        token, *params = [p.strip() for p in item.split(";")]
+        if not token:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        result[token.lower()] = q
+    return result
+
+
+def _add_vary(headers: MutableHeaders, name: str):
+    vary = headers.get("vary")
+    if not vary:
+        headers["vary"] = name
+    elif name.lower() not in vary.lower():
+        headers["vary"] = f"{vary}, {name}"
+
+
+class _ReencodingMiddleware:
+    """Buffer eligible responses and replace their body with ``reencode``'s."""
+
+    vary = ""
+
+    def __init__(self, app):
+        self.app = app
+
+    def negotiate(self, headers: Headers) -> Optional[str]:
+        raise NotImplementedError
+
+    def eligible(self, headers: MutableHeaders) -> bool:
+        raise NotImplementedError
+
+    def reencode(self, choice: str, headers: MutableHeaders, body: bytes) -> Optional[bytes]:
+        """New body (headers updated in place), or None to send the original."""
+        raise NotImplementedError
+
+    async def __call__(self, scope, receive, send):
+        choice = self.negotiate(Headers(scope=scope)) if scope["type"] == "http" else None
+        if choice is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        chunks = []
+        passthrough = False
+
+        async def send_reencoded(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=list(message.get("headers", [])))
+                if message["status"] in (204, 304) or not self.eligible(headers):
+                    passthrough = True
+                    await send(message)
+                    return
+                _add_vary(headers, self.vary)
+                start = {**message, "headers": headers.raw}
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                if len(chunks) == 1:
+                    # streamed: forward everything from here on as is
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                return
+
+            body = b"".join(chunks)
+            headers = MutableHeaders(raw=start["headers"])
+            if len(body) < INLINE_BYTES:
+                new_body = self.reencode(choice, headers, body)
+            else:
+                new_body = await to_thread.run_sync(self.reencode, choice, headers, body)
+            if new_body is not None:
+                headers["content-length"] = str(len(new_body))
+                if "etag" in headers:
+                    headers["etag"] = weaken(headers["etag"])
+                body = new_body
+            await send({**start, "headers": headers.raw})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_reencoded)
+
+
+class MessagePackMiddleware(_ReencodingMiddleware):
+    vary = "Accept"
+
+    def negotiate(self, headers: Headers) -> Optional[str]:
+        if msgpack is None or "msgpack" not in headers.get("accept", ""):
+            return None
+        accept = parse_qvalues(headers.get("accept"))
+        wanted = max(accept.get(t, 0.0) for t in MSGPACK_TYPES)
+        if wanted > 0 and wanted >= accept.get("application/json", 0.0):
+            return "msgpack"
+        return None
+
+    def eligible(self, headers: MutableHeaders) -> bool:
+        return headers.get("content-type", "").startswith("application/json")
+
+    def reencode(self, choice, headers, body):
+        if not body:
+            return None
+        packed = msgpack.packb(json.loads(body), use_bin_type=True)
+        _ratio.observe(len(packed) / len(body), encoding=choice)
+        _bytes.inc(len(body), encoding=choice, stage="original")
+        _bytes.inc(len(packed), encoding=choice, stage="encoded")
+        headers["content-type"] = MSGPACK_TYPES[0]
+        return packed
+
+
+class CompressionMiddleware(_ReencodingMiddleware):
+    vary = "Accept-Encoding"
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = COMPRESSION_MIN_BYTES,
+        gzip_level: int = GZIP_LEVEL,
+        brotli_quality: int = BROTLI_QUALITY,
+    ):
+        super().__init__(app)
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = ("br", "gzip") if brotli is not None else ("gzip",)
+
+    def negotiate(self, headers: Headers) -> Optional[str]:
+        accept = parse_qvalues(headers.get("accept-encoding"))
+        best, best_q = None, 0.0
+        for encoding in self.encodings:
+            q = accept.get(encoding, accept.get("*", 0.0))
+            if q > best_q:
+                best, best_q = encoding, q
+        return best
+
+    def eligible(self, headers: MutableHeaders) -> bool:
+        if "content-encoding" in headers:
+            return False
+        if not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES):
+            return False
+        length = headers.get("content-length")
+        return length is None or int(length) >= self.minimum_size
+
+    def reencode(self, choice, headers, body):
+        if len(body) < self.minimum_size:
+            return None
+        if choice == "br":
+            compressed = brotli.compress(body, quality=self.brotli_quality)
+        else:
+            compressed = gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+        if len(compressed) >= len(body):
+            return None
+        _ratio.observe(len(compressed) / len(body), encoding=choice)
+        _bytes.inc(len(body), encoding=choice, stage="original")
+        _bytes.inc(len(compressed), encoding=choice, stage="encoded")
+        headers["content-encoding"] = choice
+        return compressed
@@ -0,0 +1,47 @@
+"""Conditional GET helpers.
+
+Read endpoints derive a strong ETag from the version of the data they render,
+so a matching ``If-None-Match`` can be answered with 304 Not Modified before
+any payload is built.
+"""
+import hashlib
+from typing import Optional
+
+from fastapi import Response
+
+# clients may keep a copy but must revalidate it; bodies are per-user data
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag for the representation identified by ``parts``."""
+    digest = hashlib.sha1(":".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:24]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison as required for If-None-Match (RFC 9110 13.1.2)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def etag_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=etag_headers(etag))
+
+
+def weaken(etag: str) -> str:
+    """Weak form of ``etag``, for bodies re-encoded from the tagged representation."""
+    return etag if etag.startswith("W/") else f"W/{etag}"
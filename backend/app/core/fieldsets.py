@@ -0,0 +1,42 @@
+"""Sparse fieldsets: ``?fields=a,b`` trims a response to the listed fields.
+
+``field_selector(Schema)`` builds a query dependency that validates the
+names against the schema and returns them in schema order (so equivalent
+selections share cache entries and ETags), or None when the parameter is
+absent. ``select_fields`` applies the selection to one object or a list.
+"""
+from typing import Optional, Tuple, Type
+
+from fastapi import HTTPException, Query
+from pydantic import BaseModel
+
+
+def field_selector(schema: Type[BaseModel]):
+    allowed = tuple(schema.model_fields)
+
+    def fields(
+        fields: Optional[str] = Query(
+            None, description=f"Comma-separated subset of: {', '.join(allowed)}"
+        ),
+    ) -> Optional[Tuple[str, ...]]:
+        if fields is None:
+            return None
+        requested = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = requested.difference(allowed)
+        if unknown or not requested:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(sorted(unknown))}" if unknown else "No fields requested",
+            )
+        return tuple(f for f in allowed if f in requested)
+
+    return fields
+
+
+def select_fields(data, fields: Optional[Tuple[str, ...]]):
+    """Keep only ``fields`` of a JSON object, or of each object in a list."""
+    if fields is None:
+        return data
+    if isinstance(data, list):
+        return [select_fields(item, fields) for item in data]
+    return {k: data[k] for k in fields if k in data}
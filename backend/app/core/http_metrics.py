@@ -0,0 +1,60 @@
+"""Per-route HTTP request metrics.
+
+Requests are labelled by the matched route template (``/trips/{hash_id}``)
+rather than the raw path, so label cardinality stays bounded by the number of
+routes no matter how many trips exist.
+"""
+import time
+
+from app.core import metrics
+
+UNMATCHED_ROUTE = "unmatched"
+
+_requests = metrics.counter(
+    "http_requests_total", "HTTP requests by route and status class.", ("method", "route", "status")
+)
+_duration = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route")
+)
+_in_flight = metrics.gauge("http_requests_in_flight", "HTTP requests being served.")
+
+
+def route_template(scope) -> str:
+    """Path template of the route that handled ``scope``, once routing has run."""
+    route = scope.get("route")
+    return getattr(route, "path", UNMATCHED_ROUTE)
+
+
+def status_class(status: int) -> str:
+    return f"{status // 100}xx"
+
+
+class HTTPMetricsMiddleware:
+    """Count requests and time them from first byte in to last byte out."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        _in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _in_flight.dec()
+            route = route_template(scope)
+            method = scope["method"]
+            _duration.observe(time.perf_counter() - started, method=method, route=route)
+            _requests.inc(method=method, route=route, status=status_class(status))
@@ -0,0 +1,312 @@
+"""Opt-in profiling of single requests.
+
+A request is profiled when it sends ``X-Profile: <PROFILING_TOKEN>``, or when
+``PROFILE_ALL_REQUESTS`` is set. Two modes are supported, chosen with
+``X-Profile-Mode`` (default ``PROFILING_MODE``):
+
+``sample``
+    A background thread samples the request's stacks every
+    ``PROFILE_SAMPLE_INTERVAL`` seconds and writes ``<id>.speedscope.json``.
+    Open it at https://www.speedscope.app.
+``cprofile``
+    Deterministic profiling with ``cProfile``, written to ``<id>.pstats``.
+    Load it with ``pstats.Stats`` or snakeviz.
+
+Sync endpoints run in threadpool workers, so ``instrument_sync_endpoints``
+wraps them to profile or mark the worker thread while it serves a profiled
+request. On the event loop, a cProfile run also includes coroutines of other
+requests that interleave with the profiled one.
+
+``X-Profile-Memory: 1`` (or ``PROFILE_TRACEMALLOC``) adds a tracemalloc
+snapshot, ``<id>.tracemalloc``, which ``tracemalloc.Snapshot.load`` can read.
+The profile id is returned in the ``X-Profile-Id`` response header.
+"""
+import asyncio
+import cProfile
+import functools
+import hmac
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+
+from anyio import to_thread
+from fastapi.routing import APIRoute
+
+from app.core.config import (
+    PROFILING_TOKEN,
+    PROFILE_ALL_REQUESTS,
+    PROFILING_DIR,
+    PROFILING_MODE,
+    PROFILE_SAMPLE_INTERVAL,
+    PROFILE_TRACEMALLOC,
+)
+
+MODES = ("sample", "cprofile")
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+
+class _Sampler(threading.Thread):
+    """Collect stacks of the threads currently working on one request."""
+
+    def __init__(self, profile: "RequestProfile", interval: float):
+        super().__init__(name=f"profile-{profile.id}", daemon=True)
+        self.profile = profile
+        self.interval = interval
+        self.frames = []
+        self._frame_index = {}
+        self.samples = []
+        self.weights = []
+        self._done = threading.Event()
+
+    def _index(self, code) -> int:
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        idx = self._frame_index.get(key)
+        if idx is None:
+            idx = self._frame_index[key] = len(self.frames)
+            self.frames.append({"name": key[0], "file": key[1], "line": key[2]})
+        return idx
+
+    def _stack(self, frame):
+        stack = []
+        while frame is not None:
+            stack.append(self._index(frame.f_code))
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def _take(self, weight: float):
+        profile = self.profile
+        for ident, frame in sys._current_frames().items():
+            if ident in profile.worker_threads:
+                self.samples.append(self._stack(frame))
+                self.weights.append(weight)
+            elif ident == profile.loop_thread:
+                # on the event loop only count samples taken while this
+                # request's coroutine chain is actually running
+                f = frame
+                while f is not None and f is not profile.root_frame:
+                    f = f.f_back
+                if f is not None:
+                    self.samples.append(self._stack(frame))
+                    self.weights.append(weight)
+
+    def run(self):
+        last = time.perf_counter()
+        while not self._done.wait(self.interval):
+            now = time.perf_counter()
+            self._take(now - last)
+            last = now
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def speedscope(self, name: str, duration: float) -> dict:
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": name,
+            "exporter": "tip-trip",
+            "activeProfileIndex": 0,
+            "shared": {"frames": self.frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": duration,
+                    "samples": self.samples,
+                    "weights": self.weights,
+                }
+            ],
+        }
+
+
+class RequestProfile:
+    """State for one profiled request."""
+
+    def __init__(self, name: str, mode: str, memory: bool, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.mode = mode
+        self.memory = memory
+        self.interval = interval
+        self.loop_thread = threading.get_ident()
+        self.root_frame = None
+        self.worker_threads = set()
+        self._lock = threading.Lock()
+        self._profiler = None
+        self._worker_profilers = []
+        self._sampler = None
+        self._started_tracemalloc = False
+        self._snapshot = None
+        self._started = 0.0
+        self.duration = 0.0
+
+    def start(self, root_frame):
+        self.root_frame = root_frame
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._started = time.perf_counter()
+        if self.mode == "cprofile":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._sampler = _Sampler(self, self.interval)
+            self._sampler.start()
+
+    def stop(self):
+        self.duration = time.perf_counter() - self._started
+        if self._profiler is not None:
+            self._profiler.disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+        if self.memory:
+            self._snapshot = tracemalloc.take_snapshot()
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+
+    def run_in_worker(self, fn, *args, **kwargs):
+        """Run a sync endpoint on a worker thread as part of this profile."""
+        ident = threading.get_ident()
+        with self._lock:
+            self.worker_threads.add(ident)
+        try:
+            if self.mode != "cprofile":
+                return fn(*args, **kwargs)
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(fn, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self._worker_profilers.append(profiler)
+        finally:
+            with self._lock:
+                self.worker_threads.discard(ident)
+
+    def write(self, directory: str) -> list:
+        """Write the collected profile files; returns their paths."""
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, self.id)
+        paths = []
+        if self._profiler is not None:
+            stats = pstats.Stats(self._profiler)
+            for profiler in self._worker_profilers:
+                stats.add(profiler)
+            stats.dump_stats(base + ".pstats")
+            paths.append(base + ".pstats")
+        if self._sampler is not None:
+            with open(base + ".speedscope.json", "w") as f:
+                json.dump(self._sampler.speedscope(self.name, self.duration), f)
+            paths.append(base + ".speedscope.json")
+        if self._snapshot is not None:
+            self._snapshot.dump(base + ".tracemalloc")
+            paths.append(base + ".tracemalloc")
+        return paths
+
+
+_active: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+def _join_profile(call):
+    @functools.wraps(call)
+    def wrapper(*args, **kwargs):
+        profile = _active.get()
+        if profile is None:
+            return call(*args, **kwargs)
+        return profile.run_in_worker(call, *args, **kwargs)
+
+    wrapper._joins_profile = True
+    return wrapper
+
+
+def instrument_sync_endpoints(app):
+    """Let sync endpoints of ``app`` join the profile of the request they serve.
+
+    FastAPI runs ``dependant.call`` in a threadpool worker, with the request's
+    context copied in. The wrapper costs one context variable lookup when no
+    profile is active.
+    """
+    for route in app.routes:
+        if not isinstance(route, APIRoute):
+            continue
+        call = route.dependant.call
+        if call is None or asyncio.iscoroutinefunction(call) or getattr(call, "_joins_profile", False):
+            continue
+        route.dependant.call = _join_profile(call)
+
+
+class ProfilingMiddleware:
+    """Profile requests that opt in via header, or all requests when configured."""
+
+    def __init__(
+        self,
+        app,
+        token: str = PROFILING_TOKEN,
+        profile_all: bool = PROFILE_ALL_REQUESTS,
+        directory: str = PROFILING_DIR,
+        default_mode: str = PROFILING_MODE,
+        memory: bool = PROFILE_TRACEMALLOC,
+    ):
+        self.app = app
+        self.token = token
+        self.profile_all = profile_all
+        self.directory = directory
+        self.default_mode = default_mode if default_mode in MODES else "sample"
+        self.memory = memory
+        # cProfile allows one active profiler per thread, and overlapping
+        # samples would be misattributed; profile one request at a time
+        self._busy = False
+
+    def _options(self, scope):
+        headers = {}
+        if self.token or self.profile_all:
+            for name, value in scope.get("headers", []):
+                if name.startswith(b"x-profile"):
+                    headers[name] = value
+        # bytes: compare_digest rejects str with non-ASCII characters
+        requested = self.token and hmac.compare_digest(
+            headers.get(b"x-profile", b""), self.token.encode()
+        )
+        if not (requested or self.profile_all):
+            return None
+        mode = headers.get(b"x-profile-mode", b"").decode("latin-1")
+        if mode not in MODES:
+            mode = self.default_mode
+        memory = self.memory or headers.get(b"x-profile-memory", b"").lower() in (b"1", b"true")
+        return mode, memory
+
+    async def __call__(self, scope, receive, send):
+        options = self._options(scope) if scope["type"] == "http" and not self._busy else None
+        if options is None:
+            await self.app(scope, receive, send)
+            return
+
+        mode, memory = options
+        profile = RequestProfile(f"{scope['method']} {scope['path']}", mode, memory)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile.id.encode("latin-1"))
+                ]
+            await send(message)
+
+        self._busy = True
+        token = _active.set(profile)
+        profile.start(sys._getframe())
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profile.stop()
+            _active.reset(token)
+            self._busy = False
+            await to_thread.run_sync(profile.write, self.directory)
@@ -0,0 +1,244 @@
+"""Token-bucket rate limiting for abuse-prone routes.
+
+A limited route declares budgets per scope: the authenticated user
+(``user``), the trip (``trip``) or the client address (``ip``). A budget
+``"N/S"`` is a bucket of N tokens refilled at N per S seconds. Each request
+takes a token from every bucket it maps to and is answered 429 with
+``Retry-After`` as soon as one is empty.
+
+Only the ``ip`` bucket is charged before the handler runs, so it is all that
+anonymous or unauthenticated traffic can use up. The handler charges the
+``user`` and ``trip`` buckets once it has authenticated the caller (keyed on
+the user id, not the raw header) and checked their membership, so made-up
+tokens can neither dodge the per-user budget nor drain a trip's.
+
+Buckets live in a store. ``MemoryStore`` keeps them per process.
+``SQLStore`` keeps them in the ``rate_limit_buckets`` table, where a
+conditional UPDATE refills and takes a token in one atomic statement, so
+limits hold across workers on SQLite and Postgres alike. When the store
+fails, requests are let through and the error is logged: the limiter
+protects the database, it should not become a way to take it down.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from sqlalchemy import case, create_engine, delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+
+from app.core import metrics
+from app.core import config
+
+logger = logging.getLogger(__name__)
+
+_decisions = metrics.counter(
+    "rate_limit_decisions_total",
+    "Rate limit checks by route, scope and outcome.",
+    ("route", "scope", "decision"),
+)
+
+
+def parse_budget(budget: str) -> Optional[Tuple[float, float]]:
+    """``"N/S"`` to ``(burst, tokens per second)``; None when disabled."""
+    if not budget or not budget.strip():
+        return None
+    count, _, seconds = budget.partition("/")
+    burst, period = float(count), float(seconds or 1)
+    if burst <= 0 or period <= 0:
+        return None
+    return burst, burst / period
+
+
+class MemoryStore:
+    """Buckets in process memory; each worker enforces its own limits."""
+
+    blocking = False
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        # key -> (tokens, updated_at, full_at)
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}
+
+    def take(self, key: str, burst: float, rate: float, now: float) -> float:
+        """Take a token; returns 0 if granted, else seconds until one is available."""
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (burst, now, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            granted = tokens >= 1
+            if granted:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            if len(self._buckets) > self.max_keys:
+                # buckets that have refilled completely carry no state
+                self._buckets = {k: v for k, v in self._buckets.items() if v[2] > now}
+        return 0.0 if granted else (1 - tokens) / rate
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLStore:
+    """Buckets in the ``rate_limit_buckets`` table, shared by all workers."""
+
+    blocking = True
+
+    def __init__(self, engine, idle_after: float = 3600.0, sweep_every: int = 1000):
+        from app.models.rate_limit_bucket import RateLimitBucket
+
+        self.engine = engine
+        self.table = RateLimitBucket.__table__
+        # rows idle this long are full for any budget refilled within it
+        self.idle_after = idle_after
+        self.sweep_every = sweep_every
+        self._calls = 0
+
+    def take(self, key: str, burst: float, rate: float, now: float) -> float:
+        t = self.table
+        refilled = t.c.tokens + (now - t.c.updated_at) * rate
+        capped = case((refilled > burst, burst), else_=refilled)
+        with self.engine.begin() as conn:
+            wait = self._take(conn, key, burst, rate, now, capped)
+            self._calls += 1
+            if self._calls % self.sweep_every == 0:
+                conn.execute(delete(t).where(t.c.updated_at < now - self.idle_after))
+        return wait
+
+    def _take(self, conn, key, burst, rate, now, capped) -> float:
+        t = self.table
+        while True:
+            granted = conn.execute(
+                update(t).where(t.c.key == key, capped >= 1).values(tokens=capped - 1, updated_at=now)
+            ).rowcount
+            if granted:
+                return 0.0
+            row = conn.execute(select(t.c.tokens, t.c.updated_at).where(t.c.key == key)).first()
+            if row is not None:
+                tokens = min(burst, row.tokens + (now - row.updated_at) * rate)
+                return (1 - tokens) / rate
+            try:
+                with conn.begin_nested():
+                    conn.execute(insert(t).values(key=key, tokens=burst - 1, updated_at=now))
+                return 0.0
+            except IntegrityError:
+                # another worker created the bucket first; draw from its row
+                continue
+
+    def reset(self):
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.table))
+
+
+def _build_store():
+    if config.RATE_LIMIT_BACKEND == "sql":
+        if config.RATE_LIMIT_DATABASE_URL:
+            url = config.RATE_LIMIT_DATABASE_URL
+            connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+            return SQLStore(create_engine(url, connect_args=connect_args, pool_pre_ping=True))
+        from app.db.session import engine
+
+        return SQLStore(engine)
+    return MemoryStore()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The configured store, created on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = _build_store()
+    return _store
+
+
+SCOPES = ("ip", "user", "trip")
+
+
+def _check(store, route: str, buckets, now: float) -> Optional[float]:
+    for scope, value, (burst, rate) in buckets:
+        digest = hashlib.sha1(value.encode("utf-8")).hexdigest()[:20]
+        try:
+            wait = store.take(f"{route}:{scope}:{digest}", burst, rate, now)
+        except Exception:
+            logger.exception("rate limit store failed; letting %s through", route)
+            return None
+        if wait > 0:
+            _decisions.inc(route=route, scope=scope, decision="rejected")
+            return wait
+        _decisions.inc(route=route, scope=scope, decision="allowed")
+    return None
+
+
+class RateLimit:
+    """Budgets (scope -> ``"N/S"``) for one route.
+
+    Used as a dependency it charges the ``ip`` budget. Handlers call
+    ``charge``/``charge_sync`` with the verified ``user`` and ``trip`` once
+    the caller is authenticated; a scope passed as None is not charged.
+    Routes sharing a name share buckets, so e.g. both chat endpoints draw
+    from the same budget.
+    """
+
+    def __init__(self, route: str, **budgets: str):
+        for scope in budgets:
+            if scope not in SCOPES:
+                raise ValueError(f"unknown rate limit scope: {scope}")
+        parsed = {scope: parse_budget(budget) for scope, budget in budgets.items()}
+        self.route = route
+        self.budgets = {scope: limits for scope, limits in parsed.items() if limits}
+
+    def _buckets(self, values) -> List[tuple]:
+        return [
+            (scope, str(value), self.budgets[scope])
+            for scope, value in values.items()
+            if value is not None and scope in self.budgets
+        ]
+
+    @staticmethod
+    def _raise(wait: Optional[float]):
+        if wait is not None:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests, please retry later",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+
+    async def charge(self, **values):
+        """Take a token from each named scope's bucket; 429 if one is empty."""
+        if not config.RATE_LIMIT_ENABLED:
+            return
+        buckets = self._buckets(values)
+        if not buckets:
+            return
+        store = get_store()
+        if store.blocking:
+            wait = await run_in_threadpool(_check, store, self.route, buckets, time.time())
+        else:
+            wait = _check(store, self.route, buckets, time.time())
+        self._raise(wait)
+
+    def charge_sync(self, **values):
+        """``charge`` for sync handlers, which already run in the threadpool."""
+        if not config.RATE_LIMIT_ENABLED:
+            return
+        buckets = self._buckets(values)
+        if buckets:
+            self._raise(_check(get_store(), self.route, buckets, time.time()))
+
+    async def __call__(self, request: Request):
+        await self.charge(ip=request.client.host if request.client else None)
+
+
+def rate_limited(route: str, **budgets: str) -> RateLimit:
+    """``RateLimit`` for ``route``; see its docstring for when each scope is charged."""
+    return RateLimit(route, **budgets)
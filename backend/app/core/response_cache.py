@@ -0,0 +1,157 @@
+"""Memory-bounded cache of encoded responses, tagged with a data version.
+
+Entries are keyed by ``(route, scope id, params)`` and remember the version of
+the data they were built from. The caller reads the current version from the
+database, so a bump there invalidates the entry in every worker; the
+cache itself never has to be told about writes.
+
+When the stored entry is out of date, the new body is normally built inline.
+If the caller also supplies a ``refresh`` callable that is safe to run on
+another thread, the rebuild runs in a small pool instead. The request waits
+``stale_budget`` seconds for it and then serves the outdated body
+(stale-while-revalidate); the rebuild finishes in the background and
+replaces the entry. A failed refresh also falls back to the stale body.
+Callers that must see their own writes pass ``allow_stale=False`` and wait
+for the rebuild instead.
+``get`` reports the version of the body it returns, so a stale body is never
+passed off as the current one.
+
+Concurrent misses for the same key and version share one build.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Hashable, Optional, Tuple
+
+from app.core import metrics
+from app.core.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# rough per-entry bookkeeping cost on top of the body
+ENTRY_OVERHEAD = 200
+
+
+class ResponseCache:
+    def __init__(self, name: str, max_bytes: int, stale_budget: float, refresh_workers: int = 2):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.stale_budget = stale_budget
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[int, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._refreshing = {}
+        self._flight = SingleFlight(name)
+        self._executor = ThreadPoolExecutor(
+            max_workers=refresh_workers, thread_name_prefix=f"{name}-refresh"
+        )
+
+        self._hits = metrics.counter(f"{name}_cache_hits_total", "Responses served from cache.")
+        self._misses = metrics.counter(f"{name}_cache_misses_total", "Responses rebuilt.")
+        self._stale = metrics.counter(
+            f"{name}_cache_stale_total", "Stale responses served while a rebuild ran."
+        )
+        metrics.cache_hit_ratio(name, self._hits, self._misses)
+        metrics.gauge(f"{name}_cache_bytes", "Approximate bytes held by the cache.").set_function(
+            lambda: self._bytes
+        )
+        metrics.gauge(f"{name}_cache_entries", "Entries held by the cache.").set_function(
+            lambda: len(self._entries)
+        )
+
+    def get(
+        self,
+        key: Hashable,
+        version: int,
+        build: Callable[[], bytes],
+        refresh: Optional[Callable[[], bytes]] = None,
+        allow_stale: bool = True,
+    ) -> Tuple[int, bytes]:
+        """Return ``(version, body)`` for ``key`` at ``version``, building it if needed.
+
+        The version returned is the one the body was built at: older than
+        requested when a stale body is served, so callers deriving validators
+        such as ETags from it never label old data as current. With
+        ``allow_stale=False`` an outdated entry is always rebuilt inline.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None and entry[0] >= version:
+            self._hits.inc()
+            return entry
+
+        self._misses.inc()
+        if entry is None or refresh is None or self.stale_budget <= 0 or not allow_stale:
+            body = self._flight.do((key, version), lambda: self._build(key, version, build))
+            return version, body
+
+        future = self._refresh(key, version, refresh)
+        try:
+            return version, future.result(timeout=self.stale_budget)
+        except FutureTimeout:
+            self._stale.inc()
+            return entry
+        except Exception:
+            logger.exception("%s cache: refresh of %r failed; serving stale", self.name, key)
+            self._stale.inc()
+            return entry
+
+    def _build(self, key, version, build):
+        body = build()
+        self._store(key, version, body)
+        return body
+
+    def _refresh(self, key, version, refresh):
+        # one rebuild per key at a time; concurrent requests wait on the same one
+        with self._lock:
+            running = self._refreshing.get(key)
+            if running is not None and running[0] >= version:
+                return running[1]
+
+            def run():
+                try:
+                    body = refresh()
+                    self._store(key, version, body)
+                    return body
+                finally:
+                    # the lock is held until `future` below is assigned
+                    with self._lock:
+                        if self._refreshing.get(key, (None, None))[1] is future:
+                            del self._refreshing[key]
+
+            future = self._executor.submit(run)
+            self._refreshing[key] = (version, future)
+            return future
+
+    def _store(self, key, version: int, body: bytes):
+        size = len(body) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.get(key)
+            if old is not None:
+                if old[0] > version:
+                    return
+                self._bytes -= len(old[1]) + ENTRY_OVERHEAD
+            self._entries[key] = (version, body)
+            self._entries.move_to_end(key)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted) + ENTRY_OVERHEAD
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._refreshing.clear()
+            self._bytes = 0
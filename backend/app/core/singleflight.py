@@ -0,0 +1,116 @@
+"""Coalesce concurrent identical computations.
+
+While a computation for a key is in flight, further callers with the same key
+wait for it and receive its result (or its exception) instead of starting
+their own. ``SingleFlight`` is for threads (sync endpoints in the
+threadpool), ``AsyncSingleFlight`` for coroutines on the event loop. Nothing
+is cached: once the leader finishes, the next caller computes afresh.
+
+Both report ``singleflight_calls_total{group, role}``, where ``role`` is
+``leader`` for calls that did the work and ``coalesced`` for calls that
+shared it.
+"""
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from app.core import metrics
+
+T = TypeVar("T")
+
+_calls = metrics.counter(
+    "singleflight_calls_total", "Calls that ran or shared an in-flight computation.", ("group", "role")
+)
+_in_flight = metrics.gauge(
+    "singleflight_in_flight", "Distinct computations currently in flight.", ("group",)
+)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Thread-based coalescing for sync code."""
+
+    def __init__(self, group: str):
+        self.group = group
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            _calls.inc(group=self.group, role="coalesced")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        _calls.inc(group=self.group, role="leader")
+        _in_flight.inc(group=self.group)
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            _in_flight.dec(group=self.group)
+            call.done.set()
+
+
+class AsyncSingleFlight:
+    """Coalescing for coroutines running on one event loop."""
+
+    def __init__(self, group: str):
+        self.group = group
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        while True:
+            future = self._calls.get(key)
+            if future is None:
+                break
+            _calls.inc(group=self.group, role="coalesced")
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if future.cancelled() and not asyncio.current_task().cancelling():
+                    # the leader was cancelled (e.g. its client went away);
+                    # take over instead of failing this caller
+                    continue
+                raise
+
+        future = asyncio.get_running_loop().create_future()
+        # followers may all be gone; don't log an unretrieved exception
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._calls[key] = future
+        _calls.inc(group=self.group, role="leader")
+        _in_flight.inc(group=self.group)
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+            _in_flight.dec(group=self.group)
@@ -0,0 +1,389 @@
+"""Lightweight request tracing with OTLP/JSON export.
+
+Each sampled request gets a root span; nested ``span()`` blocks, SQL
+statements (via engine events) and outbound ``httpx`` calls made through
+``AsyncTracingTransport`` become its children. Spans follow the request
+through a context variable, so threadpool workers and the asyncio engine are
+covered too.
+
+Sampling is decided once per trace: an incoming W3C ``traceparent`` header is
+honoured when the client is in ``TRACE_TRUSTED_PARENTS`` (typically the
+gateway or another service of ours), otherwise ``TRACE_SAMPLE_RATE`` of
+requests are sampled. Spans carry SQL text, so untrusted clients must not be
+able to force traces. For an unsampled request every hook costs a single
+context variable lookup.
+
+Finished traces are encoded as OTLP/JSON ``resourceSpans`` and handed to a
+background thread that appends them to ``TRACE_FILE`` (``TRACE_EXPORTER=file``)
+or POSTs them to ``OTLP_ENDPOINT`` (``TRACE_EXPORTER=otlp``). Without an
+exporter nothing is traced.
+"""
+import ipaddress
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.config import (
+    TRACE_SAMPLE_RATE,
+    TRACE_TRUSTED_PARENTS,
+    TRACE_EXPORTER,
+    TRACE_FILE,
+    OTLP_ENDPOINT,
+    TRACE_SERVICE_NAME,
+)
+from app.core.http_metrics import route_template
+
+logger = logging.getLogger(__name__)
+
+# OTLP span kinds and status codes
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+STATUS_OK, STATUS_ERROR = 1, 2
+
+
+class Span:
+    __slots__ = (
+        "trace", "span_id", "parent_id", "name", "kind", "start", "end",
+        "attributes", "status",
+    )
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], kind: int, attributes: dict):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.time_ns()
+        self.end = None
+        self.attributes = attributes
+        self.status = STATUS_OK
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_error(self, exc: BaseException = None):
+        self.status = STATUS_ERROR
+        if exc is not None:
+            self.attributes["exception.type"] = type(exc).__name__
+
+    def child(self, name: str, kind: int = KIND_INTERNAL, **attributes) -> "Span":
+        span = Span(self.trace, name, self.span_id, kind, attributes)
+        self.trace.spans.append(span)
+        return span
+
+    def finish(self):
+        self.end = time.time_ns()
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace.trace_id}-{self.span_id}-01"
+
+
+class Trace:
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.spans: List[Span] = []
+
+    def root(self, name: str, parent_id: Optional[str] = None, kind: int = KIND_SERVER, **attributes) -> Span:
+        span = Span(self, name, parent_id, kind, attributes)
+        self.spans.append(span)
+        return span
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, kind: int = KIND_INTERNAL, **attributes):
+    """Time a block as a child of the current span; no-op when not sampled."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = parent.child(name, kind, **attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as exc:
+        child.set_error(exc)
+        raise
+    finally:
+        _current.reset(token)
+        child.finish()
+
+
+def parse_traceparent(value: str):
+    """Return ``(trace_id, parent_span_id, sampled)`` or None if malformed."""
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+class TrustedSources:
+    """Client addresses whose ``traceparent`` sampling decision is honoured."""
+
+    def __init__(self, spec: str):
+        items = [item.strip() for item in spec.split(",") if item.strip()]
+        self.any = "*" in items
+        self.networks = [ipaddress.ip_network(item, strict=False) for item in items if item != "*"]
+
+    def __contains__(self, host: Optional[str]) -> bool:
+        if self.any:
+            return True
+        if not host or not self.networks:
+            return False
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            return False
+        return any(address in network for network in self.networks)
+
+
+trusted_parents = TrustedSources(TRACE_TRUSTED_PARENTS)
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def encode_otlp(trace: Trace, service_name: str = TRACE_SERVICE_NAME) -> dict:
+    """Encode one trace as an OTLP/JSON ``ExportTraceServiceRequest``."""
+    spans = []
+    for s in trace.spans:
+        encoded = {
+            "traceId": trace.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": s.kind,
+            "startTimeUnixNano": str(s.start),
+            "endTimeUnixNano": str(s.end or s.start),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+            "status": {"code": s.status},
+        }
+        if s.parent_id:
+            encoded["parentSpanId"] = s.parent_id
+        spans.append(encoded)
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]
+                },
+                "scopeSpans": [{"scope": {"name": "tip-trip"}, "spans": spans}],
+            }
+        ]
+    }
+
+
+class FileExporter:
+    """Append one OTLP/JSON document per trace to a file."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, payload: dict):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(payload, separators=(",", ":")) + "\n")
+
+
+class OTLPHTTPExporter:
+    """POST OTLP/JSON documents to a collector's ``/v1/traces`` endpoint."""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self._client = httpx.Client(timeout=timeout)
+
+    def export(self, payload: dict):
+        self._client.post(self.endpoint, json=payload).raise_for_status()
+
+
+class BatchProcessor:
+    """Export finished traces on a background thread, dropping when backed up."""
+
+    def __init__(self, exporter, max_queue: int = 2048):
+        self.exporter = exporter
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def submit(self, trace: Trace):
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            logger.warning("trace export queue full; dropping trace %s", trace.trace_id)
+
+    def _run(self):
+        while True:
+            trace = self._queue.get()
+            if trace is None:
+                return
+            try:
+                self.exporter.export(encode_otlp(trace))
+            except Exception:
+                logger.exception("trace export failed")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        self._queue.join()
+
+
+def _build_processor():
+    if TRACE_EXPORTER == "otlp":
+        return BatchProcessor(OTLPHTTPExporter(OTLP_ENDPOINT))
+    if TRACE_EXPORTER == "file":
+        return BatchProcessor(FileExporter(TRACE_FILE))
+    return None
+
+
+_processor = None
+_processor_lock = threading.Lock()
+
+
+def get_processor():
+    """The configured processor, started on first use."""
+    global _processor
+    if _processor is None and TRACE_EXPORTER:
+        with _processor_lock:
+            if _processor is None:
+                _processor = _build_processor()
+    return _processor
+
+
+class TracingMiddleware:
+    """Open a root span per sampled request and export the trace when done."""
+
+    def __init__(self, app, sample_rate: float = TRACE_SAMPLE_RATE, processor=None, trusted=None):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.processor = processor
+        self.trusted = trusted
+
+    def _start(self, scope) -> Optional[Span]:
+        parent = None
+        client = scope.get("client")
+        if (client[0] if client else None) in (self.trusted or trusted_parents):
+            for name, value in scope.get("headers", []):
+                if name == b"traceparent":
+                    parent = parse_traceparent(value.decode("latin-1"))
+                    break
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id = parent_id = None
+            sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled:
+            return None
+        return Trace(trace_id).root(
+            scope["method"], parent_id, KIND_SERVER,
+            **{"http.method": scope["method"], "http.target": scope["path"]},
+        )
+
+    async def __call__(self, scope, receive, send):
+        processor = self.processor or get_processor()
+        root = self._start(scope) if scope["type"] == "http" and processor is not None else None
+        if root is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    root.status = STATUS_ERROR
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"traceparent", root.traceparent.encode("latin-1"))
+                ]
+            await send(message)
+
+        token = _current.set(root)
+        try:
+            await self.app(scope, receive, send_with_trace)
+        except BaseException as exc:
+            root.set_error(exc)
+            raise
+        finally:
+            _current.reset(token)
+            route = route_template(scope)
+            root.name = f"{scope['method']} {route}"
+            root.set_attribute("http.route", route)
+            root.finish()
+            processor.submit(root.trace)
+
+
+class AsyncTracingTransport(httpx.AsyncHTTPTransport):
+    """httpx transport that records a client span and propagates traceparent."""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        with span(
+            f"HTTP {request.method}",
+            KIND_CLIENT,
+            **{"http.method": request.method, "http.url": str(request.url.copy_with(query=None))},
+        ) as s:
+            if s is None:
+                return await super().handle_async_request(request)
+            request.headers["traceparent"] = s.traceparent
+            response = await super().handle_async_request(request)
+            s.set_attribute("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                s.status = STATUS_ERROR
+            return response
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    parent = _current.get()
+    if parent is None:
+        return
+    child = parent.child(
+        statement.split(None, 1)[0].upper() if statement else "SQL",
+        KIND_CLIENT,
+        **{"db.system": conn.dialect.name, "db.statement": statement},
+    )
+    conn.info.setdefault("trace_spans", []).append(child)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is None:
+        return
+    spans = conn.info.get("trace_spans")
+    if spans:
+        spans.pop().finish()
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    spans = context.connection.info.get("trace_spans") if context.connection is not None else None
+    if spans:
+        failed = spans.pop()
+        failed.set_error(context.original_exception)
+        failed.finish()
@@ -0,0 +1,74 @@
+"""Connection pool configuration and instrumentation.
+
+Pools are sized from the DB_POOL_* settings and report, per pool, how long
+checkouts waited for a free connection plus gauges for connections in use,
+idle connections and overflow. Values are exported on ``/metrics``.
+"""
+import time
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.core import metrics
+from app.core.config import (
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+)
+
+_checkout_wait = metrics.histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting to check a connection out of the pool.",
+    ("pool",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+_in_use = metrics.gauge("db_pool_in_use", "Connections checked out of the pool.", ("pool",))
+_idle = metrics.gauge("db_pool_idle", "Idle connections held by the pool.", ("pool",))
+_overflow = metrics.gauge("db_pool_overflow", "Connections open beyond pool_size.", ("pool",))
+_size = metrics.gauge("db_pool_size", "Configured pool size.", ("pool",))
+
+
+class _CheckoutTimingMixin:
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            _checkout_wait.observe(
+                time.perf_counter() - started, pool=self.logging_name or "default"
+            )
+
+
+class InstrumentedQueuePool(_CheckoutTimingMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_CheckoutTimingMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options(url: str, name: str, is_async: bool = False) -> dict:
+    """Keyword arguments for ``create_engine``/``create_async_engine``."""
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_logging_name": name}
+    if ":memory:" in url:
+        # in-memory SQLite keeps a single connection per thread; nothing to size
+        return options
+    options.update(
+        poolclass=InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    return options
+
+
+def instrument_engine(engine, name: str):
+    """Register pool gauges; ``engine.pool`` is read lazily as dispose() replaces it."""
+    if not isinstance(engine.pool, QueuePool):
+        return
+    _in_use.set_function(lambda: engine.pool.checkedout(), pool=name)
+    _idle.set_function(lambda: engine.pool.checkedin(), pool=name)
+    _overflow.set_function(lambda: max(0, engine.pool.overflow()), pool=name)
+    _size.set_function(lambda: engine.pool.size(), pool=name)
@@ -0,0 +1,133 @@
+"""Per-request SQL statement accounting and N+1 detection.
+
+``QueryStatsMiddleware`` opens a ``QueryStats`` for every HTTP request and
+keeps it in a context variable, which follows the request into threadpool
+workers and the asyncio engine. Engine-wide cursor events add each statement's
+count and duration to the active stats. The totals are reported in the
+``Server-Timing`` header. A warning is logged when one statement shape repeats
+more than ``SQL_REPEAT_WARN_THRESHOLD`` times, the usual signature of a query
+issued inside a loop.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core import metrics
+from app.core.http_metrics import route_template
+from app.core.config import SQL_REPEAT_WARN_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+_repeated = metrics.counter(
+    "db_repeated_statement_requests_total",
+    "Requests that repeated one statement shape past the N+1 threshold.",
+    ("method", "route"),
+)
+
+_NUMBER = re.compile(r"\b\d+\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """Normalize a statement so repeats differing only in values compare equal."""
+    shape = _NUMBER.sub("?", statement)
+    shape = _IN_LIST.sub("(?)", shape)
+    return _SPACE.sub(" ", shape).strip()
+
+
+class QueryStats:
+    """Statements and DB time accumulated while serving one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold: int = SQL_REPEAT_WARN_THRESHOLD):
+        """Statement shapes that ran more than ``threshold`` times, most frequent first."""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n > threshold]
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.seconds * 1000:.2f};desc="{self.count} statements"'
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _current.get()
+
+
+@contextmanager
+def track_queries():
+    """Collect statements run in this context (and contexts copied from it)."""
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_stats_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = conn.info.get("query_stats_started")
+    if stats is None or not started:
+        return
+    stats.record(statement, time.perf_counter() - started.pop())
+
+
+class QueryStatsMiddleware:
+    """Report per-request SQL counts in ``Server-Timing`` and flag N+1 patterns."""
+
+    def __init__(self, app, repeat_threshold: int = SQL_REPEAT_WARN_THRESHOLD):
+        self.app = app
+        self.repeat_threshold = repeat_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries() as stats:
+
+            async def send_with_timing(message):
+                if message["type"] == "http.response.start":
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", stats.server_timing().encode("latin-1"))
+                    ]
+                    self._check_repeats(scope, stats)
+                await send(message)
+
+            await self.app(scope, receive, send_with_timing)
+
+    def _check_repeats(self, scope, stats: QueryStats):
+        repeated = stats.repeated(self.repeat_threshold)
+        if not repeated:
+            return
+        _repeated.inc(method=scope["method"], route=route_template(scope))
+        for shape, n in repeated:
+            logger.warning(
+                "possible N+1: %s %s ran the same statement %d times: %s",
+                scope["method"], scope["path"], n, shape,
+            )
@@ -0,0 +1,197 @@
+"""Read-replica routing for safe GET handlers.
+
+``get_read_db`` / ``get_async_read_db`` hand out sessions on the replica
+configured by ``DATABASE_READ_URL``, or on the primary when none is
+configured. Replicas lag behind the primary, so a user who just wrote is
+pinned to the primary for ``READ_YOUR_WRITES_SECONDS``: the
+``ReadYourWritesMiddleware`` records every unsafe request both in process
+memory (keyed by ``X-User-Hash``) and in a short-lived cookie, which keeps the
+pin effective when the next read lands on a different worker.
+
+A read routed to the primary reuses the request's ``get_db`` session (the one
+authentication already queried), so a request holds at most one primary
+connection however many of these dependencies it takes.
+
+The pin is recorded even without a replica: response caches may serve an
+outdated body while they rebuild, and a pinned read must not. For safe
+requests the middleware sets ``primary_pinned``, which such caches consult.
+"""
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi import Cookie, Depends, Header
+from starlette.requests import cookie_parser
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.core import metrics
+from app.core.config import (
+    DATABASE_READ_URL,
+    ASYNC_DATABASE_READ_URL,
+    READ_YOUR_WRITES_SECONDS,
+)
+from app.db.pool import engine_options, instrument_engine
+from app.db.session import SessionLocal, AsyncSessionLocal, batch_session, get_db, get_async_db
+
+PIN_COOKIE = "tt_primary_until"
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# set per safe request: the caller wrote recently and must see that write
+primary_pinned: ContextVar[bool] = ContextVar("primary_pinned", default=False)
+
+_routed = metrics.counter(
+    "db_read_sessions_total", "Read sessions handed out, by target.", ("target",)
+)
+
+
+class ReadRouter:
+    """Chooses between the replica and the primary for one read."""
+
+    def __init__(self, primary, replica=None, window: float = READ_YOUR_WRITES_SECONDS):
+        self.primary = primary
+        self.replica = replica
+        self.window = window
+        self._lock = threading.Lock()
+        self._pinned = {}
+
+    @property
+    def replica_enabled(self) -> bool:
+        return self.replica is not None
+
+    def pin(self, user_key: Optional[str], now: float = None) -> float:
+        """Pin ``user_key`` to the primary; returns the wall-clock expiry."""
+        now = now if now is not None else time.time()
+        until = now + self.window
+        if user_key:
+            with self._lock:
+                self._pinned[user_key] = until
+                if len(self._pinned) > 10000:
+                    self._pinned = {k: v for k, v in self._pinned.items() if v > now}
+        return until
+
+    def is_pinned(self, user_key: Optional[str], cookie: Optional[str] = None, now: float = None) -> bool:
+        now = now if now is not None else time.time()
+        if cookie:
+            try:
+                if float(cookie) > now:
+                    return True
+            except ValueError:
+                pass
+        if user_key:
+            return self._pinned.get(user_key, 0) > now
+        return False
+
+    def session_factory(self, user_key: Optional[str] = None, cookie: Optional[str] = None):
+        if not self.replica_enabled or self.is_pinned(user_key, cookie):
+            _routed.inc(target="primary")
+            return self.primary
+        _routed.inc(target="replica")
+        return self.replica
+
+
+read_engine = None
+async_read_engine = None
+ReadSessionLocal = None
+AsyncReadSessionLocal = None
+
+if DATABASE_READ_URL:
+    connect_args = {"check_same_thread": False} if DATABASE_READ_URL.startswith("sqlite") else {}
+    read_engine = create_engine(
+        DATABASE_READ_URL,
+        connect_args=connect_args,
+        **engine_options(DATABASE_READ_URL, "replica"),
+    )
+    instrument_engine(read_engine, "replica")
+    ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+    async_read_engine = create_async_engine(
+        ASYNC_DATABASE_READ_URL,
+        **engine_options(ASYNC_DATABASE_READ_URL, "replica_async", is_async=True),
+    )
+    instrument_engine(async_read_engine.sync_engine, "replica_async")
+    AsyncReadSessionLocal = async_sessionmaker(
+        async_read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+    )
+
+read_router = ReadRouter(SessionLocal, ReadSessionLocal)
+async_read_router = ReadRouter(AsyncSessionLocal, AsyncReadSessionLocal)
+
+
+def get_read_db(
+    x_user_hash: Optional[str] = Header(None),
+    tt_primary_until: Optional[str] = Cookie(None),
+    primary: Session = Depends(get_db),
+):
+    """Session for read-only handlers: the replica unless the caller just wrote."""
+    if batch_session.get() is not None:
+        # reads inside a transactional batch must see its uncommitted writes
+        yield primary
+        return
+    factory = read_router.session_factory(x_user_hash, tt_primary_until)
+    if factory is read_router.primary:
+        yield primary
+        return
+    db = factory()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db(
+    x_user_hash: Optional[str] = Header(None),
+    tt_primary_until: Optional[str] = Cookie(None),
+    primary: AsyncSession = Depends(get_async_db),
+):
+    factory = async_read_router.session_factory(x_user_hash, tt_primary_until)
+    if factory is async_read_router.primary:
+        yield primary
+        return
+    async with factory() as db:
+        yield db
+
+
+class ReadYourWritesMiddleware:
+    """Pin callers of unsafe methods to the primary for a short window."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        user_key = cookie = None
+        for name, value in scope.get("headers", []):
+            if name == b"x-user-hash":
+                user_key = value.decode("latin-1")
+            elif name == b"cookie":
+                cookie = cookie_parser(value.decode("latin-1")).get(PIN_COOKIE)
+
+        if scope["method"] in SAFE_METHODS:
+            token = primary_pinned.set(read_router.is_pinned(user_key, cookie))
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                primary_pinned.reset(token)
+            return
+
+        async def send_with_pin(message):
+            if message["type"] == "http.response.start":
+                until = read_router.pin(user_key)
+                async_read_router.pin(user_key)
+                cookie = (
+                    f"{PIN_COOKIE}={until:.3f}; Max-Age={int(read_router.window) + 1}; "
+                    "Path=/; HttpOnly; SameSite=Lax"
+                )
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"set-cookie", cookie.encode("latin-1"))
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_pin)
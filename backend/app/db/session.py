@@ -1,7 +1,13 @@
+# db package
+from contextvars import ContextVar
+from typing import Optional
+
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 
-from app.core.config import DATABASE_URL
+from app.core.config import DATABASE_URL, ASYNC_DATABASE_URL
+from app.db.pool import engine_options, instrument_engine
 
 DATABASE_URL = DATABASE_URL
 
@@ -9,14 +15,41 @@ connect_args = {}
 if DATABASE_URL.startswith("sqlite"):
     connect_args = {"check_same_thread": False}
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
+engine = create_engine(
+    DATABASE_URL, connect_args=connect_args, **engine_options(DATABASE_URL, "primary")
+)
+instrument_engine(engine, "primary")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# asyncio engine for `async def` endpoints, so their queries don't block the
+# event loop or take a threadpool slot
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL, "primary_async", is_async=True)
+)
+instrument_engine(async_engine.sync_engine, "primary_async")
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+
+# set while a transactional batch runs (see app.routers.batch): every sync
+# handler in the batch shares this session, whose commits are savepoints
+batch_session: ContextVar[Optional[Session]] = ContextVar("batch_session", default=None)
+
 
 def get_db():
+    shared = batch_session.get()
+    if shared is not None:
+        yield shared
+        return
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,17 @@
+"""Per-trip data version.
+
+Every handler that changes a trip's data (the trip row, its dates and
+availability, its members or its expenses) calls ``bump_trip_version`` before
+committing, so the increment lands in the same transaction as the change.
+Anything cached per ``(trip.id, trip.version)`` is therefore invalidated for
+every worker as soon as the write commits.
+"""
+from sqlalchemy.orm import Session
+
+from app.models.trip import Trip
+
+
+def bump_trip_version(db: Session, trip_id: int):
+    db.query(Trip).filter(Trip.id == trip_id).update(
+        {Trip.version: Trip.version + 1}, synchronize_session="evaluate"
+    )
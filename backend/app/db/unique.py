@@ -0,0 +1,46 @@
+"""Insert rows carrying random unique identifiers without checking first.
+
+Trip hashes and user ids/tokens are random, with enough bits that a clash
+is rare. Rather than querying for every candidate before inserting it, the
+unit of work is committed as is and the unique constraint decides: on an
+``IntegrityError`` the transaction is rolled back and the unit rebuilt with
+fresh identifiers. Creation is then a single write in the common case.
+
+Inside a transactional batch the session runs in a savepoint, so the
+rollback only discards this attempt, not the batch.
+"""
+from typing import Callable, TypeVar
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core import metrics
+
+T = TypeVar("T")
+
+ATTEMPTS = 5
+
+_retries = metrics.counter(
+    "unique_insert_retries_total",
+    "Inserts retried with fresh identifiers after a unique violation.",
+    ("table",),
+)
+
+
+def insert_unique(db: Session, table: str, build: Callable[[], T], attempts: int = ATTEMPTS) -> T:
+    """Add the rows ``build()`` creates and commit, rebuilding on a conflict.
+
+    ``build`` must draw new identifiers on every call. The last
+    ``IntegrityError`` is re-raised once ``attempts`` are used up, which also
+    covers violations retrying can't fix.
+    """
+    for attempt in range(attempts):
+        try:
+            obj = build()
+            db.commit()
+            return obj
+        except IntegrityError:
+            db.rollback()
+            if attempt == attempts - 1:
+                raise
+            _retries.inc(table=table)
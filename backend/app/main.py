@@ -1,9 +1,21 @@
 import os
-from fastapi import FastAPI
+from anyio import to_thread
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.core.config import ALLOW_ORIGINS
+from app.core import metrics as app_metrics
+from app.core.encoding import CompressionMiddleware, MessagePackMiddleware
+from app.core.http_metrics import HTTPMetricsMiddleware
+from app.core.profiling import ProfilingMiddleware, instrument_sync_endpoints
+from app.core.tracing import TracingMiddleware
+from app.core.config import ALLOW_ORIGINS, THREADPOOL_SIZE
+from app.core.metrics import REGISTRY, PROMETHEUS_CONTENT_TYPE
+from app.db.query_stats import QueryStatsMiddleware
+from app.db.replica import ReadYourWritesMiddleware
 from app.routers import api_router
+from app.services import ollama
+from app.services.chat_jobs import chat_jobs
+from app.services.known_ids import trip_hashes, user_tokens, load_known_ids
 
 
 app = FastAPI(title="Tip-Trip Backend (scaffold)")
@@ -16,12 +28,65 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# msgpack conversion runs inside compression, so packed bodies are compressed too
+app.add_middleware(MessagePackMiddleware)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(TracingMiddleware)
+# outermost, so its latency covers every other middleware
+app.add_middleware(HTTPMetricsMiddleware)
 
 
 app.include_router(api_router, prefix="/api/v1")
+instrument_sync_endpoints(app)
+
+
+@app.on_event("startup")
+async def size_threadpool():
+    # `def` endpoints each hold one pooled connection; matching the threadpool
+    # to pool_size + max_overflow keeps threads from stalling on the pool
+    limiter = to_thread.current_default_thread_limiter()
+    limiter.total_tokens = THREADPOOL_SIZE
+    app_metrics.gauge(
+        "threadpool_tokens_in_use", "Worker threads busy running sync endpoints."
+    ).set_function(lambda: limiter.borrowed_tokens)
+    app_metrics.gauge(
+        "threadpool_tokens_total", "Size of the sync endpoint threadpool."
+    ).set_function(lambda: limiter.total_tokens)
+
+
+@app.on_event("startup")
+async def build_known_ids():
+    # full scans of trip hashes and user tokens; keep them off the event loop
+    await to_thread.run_sync(load_known_ids)
+
+
+@app.on_event("startup")
+async def start_background_workers():
+    await chat_jobs.start()
+    await ollama.start_health_probe()
+
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    await ollama.stop_health_probe()
+    await chat_jobs.stop()
 
 
 @app.get("/health")
 def health():
-    """Basic healthcheck endpoint."""
-    return {"status": "ok"}
+    """Basic healthcheck endpoint; also reports the chat backend circuit state
+    and the identifier filters."""
+    return {
+        "status": "ok",
+        "chat_backend": ollama.chat_breaker.snapshot(),
+        "known_ids": {f.name: f.stats() for f in (trip_hashes, user_tokens)},
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Expose in-process metrics in the Prometheus text format."""
+    return Response(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
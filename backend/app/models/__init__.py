@@ -3,5 +3,6 @@ from .trip import Trip
 from .user_trip import UserTrip
 from .trip_date import TripDate
 from .user_availability import UserAvailability
+from .rate_limit_bucket import RateLimitBucket
 
-__all__ = ["User", "Trip", "UserTrip", "TripDate", "UserAvailability"]
+__all__ = ["User", "Trip", "UserTrip", "TripDate", "UserAvailability", "RateLimitBucket"]
@@ -1,14 +1,16 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Boolean, DateTime, Index
 from sqlalchemy.sql import func
 from app.db.session import Base
 
 
 class Expense(Base):
     __tablename__ = "expenses"
+    # ledgers are listed per trip newest first
+    __table_args__ = (Index("ix_expenses_trip_id_created_at", "trip_id", "created_at"),)
 
     id = Column(Integer, primary_key=True, index=True)
     trip_id = Column(
-        Integer, ForeignKey("trips.id", ondelete="CASCADE"), nullable=False, index=True
+        Integer, ForeignKey("trips.id", ondelete="CASCADE"), nullable=False
     )
     payer_user_id = Column(
         Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
@@ -32,7 +34,7 @@ class ExpenseShare(Base):
         index=True,
     )
     user_id = Column(
-        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True
     )
     share_type = Column(
         String(20), nullable=False, default="equal"
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Float, String
+
+from app.db.session import Base
+
+
+class RateLimitBucket(Base):
+    """Token bucket shared by all workers; see app.core.rate_limit.SQLStore."""
+
+    __tablename__ = "rate_limit_buckets"
+
+    # "<route>:<scope>:<digest of the scope value>"
+    key = Column(String(128), primary_key=True)
+    tokens = Column(Float, nullable=False)
+    # unix time of the last refill
+    updated_at = Column(Float, nullable=False, index=True)
@@ -14,3 +14,6 @@ class Trip(Base):
     date_end = Column(Date, nullable=True)
     # store allowed weekdays as array of ints 0..6 (Sunday..Saturday)
     allowed_weekdays = Column(ARRAY(Integer), nullable=True)
+    # bumped by every write to the trip or its dates, availability, members
+    # or expenses; see app.db.trip_version
+    version = Column(Integer, nullable=False, default=1, server_default="1")
@@ -1,11 +1,13 @@
 from datetime import date
-from sqlalchemy import Column, Integer, Date, ForeignKey
+from sqlalchemy import Column, Integer, Date, ForeignKey, UniqueConstraint
 
 from app.db.session import Base
 
 
 class TripDate(Base):
     __tablename__ = "trip_dates"
+    # (trip_id, date) also serves every trip_id lookup
+    __table_args__ = (UniqueConstraint("trip_id", "date", name="uq_trip_date"),)
 
     id = Column(Integer, primary_key=True, index=True)
     trip_id = Column(Integer, ForeignKey("trips.id", ondelete="CASCADE"), nullable=False)
@@ -1,11 +1,12 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint
 
 from app.db.session import Base
 
 
 class UserAvailability(Base):
     __tablename__ = "user_availability"
+    __table_args__ = (UniqueConstraint("trip_date_id", "user_id", name="uq_tripdate_user"),)
 
     id = Column(Integer, primary_key=True, index=True)
     trip_date_id = Column(Integer, ForeignKey("trip_dates.id", ondelete="CASCADE"), nullable=False)
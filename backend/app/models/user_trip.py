@@ -10,7 +10,8 @@ class UserTrip(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    trip_id = Column(Integer, ForeignKey("trips.id", ondelete="CASCADE"), nullable=False)
+    # uq_user_trip leads with user_id, so trip_id needs its own index
+    trip_id = Column(Integer, ForeignKey("trips.id", ondelete="CASCADE"), nullable=False, index=True)
     user_name = Column(String(128), nullable=False)
 
     # optional relationships for convenience
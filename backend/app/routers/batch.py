@@ -0,0 +1,202 @@
+"""Run several API requests in one round trip.
+
+Items are dispatched in order through the application's own router, in
+process. They skip the HTTP middleware, which already wraps the batch request
+itself, but go through routing, validation, dependencies and exception
+handlers exactly like standalone requests. The caller is authenticated once
+for the whole batch.
+
+With ``transaction`` set, every sync handler in the batch shares one session
+on a single connection and their commits become savepoints. The batch commits
+at the end, or rolls back at the first item that fails and skips the rest.
+Handlers on the asyncio engine keep their own connection and only see
+committed data.
+
+Items after a write, and every item of a transactional batch, run as reads
+pinned to the primary (``primary_pinned``), so the response cache never
+answers them with a body from before the batch's own writes.
+"""
+import json
+import logging
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.middleware.asyncexitstack import AsyncExitStackMiddleware
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.exceptions import ExceptionMiddleware
+from sqlalchemy.orm import Session
+
+from app.core.config import BATCH_MAX_REQUESTS
+from app.db.session import get_db, batch_session
+from app.db.replica import PIN_COOKIE, SAFE_METHODS, primary_pinned, read_router, async_read_router
+from app.models.user import User
+from app.routers.user_trips import get_authenticated_user, batch_user
+from app.schemas.batch import BatchItem, BatchRequest, BatchItemResult, BatchResponse
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# set by the batch itself; items can't override them
+_RESERVED_HEADERS = {"x-user-hash", "content-type", "content-length", "host", "cookie"}
+# copied from the batch request into every item's scope
+_SCOPE_KEYS = ("type", "asgi", "http_version", "scheme", "server", "client", "root_path", "app")
+
+
+def _item_app(app):
+    """The app's router wrapped like FastAPI does it, minus user middleware."""
+    handlers = {k: v for k, v in app.exception_handlers.items() if k not in (500, Exception)}
+    return ExceptionMiddleware(AsyncExitStackMiddleware(app.router), handlers=handlers)
+
+
+def _decode(body: bytes, content_type: str):
+    if not body:
+        return None
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    return body.decode("utf-8", errors="replace")
+
+
+async def _dispatch(item_app, request: Request, item: BatchItem, prefix: str) -> BatchItemResult:
+    path, _, query = item.path.partition("?")
+    if not path.startswith(prefix + "/") or path == request.url.path:
+        return BatchItemResult(status=400, body={"detail": f"Path cannot be batched: {item.path}"})
+
+    body = b"" if item.body is None else json.dumps(item.body).encode("utf-8")
+    try:
+        headers = [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in item.headers.items()
+            if name.lower() not in _RESERVED_HEADERS
+        ]
+    except UnicodeEncodeError:
+        return BatchItemResult(status=400, body={"detail": "Header names and values must be latin-1"})
+    headers += [
+        (b"x-user-hash", request.headers["x-user-hash"].encode("latin-1")),
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode("latin-1")),
+    ]
+    scope = {key: request.scope[key] for key in _SCOPE_KEYS if key in request.scope}
+    scope.update(
+        method=item.method,
+        path=path,
+        raw_path=path.encode("utf-8"),
+        query_string=query.encode("latin-1"),
+        headers=headers,
+    )
+
+    received = False
+
+    async def receive():
+        nonlocal received
+        if received:
+            return {"type": "http.disconnect"}
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    status, content_type, chunks = 500, "", []
+
+    async def send(message):
+        nonlocal status, content_type
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            for name, value in message.get("headers", []):
+                if name == b"content-type":
+                    content_type = value.decode("latin-1")
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await item_app(scope, receive, send)
+    except Exception:
+        logger.exception("batch item %s %s failed", item.method, path)
+        return BatchItemResult(status=500, body={"detail": "Internal Server Error"})
+    return BatchItemResult(status=status, body=_decode(b"".join(chunks), content_type))
+
+
+async def _run_in_transaction(db: Session, item_app, request, items: List[BatchItem], prefix: str):
+    def begin():
+        connection = db.get_bind().connect()
+        transaction = connection.begin()
+        if connection.dialect.name == "sqlite":
+            # pysqlite defers BEGIN to the first write, so releasing the first
+            # savepoint would commit on its own; open the transaction now
+            connection.exec_driver_sql("BEGIN")
+        return connection, transaction
+
+    connection, transaction = await run_in_threadpool(begin)
+    session = Session(bind=connection, join_transaction_mode="create_savepoint", autoflush=False)
+    token = batch_session.set(session)
+    responses = []
+    committed = False
+    try:
+        for item in items:
+            result = await _dispatch(item_app, request, item, prefix)
+            responses.append(result)
+            if result.status >= 400:
+                break
+        committed = len(responses) == len(items) and responses[-1].status < 400
+    finally:
+        batch_session.reset(token)
+
+        def finish():
+            try:
+                if committed:
+                    transaction.commit()
+                else:
+                    transaction.rollback()
+            finally:
+                session.close()
+                connection.close()
+
+        await run_in_threadpool(finish)
+
+    skipped = BatchItemResult(
+        status=424, body={"detail": "Not executed: an earlier request in the transaction failed"}
+    )
+    return responses + [skipped] * (len(items) - len(responses)), committed
+
+
+@router.post("/batch", response_model=BatchResponse)
+async def run_batch(
+    payload: BatchRequest,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_authenticated_user),
+):
+    """Execute ``requests`` in order and return the status and body of each.
+
+    Requires X-User-Hash header; every item runs as that user.
+    """
+    if len(payload.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {BATCH_MAX_REQUESTS} requests per batch"
+        )
+
+    user_key = request.headers["x-user-hash"]
+    if any(item.method not in SAFE_METHODS for item in payload.requests):
+        # reads later in the batch must not go to a lagging replica
+        read_router.pin(user_key)
+        async_read_router.pin(user_key)
+
+    item_app = _item_app(request.app)
+    prefix = request.scope["route"].path.rsplit("/", 1)[0]
+    token = batch_user.set(current_user)
+    pinned = primary_pinned.set(
+        payload.transaction or read_router.is_pinned(user_key, request.cookies.get(PIN_COOKIE))
+    )
+    try:
+        if payload.transaction:
+            responses, committed = await _run_in_transaction(
+                db, item_app, request, payload.requests, prefix
+            )
+            return BatchResponse(responses=responses, committed=committed)
+        responses = []
+        for item in payload.requests:
+            if item.method not in SAFE_METHODS:
+                primary_pinned.set(True)
+            responses.append(await _dispatch(item_app, request, item, prefix))
+        return BatchResponse(responses=responses)
+    finally:
+        primary_pinned.reset(pinned)
+        batch_user.reset(token)
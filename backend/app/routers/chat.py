@@ -1,94 +1,121 @@
-from fastapi import APIRouter, Depends, HTTPException, Header
-from sqlalchemy.orm import Session
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
 import httpx
-import os
 
-from app.db.session import get_db
+from app.core import tracing
+from app.core.admission import AdmissionRejected
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.config import CHAT_JOB_MAX_WAIT, RATE_LIMIT_CHAT_USER, RATE_LIMIT_CHAT_TRIP
+from app.core.rate_limit import rate_limited
+from app.db.session import get_async_db
 from app.models.user import User
 from app.models.trip import Trip
 from app.models.user_trip import UserTrip
-from app.schemas.chat import ChatRequest, ChatResponse
+from app.routers.user_trips import get_authenticated_user_async
+from app.schemas.chat import ChatRequest, ChatResponse, ChatJobRead
+from app.services import ollama
+from app.services.ollama import chat_admission, chat_breaker
+from app.services.chat_jobs import chat_jobs, ChatJob, JobQueueFull
+from app.services.known_ids import get_trip_by_hash_async
+from app.services.trip_context import get_trip_context, trip_context_flight
+from app.services.model_router import model_router
 
 router = APIRouter()
 
-OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://chat:11434")
-OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma:2b")
 
-
-def get_authenticated_user(
-    x_user_hash: Optional[str] = Header(None), db: Session = Depends(get_db)
-) -> User:
-    """Dependency that authenticates a request using X-User-Hash header (user token)."""
-    if not x_user_hash:
-        raise HTTPException(status_code=401, detail="X-User-Hash header missing")
-    user = db.query(User).filter(User.token == x_user_hash).first()
-    if not user:
-        raise HTTPException(status_code=401, detail="Invalid user hash")
-    return user
-
-
-@router.post("/trips/{trip_hash}/chat", response_model=ChatResponse)
-async def send_chat_message(
-    trip_hash: str,
-    payload: ChatRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_authenticated_user),
-):
-    """
-    Send a message to the AI travel assistant for a specific trip.
-    The AI will provide recommendations and assistance based on trip context.
-    """
-    # Verify trip exists and user is a member
-    trip = db.query(Trip).filter(Trip.hash_id == trip_hash).first()
+async def _get_member_trip(db: AsyncSession, trip_hash: str, user: User) -> Trip:
+    """Return the trip if it exists and ``user`` is a member of it."""
+    trip = await get_trip_by_hash_async(db, trip_hash)
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
 
-    membership = (
-        db.query(UserTrip)
-        .filter(UserTrip.trip_id == trip.id, UserTrip.user_id == current_user.id)
-        .first()
+    result = await db.execute(
+        select(UserTrip.id).where(
+            UserTrip.trip_id == trip.id, UserTrip.user_id == user.id
+        )
     )
+    membership = result.first()
     if not membership:
         raise HTTPException(status_code=403, detail="You are not a member of this trip")
+    return trip
+
+
+async def _build_prompt(db: AsyncSession, trip: Trip, message: str) -> str:
+    """Build the full model prompt: trip context followed by the user question."""
+    # the context builder is shared with sync code; run_sync executes it on
+    # the async session's connection without blocking the loop
+    with tracing.span("chat.context"):
+        # members opening the chat together share one build of the summary
+        context = await trip_context_flight.do(
+            (trip.id, trip.version),
+            lambda: db.run_sync(lambda session: get_trip_context(session, trip)),
+        )
+    context += "\n\nProvide helpful, concise recommendations for destinations, activities, restaurants, packing tips, and general travel advice."
 
-    # Build context for the AI
-    member_count = db.query(UserTrip).filter(UserTrip.trip_id == trip.id).count()
-    context = f"""You are a helpful AI travel assistant for the trip "{trip.title}".
-The trip has {member_count} members."""
-
-    if trip.date_start and trip.date_end:
-        context += f"\nThe trip is planned from {trip.date_start} to {trip.date_end}."
+    return f"{context}\n\nUser question: {message}\n\nAssistant:"
 
-    if trip.description:
-        context += f"\nTrip description: {trip.description}"
 
-    context += "\n\nProvide helpful, concise recommendations for destinations, activities, restaurants, packing tips, and general travel advice."
+def _backend_unavailable(e: CircuitOpenError) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="AI service is temporarily unavailable",
+        headers={"Retry-After": str(e.retry_after)},
+    )
 
-    # Call Ollama API
-    try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            ollama_payload = {
-                "model": OLLAMA_MODEL,
-                "prompt": f"{context}\n\nUser question: {payload.message}\n\nAssistant:",
-                "stream": False,
-            }
 
-            response = await client.post(
-                f"{OLLAMA_API_URL}/api/generate", json=ollama_payload
-            )
-            response.raise_for_status()
+def _job_read(job: ChatJob) -> ChatJobRead:
+    return ChatJobRead(
+        id=job.id,
+        status=job.status,
+        response=job.response,
+        error=job.error,
+        created_at=datetime.utcfromtimestamp(job.created_at),
+        finished_at=(
+            datetime.utcfromtimestamp(job.finished_at) if job.finished_at else None
+        ),
+    )
 
-            data = response.json()
-            ai_response = data.get("response", "").strip()
 
-            if not ai_response:
-                ai_response = (
-                    "I apologize, but I couldn't generate a response. Please try again."
-                )
+# both chat endpoints draw from the same buckets, charged once the caller is
+# known to be a member
+_chat_limit = rate_limited("chat", user=RATE_LIMIT_CHAT_USER, trip=RATE_LIMIT_CHAT_TRIP)
 
-            return ChatResponse(response=ai_response)
 
+@router.post("/trips/{trip_hash}/chat", response_model=ChatResponse)
+async def send_chat_message(
+    trip_hash: str,
+    payload: ChatRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_authenticated_user_async),
+):
+    """
+    Send a message to the AI travel assistant for a specific trip.
+    The AI will provide recommendations and assistance based on trip context.
+    """
+    trip = await _get_member_trip(db, trip_hash, current_user)
+    await _chat_limit.charge(user=current_user.id, trip=trip.hash_id)
+    prompt = await _build_prompt(db, trip, payload.message)
+    # release the connection before the (long) generation
+    await db.close()
+    model, _ = model_router.choose(payload.message)
+
+    # Call Ollama API; the circuit breaker fails fast (503) while the backend
+    # is down, and admission control bounds how many generations run at once,
+    # rejecting early (429) instead of letting requests time out.
+    try:
+        chat_breaker.check()
+        async with chat_admission.slot(trip.hash_id, current_user.id):
+            ai_response = await ollama.generate(prompt, model=model)
+    except CircuitOpenError as e:
+        raise _backend_unavailable(e)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail="AI assistant is busy, please retry later",
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except httpx.HTTPError as e:
         raise HTTPException(
             status_code=503, detail=f"Failed to connect to AI service: {str(e)}"
@@ -97,3 +124,69 @@ The trip has {member_count} members."""
         raise HTTPException(
             status_code=500, detail=f"Error processing AI request: {str(e)}"
         )
+
+    if not ai_response:
+        ai_response = (
+            "I apologize, but I couldn't generate a response. Please try again."
+        )
+
+    return ChatResponse(response=ai_response)
+
+
+@router.post(
+    "/trips/{trip_hash}/chat/jobs",
+    response_model=ChatJobRead,
+    status_code=202,
+)
+async def create_chat_job(
+    trip_hash: str,
+    payload: ChatRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_authenticated_user_async),
+):
+    """Queue a message for the AI assistant and return a job id immediately.
+
+    Poll ``GET /trips/{trip_hash}/chat/jobs/{job_id}`` (optionally with ``wait``
+    for long-polling) to retrieve the response.
+    """
+    trip = await _get_member_trip(db, trip_hash, current_user)
+    await _chat_limit.charge(user=current_user.id, trip=trip.hash_id)
+    prompt = await _build_prompt(db, trip, payload.message)
+    try:
+        chat_breaker.check()
+        model, _ = model_router.choose(payload.message)
+        job = chat_jobs.submit(trip.hash_id, current_user.id, prompt, model)
+    except CircuitOpenError as e:
+        raise _backend_unavailable(e)
+    except JobQueueFull as e:
+        raise HTTPException(
+            status_code=429,
+            detail="AI assistant is busy, please retry later",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except RuntimeError:
+        raise HTTPException(status_code=503, detail="Chat jobs are not available")
+    return _job_read(job)
+
+
+@router.get("/trips/{trip_hash}/chat/jobs/{job_id}", response_model=ChatJobRead)
+async def get_chat_job(
+    trip_hash: str,
+    job_id: str,
+    wait: float = Query(0, ge=0, description="Seconds to long-poll for completion"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_authenticated_user_async),
+):
+    """Return the state of a chat job created by the caller.
+
+    With ``wait`` > 0 the request blocks until the job finishes or the wait
+    (capped by CHAT_JOB_MAX_WAIT) expires.
+    """
+    job = chat_jobs.get(job_id)
+    if not job or job.trip_hash != trip_hash or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Chat job not found")
+    if wait > 0:
+        # don't hold a pooled DB connection while long-polling
+        await db.close()
+    await chat_jobs.wait(job, min(wait, CHAT_JOB_MAX_WAIT))
+    return _job_read(job)
@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header, Query
 from sqlalchemy.orm import Session
-from typing import List
-from datetime import datetime, timedelta
+from typing import List, Optional
+from datetime import date, datetime, timedelta
+from functools import partial
 
 from app.db.session import get_db
+from app.db.trip_version import bump_trip_version
+from app.db.replica import get_read_db
+from app.core.config import RATE_LIMIT_AVAILABILITY_USER, RATE_LIMIT_AVAILABILITY_TRIP
+from app.core.rate_limit import rate_limited
 from app.models.trip import Trip
 from app.models.trip_date import TripDate
 from app.models.user_availability import UserAvailability
@@ -11,6 +16,8 @@ from app.models.user_trip import UserTrip
 from app.models.user import User
 from app.routers.user_trips import get_authenticated_user
 from app.schemas.dates import TripDateRead, BulkAvailabilityUpdate, CalendarResponse
+from app.services.known_ids import get_trip_by_hash
+from app.services.trip_views import cached_response, build_calendar, build_dates
 
 router = APIRouter()
 
@@ -22,7 +29,7 @@ def _parse_weekdays(allowed_weekdays):
 
 @router.post('/trips/{hash_id}/dates/generate')
 def generate_dates(hash_id: str, payload: dict = None, db: Session = Depends(get_db)):
-    trip = db.query(Trip).filter(Trip.hash_id == hash_id).first()
+    trip = get_trip_by_hash(db, hash_id)
     if not trip:
         raise HTTPException(status_code=404, detail='Trip not found')
 
@@ -39,6 +46,7 @@ def generate_dates(hash_id: str, payload: dict = None, db: Session = Depends(get
     trip.date_end = datetime.fromisoformat(end).date() if isinstance(end, str) else end
     trip.allowed_weekdays = weekdays
     db.add(trip)
+    bump_trip_version(db, trip.id)
     db.commit()
 
     ws = _parse_weekdays(weekdays)
@@ -52,24 +60,35 @@ def generate_dates(hash_id: str, payload: dict = None, db: Session = Depends(get
                 db.add(td)
                 added += 1
         d = d + timedelta(days=1)
+    if added:
+        bump_trip_version(db, trip.id)
     db.commit()
     return { 'generated': added }
 
 
 @router.get('/trips/{hash_id}/dates', response_model=List[TripDateRead])
-def list_dates(hash_id: str, db: Session = Depends(get_db)):
-    trip = db.query(Trip).filter(Trip.hash_id == hash_id).first()
+def list_dates(hash_id: str, db: Session = Depends(get_read_db), if_none_match: Optional[str] = Header(None)):
+    trip = get_trip_by_hash(db, hash_id)
     if not trip:
         raise HTTPException(status_code=404, detail='Trip not found')
-    rows = db.query(TripDate).filter(TripDate.trip_id == trip.id).order_by(TripDate.date).all()
-    return rows
+    return cached_response('dates', db, trip, build_dates, if_none_match=if_none_match)
+
+
+_availability_limit = rate_limited(
+    'availability',
+    user=RATE_LIMIT_AVAILABILITY_USER,
+    trip=RATE_LIMIT_AVAILABILITY_TRIP,
+)
 
 
 @router.post('/trips/{hash_id}/availability')
 def bulk_update_availability(hash_id: str, payload: BulkAvailabilityUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_authenticated_user)):
-    trip = db.query(Trip).filter(Trip.hash_id == hash_id).first()
+    trip = get_trip_by_hash(db, hash_id)
     if not trip:
         raise HTTPException(status_code=404, detail='Trip not found')
+    # non-members may submit too, but only members draw on the trip's budget
+    member = db.query(UserTrip.id).filter(UserTrip.trip_id == trip.id, UserTrip.user_id == current_user.id).first()
+    _availability_limit.charge_sync(user=current_user.id, trip=trip.hash_id if member else None)
 
     # Map dates to trip_date ids
     trip_dates = db.query(TripDate).filter(TripDate.trip_id == trip.id).all()
@@ -91,38 +110,49 @@ def bulk_update_availability(hash_id: str, payload: BulkAvailabilityUpdate, db:
             row = UserAvailability(trip_date_id=td_id, user_id=current_user.id, status=u.status)
             db.add(row)
         updated += 1
+    if updated:
+        bump_trip_version(db, trip.id)
     db.commit()
     return { 'updated': updated }
 
 
+def _parse_users(users: str, x_user_hash: Optional[str], db: Session):
+    # 'me' (requires X-User-Hash) and/or user ids, comma-separated
+    ids = set()
+    for part in users.split(','):
+        part = part.strip()
+        if part == 'me':
+            ids.add(get_authenticated_user(x_user_hash, db).id)
+        elif part.isdigit():
+            ids.add(int(part))
+        elif part:
+            raise HTTPException(status_code=400, detail=f'Invalid user in users: {part}')
+    return tuple(sorted(ids))
+
+
 @router.get('/trips/{hash_id}/calendar')
-def get_calendar(hash_id: str, db: Session = Depends(get_db)):
-    trip = db.query(Trip).filter(Trip.hash_id == hash_id).first()
+def get_calendar(
+    hash_id: str,
+    users: Optional[str] = Query(None, description="'me' and/or user ids, comma-separated"),
+    date_from: Optional[date] = Query(None, alias='from'),
+    date_to: Optional[date] = Query(None, alias='to'),
+    db: Session = Depends(get_read_db),
+    x_user_hash: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+):
+    """Availability grid of a trip.
+
+    ``users`` limits the rows to some members and ``from``/``to`` (inclusive)
+    to a date window; only the matching rows are read from the database.
+    """
+    trip = get_trip_by_hash(db, hash_id)
     if not trip:
         raise HTTPException(status_code=404, detail='Trip not found')
-
-    # dates
-    dates = db.query(TripDate).filter(TripDate.trip_id == trip.id).order_by(TripDate.date).all()
-    dates_list = [d.date.isoformat() for d in dates]
-
-    # members
-    members = db.query(UserTrip).filter(UserTrip.trip_id == trip.id).all()
-    users = []
-    for m in members:
-        u = db.query(User).filter(User.id == m.user_id).first()
-        users.append({ 'id': str(u.id), 'displayName': m.user_name or u.user_id })
-
-    # availability map
-    availability = {}
-    for m in members:
-        availability[str(m.user_id)] = { d.date.isoformat(): 'unset' for d in dates }
-
-    rows = db.query(UserAvailability).join(TripDate, UserAvailability.trip_date_id == TripDate.id).filter(TripDate.trip_id == trip.id).all()
-    for r in rows:
-        # find date string
-        td = db.query(TripDate).filter(TripDate.id == r.trip_date_id).first()
-        if not td:
-            continue
-        availability.setdefault(str(r.user_id), {})[td.date.isoformat()] = r.status
-
-    return { 'dates': dates_list, 'users': users, 'availability': availability }
+    user_ids = _parse_users(users, x_user_hash, db) if users is not None else None
+    params = tuple(
+        (name, value)
+        for name, value in (('users', user_ids), ('from', date_from), ('to', date_to))
+        if value is not None
+    )
+    build = partial(build_calendar, user_ids=user_ids, date_from=date_from, date_to=date_to)
+    return cached_response('calendar', db, trip, build, params, if_none_match=if_none_match)
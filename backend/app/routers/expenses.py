@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from typing import List
-from collections import defaultdict
+from typing import List, Optional, Tuple
 
+from app.core.fieldsets import field_selector
 from app.db.session import get_db
+from app.db.trip_version import bump_trip_version
+from app.db.replica import get_read_db
 from app.models.trip import Trip
 from app.models.user_trip import UserTrip
 from app.models.expense import Expense, ExpenseShare
@@ -13,10 +15,11 @@ from app.schemas.expenses import (
     ExpenseRead,
     DebtorRead,
     SettlementsResponse,
-    SettlementRead,
 )
-from app.routers.trips import get_authenticated_user
+from app.routers.user_trips import get_authenticated_user
 from app.models.user import User
+from app.services.known_ids import get_trip_by_hash
+from app.services.trip_views import cached_response, expenses_view, build_settlements
 
 router = APIRouter()
 
@@ -33,7 +36,7 @@ def create_expense(
     The payer is the authenticated user. Debtors are specified in the payload.
     """
     # Find trip by hash_id
-    trip = db.query(Trip).filter(Trip.hash_id == trip_hash).first()
+    trip = get_trip_by_hash(db, trip_hash)
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
 
@@ -86,6 +89,7 @@ def create_expense(
         )
         db.add(share)
 
+    bump_trip_version(db, trip.id)
     db.commit()
     db.refresh(expense)
 
@@ -112,12 +116,14 @@ def create_expense(
 @router.get("/trips/{trip_hash}/expenses", response_model=List[ExpenseRead])
 def get_expenses(
     trip_hash: str,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_authenticated_user),
+    if_none_match: Optional[str] = Header(None),
+    fields: Optional[Tuple[str, ...]] = Depends(field_selector(ExpenseRead)),
 ):
-    """Get all expenses for a trip."""
+    """Get all expenses for a trip; ``?fields=`` limits each expense to the listed fields."""
     # Find trip by hash_id
-    trip = db.query(Trip).filter(Trip.hash_id == trip_hash).first()
+    trip = get_trip_by_hash(db, trip_hash)
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
 
@@ -130,47 +136,18 @@ def get_expenses(
     if not membership:
         raise HTTPException(status_code=403, detail="Not a member of this trip")
 
-    # Get all expenses for this trip
-    expenses = (
-        db.query(Expense)
-        .filter(Expense.trip_id == trip.id)
-        .order_by(Expense.created_at.desc())
-        .all()
+    build, encoder = expenses_view()
+    return cached_response(
+        "expenses", db, trip, build, if_none_match=if_none_match, fields=fields, encoder=encoder
     )
 
-    result = []
-    for expense in expenses:
-        shares = (
-            db.query(ExpenseShare).filter(ExpenseShare.expense_id == expense.id).all()
-        )
-        result.append(
-            ExpenseRead(
-                id=str(expense.id),
-                tripId=trip.hash_id,
-                payerId=str(expense.payer_user_id),
-                amount=expense.amount,
-                currency=expense.currency,
-                description=expense.description,
-                debtors=[
-                    DebtorRead(
-                        userId=str(share.user_id),
-                        shareType=share.share_type,
-                        value=share.value,
-                    )
-                    for share in shares
-                ],
-                createdAt=expense.created_at,
-            )
-        )
-
-    return result
-
 
 @router.get("/trips/{trip_hash}/settlements", response_model=SettlementsResponse)
 def get_settlements(
     trip_hash: str,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_authenticated_user),
+    if_none_match: Optional[str] = Header(None),
 ):
     """Calculate settlements for a trip.
 
@@ -178,7 +155,7 @@ def get_settlements(
     Uses a greedy algorithm to minimize number of transactions.
     """
     # Find trip by hash_id
-    trip = db.query(Trip).filter(Trip.hash_id == trip_hash).first()
+    trip = get_trip_by_hash(db, trip_hash)
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
 
@@ -191,71 +168,4 @@ def get_settlements(
     if not membership:
         raise HTTPException(status_code=403, detail="Not a member of this trip")
 
-    # Get all expenses for this trip
-    expenses = db.query(Expense).filter(Expense.trip_id == trip.id).all()
-
-    if not expenses:
-        return SettlementsResponse(balances=[])
-
-    # Assume all expenses are in the same currency (use the first expense's currency)
-    currency = expenses[0].currency
-
-    # Calculate net balance for each user
-    # Positive balance = they should receive money
-    # Negative balance = they owe money
-    balances = defaultdict(float)
-
-    for expense in expenses:
-        # Payer paid the full amount
-        balances[expense.payer_user_id] += expense.amount
-
-        # Each debtor owes their share
-        shares = (
-            db.query(ExpenseShare).filter(ExpenseShare.expense_id == expense.id).all()
-        )
-        for share in shares:
-            balances[share.user_id] -= share.value
-
-    # Separate creditors (positive balance) and debtors (negative balance)
-    creditors = [
-        (user_id, amount) for user_id, amount in balances.items() if amount > 0.01
-    ]
-    debtors = [
-        (user_id, -amount) for user_id, amount in balances.items() if amount < -0.01
-    ]
-
-    # Sort by amount (largest first) for greedy algorithm
-    creditors.sort(key=lambda x: x[1], reverse=True)
-    debtors.sort(key=lambda x: x[1], reverse=True)
-
-    # Calculate settlements using greedy algorithm
-    settlements = []
-    i, j = 0, 0
-
-    while i < len(creditors) and j < len(debtors):
-        creditor_id, credit_amount = creditors[i]
-        debtor_id, debt_amount = debtors[j]
-
-        # Settle the minimum of what's owed and what's due
-        settle_amount = min(credit_amount, debt_amount)
-
-        settlements.append(
-            SettlementRead(
-                fromUser=str(debtor_id),
-                toUser=str(creditor_id),
-                amount=round(settle_amount, 2),
-                currency=currency,
-            )
-        )
-
-        # Update remaining amounts
-        creditors[i] = (creditor_id, credit_amount - settle_amount)
-        debtors[j] = (debtor_id, debt_amount - settle_amount)
-
-        # Move to next creditor or debtor if fully settled
-        if creditors[i][1] < 0.01:
-            i += 1
-        if debtors[j][1] < 0.01:
-            j += 1
-
-    return SettlementsResponse(balances=settlements)
+    return cached_response("settlements", db, trip, build_settlements, if_none_match=if_none_match)
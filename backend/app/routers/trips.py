@@ -1,42 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
 import uuid
 
+from app.core.etag import make_etag, etag_matches, etag_headers, not_modified
+from app.core.fieldsets import field_selector, select_fields
 from app.db.session import get_db
+from app.db.trip_version import bump_trip_version
+from app.db.unique import insert_unique
+from app.db.replica import get_read_db, get_async_read_db
 from app.models.trip import Trip
 from app.models.user_trip import UserTrip
 from app.models.user import User
-from app.schemas.trips import TripCreate, TripRead, TripUpdate
+from app.schemas.trips import TripCreate, TripRead, TripUpdate, DashboardPage
+from app.services.dashboard import build_dashboard
+from app.services.known_ids import get_trip_by_hash, get_trip_by_hash_async, trip_hashes
+from app.services.trip_views import SNAPSHOT_SECTIONS, snapshot_response
+from app.routers.user_trips import get_authenticated_user, get_authenticated_user_async
 from app.models.trip_date import TripDate
 from datetime import timedelta, datetime
 
 router = APIRouter()
 
+trip_fields = field_selector(TripRead)
 
-def _generate_hash(db: Session) -> str:
-    # generate a short unique hash_id (hex) and ensure uniqueness
-    for _ in range(5):
-        h = uuid.uuid4().hex[:12]
-        exists = db.query(Trip).filter(Trip.hash_id == h).first()
-        if not exists:
-            return h
-    # fallback to full uuid if collisions occur
-    return uuid.uuid4().hex
 
-
-def get_authenticated_user(x_user_hash: Optional[str] = Header(None), db: Session = Depends(get_db)) -> User:
-    """Dependency that authenticates a request using X-User-Hash header (user token).
-
-    The header value must match a `User.token` in the DB. Raises 401 if missing/invalid.
-    """
-    if not x_user_hash:
-        raise HTTPException(status_code=401, detail="X-User-Hash header missing")
-    user = db.query(User).filter(User.token == x_user_hash).first()
-    if not user:
-        raise HTTPException(status_code=401, detail="Invalid user hash")
-    return user
+def _new_hash() -> str:
+    # short hex hash_id; uniqueness is left to the unique constraint
+    return uuid.uuid4().hex[:12]
 
 
 @router.post("/trips", response_model=TripRead)
@@ -45,52 +41,123 @@ def create_trip(payload: TripCreate, db: Session = Depends(get_db), current_user
 
     Clients must send header: X-User-Hash: <their token/hash>
     """
-    hash_id = _generate_hash(db)
-    trip = Trip(title=payload.title, description=payload.description, hash_id=hash_id)
-    # optional initial dates provided by clients are not part of TripCreate currently;
-    # if you want creation to accept dates, extend TripCreate accordingly.
-    db.add(trip)
-    try:
+    owner_id = current_user.id
+
+    def build():
+        trip = Trip(title=payload.title, description=payload.description, hash_id=_new_hash())
+        # optional initial dates provided by clients are not part of TripCreate currently;
+        # if you want creation to accept dates, extend TripCreate accordingly.
+        db.add(trip)
         # flush so trip.id is available for the association
         db.flush()
         # create a membership for the creator; nickname can be provided later via membership update
-        membership = UserTrip(user_id=current_user.id, trip_id=trip.id, user_name=payload.user_name)
-        db.add(membership)
-        db.commit()
+        db.add(UserTrip(user_id=owner_id, trip_id=trip.id, user_name=payload.user_name))
+        return trip
+
+    try:
+        trip = insert_unique(db, "trips", build)
     except IntegrityError:
-        db.rollback()
-        # rare collision on hash or FK issue
+        # hash collisions are retried; this is an FK issue or a run of bad luck
         raise HTTPException(status_code=500, detail="Could not create trip due to DB error")
     db.refresh(trip)
+    trip_hashes.add(trip.hash_id)
     return trip
 
 
 @router.get("/trips/{hash_id}", response_model=TripRead)
-def get_trip(hash_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_authenticated_user)):
+async def get_trip(hash_id: str, response: Response, db: AsyncSession = Depends(get_async_read_db), current_user: User = Depends(get_authenticated_user_async), if_none_match: Optional[str] = Header(None), fields: Optional[Tuple[str, ...]] = Depends(trip_fields)):
     """Get a trip by hash. Request must include X-User-Hash header for auditing/authentication.
+
+    Answers 304 when If-None-Match carries the ETag of the current trip version.
+    ``?fields=`` limits the response to the listed fields.
     """
-    trip = db.query(Trip).filter(Trip.hash_id == hash_id).first()
+    trip = await get_trip_by_hash_async(db, hash_id)
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
+    etag = make_etag("trip", trip.id, trip.version, *(fields or ()))
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    if fields is not None:
+        data = select_fields(jsonable_encoder(TripRead.model_validate(trip)), fields)
+        return JSONResponse(data, headers=etag_headers(etag))
+    response.headers.update(etag_headers(etag))
     # include date fields — Pydantic will read them from the ORM model
     return trip
 
 
+@router.get("/trips/{hash_id}/snapshot")
+def get_trip_snapshot(
+    hash_id: str,
+    sections: Optional[str] = Query(None, description="Comma-separated sections; all when omitted"),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_authenticated_user),
+    if_none_match: Optional[str] = Header(None),
+):
+    """Everything needed to open a trip in one response.
+
+    Returns an object keyed by section (trip, members, calendar, expenses,
+    settlements), each shaped like the corresponding single endpoint. The
+    caller must be a member of the trip. One ETag covers the whole document.
+    """
+    if sections is None:
+        selected = tuple(SNAPSHOT_SECTIONS)
+    else:
+        requested = {s.strip() for s in sections.split(",") if s.strip()}
+        unknown = requested - SNAPSHOT_SECTIONS.keys()
+        if unknown or not requested:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown snapshot sections: {', '.join(sorted(unknown))}" if unknown else "No sections requested",
+            )
+        selected = tuple(s for s in SNAPSHOT_SECTIONS if s in requested)
+
+    trip = get_trip_by_hash(db, hash_id)
+    if not trip:
+        raise HTTPException(status_code=404, detail="Trip not found")
+    membership = (
+        db.query(UserTrip)
+        .filter(UserTrip.trip_id == trip.id, UserTrip.user_id == current_user.id)
+        .first()
+    )
+    if not membership:
+        raise HTTPException(status_code=403, detail="Not a member of this trip")
+
+    return snapshot_response(db, trip, selected, if_none_match)
+
+
 @router.get("/trips", response_model=List[TripRead])
-def list_my_trips(db: Session = Depends(get_db), current_user: User = Depends(get_authenticated_user)):
+async def list_my_trips(db: AsyncSession = Depends(get_async_read_db), current_user: User = Depends(get_authenticated_user_async), fields: Optional[Tuple[str, ...]] = Depends(trip_fields)):
     """Return trips where the authenticated user is owner or a member.
 
-    Requires X-User-Hash header.
+    Requires X-User-Hash header. ``?fields=`` limits each trip to the listed
+    fields, and only those columns are loaded.
     """
     # Join against user_trips to find memberships (owner field removed)
-    trips = db.query(Trip).join(UserTrip, UserTrip.trip_id == Trip.id).filter(UserTrip.user_id == current_user.id).all()
-    return trips
+    if fields is not None:
+        result = await db.execute(select(*(getattr(Trip, f) for f in fields)).join(UserTrip, UserTrip.trip_id == Trip.id).where(UserTrip.user_id == current_user.id))
+        return JSONResponse(jsonable_encoder([dict(row._mapping) for row in result]))
+    result = await db.execute(select(Trip).join(UserTrip, UserTrip.trip_id == Trip.id).where(UserTrip.user_id == current_user.id))
+    return result.scalars().all()
+
+
+@router.get("/dashboard", response_model=DashboardPage)
+async def get_dashboard(
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: User = Depends(get_authenticated_user_async),
+):
+    """One page of the caller's trips, newest first, with summary figures per trip.
+
+    Requires X-User-Hash header.
+    """
+    return await build_dashboard(db, current_user, limit, offset)
 
 
 @router.put("/trips/{hash_id}", response_model=TripRead)
 def update_trip(hash_id: str, payload: TripUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_authenticated_user)):
     """Update a trip. Only the trip owner (authenticated) may update the trip."""
-    trip = db.query(Trip).filter(Trip.hash_id == hash_id).first()
+    trip = get_trip_by_hash(db, hash_id)
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
 
@@ -124,6 +191,7 @@ def update_trip(hash_id: str, payload: TripUpdate, db: Session = Depends(get_db)
     try:
         # commit basic trip changes first so trip.id is stable
         db.add(trip)
+        bump_trip_version(db, trip.id)
         db.commit()
     except IntegrityError:
         db.rollback()
@@ -161,6 +229,7 @@ def update_trip(hash_id: str, payload: TripUpdate, db: Session = Depends(get_db)
             db.query(TripDate).filter(TripDate.trip_id == trip.id).delete()
 
         try:
+            bump_trip_version(db, trip.id)
             db.commit()
         except Exception:
             db.rollback()
@@ -1,44 +1,83 @@
 from fastapi import APIRouter, Depends, HTTPException, Header
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from typing import List, Optional
-
-from app.db.session import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from app.core import tracing
+from app.core.fieldsets import field_selector
+from app.db.session import get_db, get_async_db
+from app.db.trip_version import bump_trip_version
+from app.db.replica import get_read_db
 from app.models.user import User
 from app.models.trip import Trip
 from app.models.user_trip import UserTrip
 from app.models.trip_date import TripDate
 from app.models.user_availability import UserAvailability
 from app.schemas.user_trips import UserTripCreate, UserTripRead
+from app.services.known_ids import get_trip_by_hash, user_tokens
+from app.services.trip_views import cached_response, build_members
 
 router = APIRouter()
 
 
+# the caller of a batch request, authenticated once for all of its items
+batch_user: ContextVar[Optional[User]] = ContextVar("batch_user", default=None)
+
+
 def get_user_by_token(db: Session, token: str):
+    if not user_tokens.might_exist(token):
+        return None
     return db.query(User).filter(User.token == token).first()
 
 
 def get_authenticated_user(x_user_hash: Optional[str] = Header(None), db: Session = Depends(get_db)) -> User:
+    """Dependency that authenticates a request using X-User-Hash header (user token).
+
+    The header value must match a `User.token` in the DB. Raises 401 if missing/invalid.
+    """
+    user = batch_user.get()
+    if user is not None:
+        return user
+    if not x_user_hash:
+        raise HTTPException(status_code=401, detail="X-User-Hash header missing")
+    with tracing.span("auth"):
+        user = get_user_by_token(db, x_user_hash)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid user hash")
+    return user
+
+
+async def get_authenticated_user_async(x_user_hash: Optional[str] = Header(None), db: AsyncSession = Depends(get_async_db)) -> User:
+    """Same as ``get_authenticated_user`` for endpoints using the async session."""
+    user = batch_user.get()
+    if user is not None:
+        return user
     if not x_user_hash:
         raise HTTPException(status_code=401, detail="X-User-Hash header missing")
-    user = get_user_by_token(db, x_user_hash)
+    with tracing.span("auth"):
+        user = None
+        if await user_tokens.might_exist_async(x_user_hash):
+            result = await db.execute(select(User).where(User.token == x_user_hash))
+            user = result.scalars().first()
     if not user:
         raise HTTPException(status_code=401, detail="Invalid user hash")
     return user
 
 
 @router.get("/trips/{hash_id}/members", response_model=List[UserTripRead])
-def list_members(hash_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_authenticated_user)):
-    trip = db.query(Trip).filter(Trip.hash_id == hash_id).first()
+def list_members(hash_id: str, db: Session = Depends(get_read_db), current_user: User = Depends(get_authenticated_user), if_none_match: Optional[str] = Header(None), fields: Optional[Tuple[str, ...]] = Depends(field_selector(UserTripRead))):
+    trip = get_trip_by_hash(db, hash_id)
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
-    rows = db.query(UserTrip).filter(UserTrip.trip_id == trip.id).all()
-    return rows
+    return cached_response("members", db, trip, build_members, if_none_match=if_none_match, fields=fields)
 
 
 @router.post("/trips/{hash_id}/members", response_model=UserTripRead)
 def add_member(hash_id: str, payload: UserTripCreate, db: Session = Depends(get_db), current_user: User = Depends(get_authenticated_user)):
-    trip = db.query(Trip).filter(Trip.hash_id == hash_id).first()
+    trip = get_trip_by_hash(db, hash_id)
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
 
@@ -57,6 +96,7 @@ def add_member(hash_id: str, payload: UserTripCreate, db: Session = Depends(get_
     membership = UserTrip(user_id=user.id, trip_id=trip.id, user_name=payload.user_name)
     db.add(membership)
     try:
+        bump_trip_version(db, trip.id)
         db.commit()
     except IntegrityError:
         db.rollback()
@@ -70,6 +110,7 @@ def add_member(hash_id: str, payload: UserTripCreate, db: Session = Depends(get_
             if not exists:
                 ua = UserAvailability(trip_date_id=td.id, user_id=user.id, status='unset')
                 db.add(ua)
+        bump_trip_version(db, trip.id)
         db.commit()
     except Exception:
         db.rollback()
@@ -79,7 +120,7 @@ def add_member(hash_id: str, payload: UserTripCreate, db: Session = Depends(get_
 
 @router.delete("/trips/{hash_id}/members/{user_id}")
 def remove_member(hash_id: str, user_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_authenticated_user)):
-    trip = db.query(Trip).filter(Trip.hash_id == hash_id).first()
+    trip = get_trip_by_hash(db, hash_id)
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
     membership = db.query(UserTrip).filter(UserTrip.trip_id == trip.id, UserTrip.user_id == user_id).first()
@@ -91,13 +132,14 @@ def remove_member(hash_id: str, user_id: int, db: Session = Depends(get_db), cur
         raise HTTPException(status_code=403, detail="Only the user themself may remove their membership")
 
     db.delete(membership)
+    bump_trip_version(db, trip.id)
     db.commit()
     return {"status": "deleted"}
 
 
 @router.put("/trips/{hash_id}/members/{user_id}", response_model=UserTripRead)
 def update_member(hash_id: str, user_id: int, payload: UserTripCreate, db: Session = Depends(get_db), current_user: User = Depends(get_authenticated_user)):
-    trip = db.query(Trip).filter(Trip.hash_id == hash_id).first()
+    trip = get_trip_by_hash(db, hash_id)
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
     membership = db.query(UserTrip).filter(UserTrip.trip_id == trip.id, UserTrip.user_id == user_id).first()
@@ -110,6 +152,7 @@ def update_member(hash_id: str, user_id: int, payload: UserTripCreate, db: Sessi
 
     membership.user_name = payload.user_name
     db.add(membership)
+    bump_trip_version(db, trip.id)
     db.commit()
     db.refresh(membership)
     return membership
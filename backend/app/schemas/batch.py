@@ -0,0 +1,29 @@
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Literal, Optional
+
+
+class BatchItem(BaseModel):
+    method: Literal["GET", "POST", "PUT", "PATCH", "DELETE"]
+    # full API path including the query string, e.g. /api/v1/trips/abc/calendar
+    path: str
+    body: Optional[Any] = None
+    # extra request headers (If-None-Match, ...); X-User-Hash is the batch's own
+    headers: Dict[str, str] = {}
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem] = Field(..., min_length=1)
+    # run all items in one database transaction; the first failing item
+    # rolls everything back and the rest are not executed
+    transaction: bool = False
+
+
+class BatchItemResult(BaseModel):
+    status: int
+    body: Optional[Any] = None
+
+
+class BatchResponse(BaseModel):
+    responses: List[BatchItemResult]
+    # for transactional batches: whether the changes were kept
+    committed: Optional[bool] = None
@@ -1,4 +1,6 @@
 from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
 
 
 class ChatRequest(BaseModel):
@@ -7,3 +9,12 @@ class ChatRequest(BaseModel):
 
 class ChatResponse(BaseModel):
     response: str
+
+
+class ChatJobRead(BaseModel):
+    id: str
+    status: str  # queued, running, succeeded, failed
+    response: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import date
 
 
@@ -31,3 +31,29 @@ class TripRead(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class TripCard(BaseModel):
+    hash_id: str
+    title: str
+    description: Optional[str]
+    date_start: Optional[date]
+    date_end: Optional[date]
+    member_count: int
+    # span and size of the generated candidate dates
+    first_date: Optional[date]
+    last_date: Optional[date]
+    date_count: int
+    # candidate dates on which every member is available
+    free_dates: int
+    # per currency: total spent on the trip and the caller's net balance
+    # (positive = others owe the caller)
+    total_spent: Dict[str, float]
+    my_balance: Dict[str, float]
+
+
+class DashboardPage(BaseModel):
+    items: List[TripCard]
+    total: int
+    limit: int
+    offset: int
@@ -0,0 +1 @@
+# services package
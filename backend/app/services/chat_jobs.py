@@ -0,0 +1,224 @@
+"""Background chat jobs.
+
+``POST /trips/{trip_hash}/chat/jobs`` only builds the prompt and enqueues it;
+a small pool of asyncio workers runs the generation through the same
+admission controller as the synchronous endpoint. There are only as many
+workers as admission slots, so pending jobs wait here rather than in the
+controller's queue; ``FairJobQueue`` hands them out in the same order,
+round-robin across trips and across users within a trip, so one user's
+backlog only delays their own jobs. Job state is kept in process memory and
+finished jobs are swept after ``CHAT_JOB_TTL`` seconds.
+"""
+import asyncio
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.core import metrics
+from app.core.admission import AdmissionRejected
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.config import (
+    CHAT_JOB_WORKERS,
+    CHAT_JOB_MAX_PENDING,
+    CHAT_JOB_TTL,
+)
+from app.services import ollama
+from app.services.ollama import chat_admission
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# how often a worker retries when the admission queue is full
+_MAX_ADMISSION_ATTEMPTS = 3
+
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are already pending; maps to HTTP 429."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("chat job queue is full")
+        self.retry_after = retry_after
+
+
+@dataclass
+class ChatJob:
+    id: str
+    trip_hash: str
+    user_id: int
+    prompt: str
+    model: str
+    status: str = QUEUED
+    response: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def finish(self, status: str, response: str = None, error: str = None):
+        self.status = status
+        self.response = response
+        self.error = error
+        self.finished_at = time.time()
+        self.done.set()
+
+
+class FairJobQueue:
+    """Pending jobs, dequeued round-robin by trip and then by user."""
+
+    def __init__(self):
+        # trip -> user -> deque of jobs; both levels rotate on get
+        self._jobs: "OrderedDict[str, OrderedDict[int, deque]]" = OrderedDict()
+        self._size = 0
+        self._ready = asyncio.Semaphore(0)
+
+    def qsize(self) -> int:
+        return self._size
+
+    def put_nowait(self, job: ChatJob):
+        users = self._jobs.setdefault(job.trip_hash, OrderedDict())
+        users.setdefault(job.user_id, deque()).append(job)
+        self._size += 1
+        self._ready.release()
+
+    async def get(self) -> ChatJob:
+        await self._ready.acquire()
+        trip_hash, users = next(iter(self._jobs.items()))
+        user_id, jobs = next(iter(users.items()))
+        job = jobs.popleft()
+        # this user goes behind the trip's other users, this trip behind the others
+        users.move_to_end(user_id)
+        self._jobs.move_to_end(trip_hash)
+        if not jobs:
+            del users[user_id]
+        if not users:
+            del self._jobs[trip_hash]
+        self._size -= 1
+        return job
+
+
+class ChatJobQueue:
+    def __init__(self, workers: int, max_pending: int, ttl: float):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._jobs: Dict[str, ChatJob] = {}
+        self._queue: Optional[FairJobQueue] = None
+        self._tasks: List[asyncio.Task] = []
+
+        self._completed = metrics.counter(
+            "chat_jobs_completed_total", "Chat jobs finished, by status.", ("status",)
+        )
+        metrics.gauge("chat_jobs_pending", "Chat jobs waiting for a worker.").set_function(
+            lambda: self._queue.qsize() if self._queue is not None else 0
+        )
+
+    @property
+    def started(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        if self.started:
+            return
+        self._queue = FairJobQueue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweeper()))
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for job in self._jobs.values():
+            if job.status in (QUEUED, RUNNING):
+                job.finish(FAILED, error="Server shutting down")
+        self._queue = None
+
+    def submit(self, trip_hash: str, user_id: int, prompt: str, model: str) -> ChatJob:
+        if not self.started:
+            raise RuntimeError("chat job workers are not running")
+        if self._queue.qsize() >= self.max_pending:
+            raise JobQueueFull(chat_admission.retry_after())
+        job = ChatJob(
+            id=uuid.uuid4().hex,
+            trip_hash=trip_hash,
+            user_id=user_id,
+            prompt=prompt,
+            model=model,
+        )
+        self._jobs[job.id] = job
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[ChatJob]:
+        return self._jobs.get(job_id)
+
+    async def wait(self, job: ChatJob, timeout: float):
+        """Long-poll helper: return once the job is finished or ``timeout`` passes."""
+        if timeout <= 0 or job.done.is_set():
+            return
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def purge_expired(self, now: float = None):
+        now = now or time.time()
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at > self.ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        return len(expired)
+
+    async def _run(self, job: ChatJob) -> str:
+        for attempt in range(_MAX_ADMISSION_ATTEMPTS):
+            try:
+                async with chat_admission.slot(job.trip_hash, job.user_id):
+                    return await ollama.generate(job.prompt, model=job.model)
+            except AdmissionRejected as e:
+                if attempt == _MAX_ADMISSION_ATTEMPTS - 1:
+                    raise
+                await asyncio.sleep(e.retry_after)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.status = RUNNING
+            try:
+                text = await self._run(job)
+                job.finish(
+                    SUCCEEDED,
+                    response=text
+                    or "I apologize, but I couldn't generate a response. Please try again.",
+                )
+            except asyncio.CancelledError:
+                job.finish(FAILED, error="Server shutting down")
+                raise
+            except AdmissionRejected:
+                job.finish(FAILED, error="AI assistant is busy, please retry later")
+            except CircuitOpenError:
+                job.finish(FAILED, error="AI service is temporarily unavailable")
+            except httpx.HTTPError as e:
+                job.finish(FAILED, error=f"Failed to connect to AI service: {str(e)}")
+            except Exception as e:
+                job.finish(FAILED, error=f"Error processing AI request: {str(e)}")
+            self._completed.inc(status=job.status)
+
+    async def _sweeper(self):
+        interval = max(1.0, self.ttl / 4)
+        while True:
+            await asyncio.sleep(interval)
+            self.purge_expired()
+
+
+chat_jobs = ChatJobQueue(
+    workers=CHAT_JOB_WORKERS, max_pending=CHAT_JOB_MAX_PENDING, ttl=CHAT_JOB_TTL
+)
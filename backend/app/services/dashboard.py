@@ -0,0 +1,137 @@
+"""Per-trip summary cards for the starting page.
+
+Every figure comes from a grouped aggregate over the page's trip ids, so one
+page costs the same handful of statements however many trips it shows.
+"""
+from collections import defaultdict
+from typing import Dict, List
+
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.trip import Trip
+from app.models.trip_date import TripDate
+from app.models.user_availability import UserAvailability
+from app.models.user_trip import UserTrip
+from app.models.expense import Expense, ExpenseShare
+from app.models.user import User
+from app.schemas.trips import DashboardPage, TripCard
+
+
+async def _member_counts(db: AsyncSession, trip_ids: List[int]) -> Dict[int, int]:
+    rows = await db.execute(
+        select(UserTrip.trip_id, func.count())
+        .where(UserTrip.trip_id.in_(trip_ids))
+        .group_by(UserTrip.trip_id)
+    )
+    return dict(rows.all())
+
+
+async def _date_stats(db: AsyncSession, trip_ids: List[int]) -> Dict[int, tuple]:
+    rows = await db.execute(
+        select(TripDate.trip_id, func.min(TripDate.date), func.max(TripDate.date), func.count())
+        .where(TripDate.trip_id.in_(trip_ids))
+        .group_by(TripDate.trip_id)
+    )
+    return {trip_id: (first, last, n) for trip_id, first, last, n in rows.all()}
+
+
+async def _free_dates(db: AsyncSession, trip_ids: List[int]) -> Dict[int, int]:
+    members = (
+        select(UserTrip.trip_id, func.count().label("members"))
+        .where(UserTrip.trip_id.in_(trip_ids))
+        .group_by(UserTrip.trip_id)
+        .subquery()
+    )
+    # only current members count: removing one leaves their availability behind
+    available = (
+        select(UserAvailability.trip_date_id, func.count().label("available"))
+        .join(TripDate, TripDate.id == UserAvailability.trip_date_id)
+        .join(
+            UserTrip,
+            (UserTrip.trip_id == TripDate.trip_id) & (UserTrip.user_id == UserAvailability.user_id),
+        )
+        .where(TripDate.trip_id.in_(trip_ids), UserAvailability.status == "available")
+        .group_by(UserAvailability.trip_date_id)
+        .subquery()
+    )
+    rows = await db.execute(
+        select(TripDate.trip_id, func.count())
+        .join(available, available.c.trip_date_id == TripDate.id)
+        .join(members, members.c.trip_id == TripDate.trip_id)
+        .where(available.c.available >= members.c.members)
+        .group_by(TripDate.trip_id)
+    )
+    return dict(rows.all())
+
+
+async def _spending(db: AsyncSession, trip_ids: List[int], user: User):
+    """Total spent and the caller's net balance, by trip and currency."""
+    totals = defaultdict(dict)
+    balances = defaultdict(lambda: defaultdict(float))
+
+    paid = await db.execute(
+        select(
+            Expense.trip_id,
+            Expense.currency,
+            func.sum(Expense.amount),
+            func.sum(case((Expense.payer_user_id == user.id, Expense.amount), else_=0)),
+        )
+        .where(Expense.trip_id.in_(trip_ids))
+        .group_by(Expense.trip_id, Expense.currency)
+    )
+    for trip_id, currency, total, mine in paid.all():
+        totals[trip_id][currency] = round(total, 2)
+        balances[trip_id][currency] += mine
+
+    owed = await db.execute(
+        select(Expense.trip_id, Expense.currency, func.sum(ExpenseShare.value))
+        .join(ExpenseShare, and_(ExpenseShare.expense_id == Expense.id, ExpenseShare.user_id == user.id))
+        .where(Expense.trip_id.in_(trip_ids))
+        .group_by(Expense.trip_id, Expense.currency)
+    )
+    for trip_id, currency, share in owed.all():
+        balances[trip_id][currency] -= share
+
+    return totals, {
+        trip_id: {c: round(v, 2) for c, v in per_currency.items()}
+        for trip_id, per_currency in balances.items()
+    }
+
+
+async def build_dashboard(db: AsyncSession, user: User, limit: int, offset: int) -> DashboardPage:
+    mine = select(UserTrip.trip_id).where(UserTrip.user_id == user.id)
+    total = (await db.execute(select(func.count()).select_from(mine.subquery()))).scalar_one()
+    trips = (
+        await db.execute(
+            select(Trip).where(Trip.id.in_(mine)).order_by(Trip.id.desc()).limit(limit).offset(offset)
+        )
+    ).scalars().all()
+
+    items = []
+    if trips:
+        trip_ids = [t.id for t in trips]
+        members = await _member_counts(db, trip_ids)
+        dates = await _date_stats(db, trip_ids)
+        free = await _free_dates(db, trip_ids)
+        spent, balance = await _spending(db, trip_ids, user)
+        for trip in trips:
+            first, last, count = dates.get(trip.id, (None, None, 0))
+            items.append(
+                TripCard(
+                    hash_id=trip.hash_id,
+                    title=trip.title,
+                    description=trip.description,
+                    date_start=trip.date_start,
+                    date_end=trip.date_end,
+                    member_count=members.get(trip.id, 0),
+                    first_date=first,
+                    last_date=last,
+                    date_count=count,
+                    free_dates=free.get(trip.id, 0),
+                    total_spent=spent.get(trip.id, {}),
+                    my_balance=balance.get(trip.id, {}),
+                )
+            )
+
+    return DashboardPage(items=items, total=total, limit=limit, offset=offset)
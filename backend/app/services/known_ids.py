@@ -0,0 +1,275 @@
+"""Negative-lookup filters over trip hashes and user tokens.
+
+Scanners and stale clients send hash ids and tokens that never existed; each
+used to cost its own query before the 404 or 401. ``KnownIds`` keeps a Bloom
+filter of every existing value, built from the primary at startup and
+extended with the values this worker creates. A value the filter might
+contain goes on to the usual query, which settles false positives.
+
+A value the filter has not seen may still exist: another worker may have
+created it. It is never rejected on the filter's word alone. Misses are
+queued for a lookup thread, which checks every value queued since its last
+round in one ``IN`` query against the primary, adds those that exist and
+answers the waiting requests. Each lookup starts after the values it checks
+were queued, so anything committed before the request arrived is found, and
+a flood of unknown identifiers costs one query per round instead of one per
+request.
+
+The lookup thread has a connection of its own, outside the request pool, so
+a burst of misses from requests that already hold pooled connections can't
+starve it. A request waits at most ``KNOWN_IDS_LOOKUP_TIMEOUT`` for its
+round; past that it is told the value might exist and its own query, on its
+own session, settles the question.
+
+Deleted values stay in the filter until it is rebuilt, which happens in the
+background once it grows past its capacity.
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Callable, Dict, Optional, Union
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.core import config, metrics
+from app.core.bloom import BloomFilter
+from app.models.trip import Trip
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+MIN_CAPACITY = 10_000
+# values per IN list in one lookup round
+LOOKUP_CHUNK = 500
+
+_lookups = metrics.counter(
+    "known_ids_lookups_total",
+    "Identifier lookups by filter and outcome (passed, confirmed, rejected, timed_out).",
+    ("filter", "result"),
+)
+_rounds = metrics.counter(
+    "known_ids_lookup_rounds_total", "Queries run to check values missing from the filter.", ("filter",)
+)
+_entries = metrics.gauge("known_ids_filter_entries", "Values held by the filter.", ("filter",))
+_capacity = metrics.gauge(
+    "known_ids_filter_capacity", "Values the filter holds at its target error rate.", ("filter",)
+)
+_bytes = metrics.gauge("known_ids_filter_bytes", "Size of the filter's bit array.", ("filter",))
+_fp_rate = metrics.gauge(
+    "known_ids_filter_false_positive_rate", "Expected false-positive rate at the current fill.", ("filter",)
+)
+
+
+def _own_sessions() -> Callable[[], Session]:
+    """Sessions on a one-connection engine of their own, apart from the request pool."""
+    url = config.DATABASE_URL
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    engine = create_engine(
+        url, connect_args=connect_args, pool_size=1, max_overflow=0, pool_pre_ping=True
+    )
+    return sessionmaker(bind=engine, autoflush=False)
+
+
+class KnownIds:
+    def __init__(
+        self,
+        name: str,
+        column,
+        error_rate: float,
+        session_factory: Optional[Callable[[], Session]] = None,
+    ):
+        self.name = name
+        self.column = column
+        self.error_rate = error_rate
+        self.session_factory = session_factory
+        self._cond = threading.Condition()
+        self._filter: Optional[BloomFilter] = None
+        self._pending: Dict[str, Future] = {}
+        self._rebuild = False
+        self._worker: Optional[threading.Thread] = None
+
+        _entries.set_function(lambda: len(self._filter or ()), filter=name)
+        _capacity.set_function(lambda: self._filter.capacity if self._filter else 0, filter=name)
+        _bytes.set_function(lambda: self._filter.size_bytes if self._filter else 0, filter=name)
+        _fp_rate.set_function(
+            lambda: self._filter.false_positive_rate() if self._filter else 0.0, filter=name
+        )
+
+    def _session(self) -> Session:
+        if self.session_factory is None:
+            with self._cond:
+                if self.session_factory is None:
+                    self.session_factory = _own_sessions()
+        return self.session_factory()
+
+    def load(self):
+        """(Re)build the filter from every row on the primary."""
+        with self._session() as db:
+            values = db.execute(select(self.column)).scalars().all()
+        bloom = BloomFilter(max(MIN_CAPACITY, 2 * len(values)), self.error_rate)
+        for value in values:
+            bloom.add(value)
+        with self._cond:
+            # values added while loading are lost here; a miss looks them up
+            self._filter = bloom
+            self._rebuild = False
+
+    def add(self, value: str):
+        """Record a value created by this worker."""
+        with self._cond:
+            bloom = self._filter
+            if bloom is None:
+                return
+            bloom.add(value)
+            if bloom.count > bloom.capacity and not self._rebuild:
+                self._rebuild = True
+                self._start_worker()
+                self._cond.notify()
+
+    def _check(self, value: str) -> Union[bool, Future]:
+        """True on a filter hit, else a future for the value's lookup."""
+        with self._cond:
+            bloom = self._filter
+            if bloom is None:
+                # not loaded: let the caller's query decide, as without a filter
+                return True
+            if value in bloom:
+                _lookups.inc(filter=self.name, result="passed")
+                return True
+            future = self._pending.get(value)
+            if future is None:
+                future = self._pending[value] = Future()
+                self._start_worker()
+                self._cond.notify()
+            return future
+
+    def _timed_out(self) -> bool:
+        # the caller's own query decides instead
+        _lookups.inc(filter=self.name, result="timed_out")
+        return True
+
+    def might_exist(self, value: str) -> bool:
+        """False only if ``value`` is certainly not in the database."""
+        if not config.KNOWN_IDS_FILTER:
+            return True
+        found = self._check(value)
+        if isinstance(found, bool):
+            return found
+        try:
+            return found.result(timeout=config.KNOWN_IDS_LOOKUP_TIMEOUT)
+        except FutureTimeout:
+            return self._timed_out()
+
+    async def might_exist_async(self, value: str) -> bool:
+        """``might_exist`` without blocking the event loop."""
+        if not config.KNOWN_IDS_FILTER:
+            return True
+        found = self._check(value)
+        if isinstance(found, bool):
+            return found
+        try:
+            # shielded: other requests wait on the same future
+            return await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(found)), config.KNOWN_IDS_LOOKUP_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            return self._timed_out()
+
+    def _start_worker(self):
+        # called with the condition held
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name=f"{self.name}-lookup", daemon=True)
+            self._worker.start()
+
+    def _lookup(self, values) -> set:
+        found = set()
+        with self._session() as db:
+            for start in range(0, len(values), LOOKUP_CHUNK):
+                chunk = values[start:start + LOOKUP_CHUNK]
+                found.update(db.execute(select(self.column).where(self.column.in_(chunk))).scalars())
+        return found
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._rebuild:
+                    self._cond.wait()
+                batch, self._pending = self._pending, {}
+                rebuild = self._rebuild
+            if batch:
+                self._answer(batch)
+            if rebuild:
+                try:
+                    self.load()
+                except Exception:
+                    logger.exception("%s: rebuilding the filter failed", self.name)
+                    with self._cond:
+                        self._rebuild = False
+
+    def _answer(self, batch: Dict[str, Future]):
+        _rounds.inc(filter=self.name)
+        try:
+            found = self._lookup(list(batch))
+        except Exception:
+            logger.exception("%s: lookup of %d values failed", self.name, len(batch))
+            # let each caller's own query decide (and report the failure)
+            for future in batch.values():
+                future.set_result(True)
+            return
+        with self._cond:
+            if self._filter is not None:
+                for value in found:
+                    self._filter.add(value)
+        for value, future in batch.items():
+            _lookups.inc(filter=self.name, result="confirmed" if value in found else "rejected")
+            future.set_result(value in found)
+
+    def stats(self) -> dict:
+        bloom = self._filter
+        if bloom is None:
+            return {"loaded": False}
+        return {
+            "loaded": True,
+            "entries": bloom.count,
+            "capacity": bloom.capacity,
+            "bytes": bloom.size_bytes,
+            "hashes": bloom.hashes,
+            "false_positive_rate": round(bloom.false_positive_rate(), 6),
+        }
+
+    def reset(self):
+        with self._cond:
+            self._filter = None
+            self._rebuild = False
+
+
+trip_hashes = KnownIds("trip_hashes", Trip.hash_id, config.KNOWN_IDS_ERROR_RATE)
+user_tokens = KnownIds("user_tokens", User.token, config.KNOWN_IDS_ERROR_RATE)
+
+
+def load_known_ids():
+    """Build the filters; called at startup, before requests are served."""
+    if not config.KNOWN_IDS_FILTER:
+        return
+    for known in (trip_hashes, user_tokens):
+        try:
+            known.load()
+        except Exception:
+            # without a filter every lookup goes to the database, as before
+            logger.exception("%s: loading the filter failed", known.name)
+
+
+def get_trip_by_hash(db: Session, hash_id: str) -> Optional[Trip]:
+    if not trip_hashes.might_exist(hash_id):
+        return None
+    return db.query(Trip).filter(Trip.hash_id == hash_id).first()
+
+
+async def get_trip_by_hash_async(db: AsyncSession, hash_id: str) -> Optional[Trip]:
+    if not await trip_hashes.might_exist_async(hash_id):
+        return None
+    result = await db.execute(select(Trip).where(Trip.hash_id == hash_id))
+    return result.scalars().first()
@@ -0,0 +1,130 @@
+"""Latency-aware routing of chat messages across local models.
+
+Two tiers are supported: a small, fast model for short factual questions and
+an optional large model for long or planning-style requests. Every call's
+latency is recorded per model; while the large model's p95 over the recent
+window exceeds ``CHAT_LARGE_MODEL_P95_BUDGET`` its traffic is sent to the
+small model instead. Samples older than ``CHAT_LATENCY_WINDOW_SECONDS`` are
+dropped, so the large model is retried once the slow period has passed.
+"""
+import math
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from app.core import metrics
+from app.core.config import (
+    OLLAMA_SMALL_MODEL,
+    OLLAMA_LARGE_MODEL,
+    CHAT_LONG_PROMPT_CHARS,
+    CHAT_LARGE_MODEL_P95_BUDGET,
+    CHAT_LATENCY_WINDOW_SECONDS,
+)
+
+# requests that usually need multi-step reasoning or long answers
+_PLANNING_PATTERN = re.compile(
+    r"\b(itinerar\w*|plan(?:s|ning)?|schedule|day[- ]by[- ]day|day \d+|route|compare|"
+    r"budget|detailed|step[- ]by[- ]step|week[- ]long|agenda)\b",
+    re.IGNORECASE,
+)
+
+# don't judge the SLO on a handful of samples
+MIN_SAMPLES = 5
+MAX_SAMPLES = 500
+
+_latency = metrics.histogram(
+    "chat_model_latency_seconds", "Chat backend generation latency by model.", ("model",)
+)
+_requests = metrics.counter(
+    "chat_model_requests_total", "Chat requests routed to each model.", ("model", "reason")
+)
+_errors = metrics.counter(
+    "chat_model_errors_total", "Failed chat backend calls by model.", ("model",)
+)
+
+
+class LatencyWindow:
+    """Latencies observed within the last ``window_seconds``."""
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self._samples = deque(maxlen=MAX_SAMPLES)
+
+    def add(self, seconds: float, now: float = None):
+        self._samples.append((now if now is not None else time.monotonic(), seconds))
+
+    def _trim(self, now: float):
+        while self._samples and now - self._samples[0][0] > self.window_seconds:
+            self._samples.popleft()
+
+    def p95(self, now: float = None) -> Optional[float]:
+        self._trim(now if now is not None else time.monotonic())
+        if len(self._samples) < MIN_SAMPLES:
+            return None
+        values = sorted(v for _, v in self._samples)
+        return values[min(len(values) - 1, math.ceil(0.95 * len(values)) - 1)]
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        small_model: str,
+        large_model: str,
+        long_prompt_chars: int,
+        large_p95_budget: float,
+        window_seconds: float,
+    ):
+        self.small_model = small_model
+        self.large_model = large_model or None
+        self.long_prompt_chars = long_prompt_chars
+        self.large_p95_budget = large_p95_budget
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._windows: Dict[str, LatencyWindow] = {}
+
+    def _window(self, model: str) -> LatencyWindow:
+        window = self._windows.get(model)
+        if window is None:
+            window = self._windows[model] = LatencyWindow(self.window_seconds)
+        return window
+
+    def p95(self, model: str) -> Optional[float]:
+        with self._lock:
+            return self._window(model).p95()
+
+    def choose(self, message: str) -> Tuple[str, str]:
+        """Return ``(model, reason)`` for a user message."""
+        if not self.large_model:
+            model, reason = self.small_model, "single_model"
+        elif len(message) >= self.long_prompt_chars:
+            model, reason = self.large_model, "long_prompt"
+        elif _PLANNING_PATTERN.search(message):
+            model, reason = self.large_model, "planning_intent"
+        else:
+            model, reason = self.small_model, "short_question"
+
+        if model == self.large_model:
+            p95 = self.p95(model)
+            if p95 is not None and p95 > self.large_p95_budget:
+                model, reason = self.small_model, "slo_fallback"
+
+        _requests.inc(model=model, reason=reason)
+        return model, reason
+
+    def record(self, model: str, seconds: float, ok: bool = True):
+        with self._lock:
+            self._window(model).add(seconds)
+        _latency.observe(seconds, model=model)
+        if not ok:
+            _errors.inc(model=model)
+
+
+model_router = ModelRouter(
+    small_model=OLLAMA_SMALL_MODEL,
+    large_model=OLLAMA_LARGE_MODEL,
+    long_prompt_chars=CHAT_LONG_PROMPT_CHARS,
+    large_p95_budget=CHAT_LARGE_MODEL_P95_BUDGET,
+    window_seconds=CHAT_LATENCY_WINDOW_SECONDS,
+)
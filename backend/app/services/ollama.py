@@ -0,0 +1,103 @@
+"""Client for the Ollama generation API used by the trip chat assistant."""
+import asyncio
+import time
+from typing import Optional
+
+import httpx
+
+from app.core import tracing
+from app.core.admission import AdmissionController
+from app.core.circuit_breaker import CircuitBreaker, CircuitOpenError, run_health_probe
+from app.core.tracing import AsyncTracingTransport
+from app.core.config import (
+    OLLAMA_API_URL,
+    OLLAMA_MODEL,
+    OLLAMA_TIMEOUT,
+    OLLAMA_CONNECT_TIMEOUT,
+    CHAT_MAX_CONCURRENCY,
+    CHAT_MAX_QUEUE,
+    CHAT_MAX_QUEUED_PER_USER,
+    CHAT_QUEUE_TIMEOUT,
+    CHAT_BREAKER_FAILURE_THRESHOLD,
+    CHAT_BREAKER_SLOW_CALL_SECONDS,
+    CHAT_BREAKER_OPEN_SECONDS,
+    CHAT_HEALTH_PROBE_INTERVAL,
+)
+from app.services.model_router import model_router
+
+# Shared by every code path that calls the model so the concurrency cap holds
+# per process regardless of how the generation was requested.
+chat_admission = AdmissionController(
+    "chat",
+    max_concurrency=CHAT_MAX_CONCURRENCY,
+    max_queue=CHAT_MAX_QUEUE,
+    max_queued_per_user=CHAT_MAX_QUEUED_PER_USER,
+    queue_timeout=CHAT_QUEUE_TIMEOUT,
+)
+
+chat_breaker = CircuitBreaker(
+    "chat",
+    failure_threshold=CHAT_BREAKER_FAILURE_THRESHOLD,
+    slow_call_seconds=CHAT_BREAKER_SLOW_CALL_SECONDS,
+    open_seconds=CHAT_BREAKER_OPEN_SECONDS,
+)
+
+_probe_task: Optional[asyncio.Task] = None
+
+
+async def _post_generate(prompt: str, model: str) -> str:
+    timeout = httpx.Timeout(OLLAMA_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT)
+    async with httpx.AsyncClient(timeout=timeout, transport=AsyncTracingTransport()) as client:
+        response = await client.post(
+            f"{OLLAMA_API_URL}/api/generate",
+            json={"model": model, "prompt": prompt, "stream": False},
+        )
+        response.raise_for_status()
+    data = response.json()
+    return data.get("response", "").strip()
+
+
+async def generate(prompt: str, model: str = OLLAMA_MODEL) -> str:
+    """Run a single non-streaming generation and return the stripped text.
+
+    Raises ``CircuitOpenError`` without touching the network while the
+    backend is considered down, and ``httpx.HTTPError`` when the call fails.
+    Latency is recorded per model for routing decisions.
+    """
+    started = time.monotonic()
+    try:
+        with tracing.span("ollama.generate", model=model, prompt_chars=len(prompt)):
+            result = await chat_breaker.call(
+                lambda: _post_generate(prompt, model), failure_types=(httpx.HTTPError,)
+            )
+    except CircuitOpenError:
+        raise
+    except Exception:
+        model_router.record(model, time.monotonic() - started, ok=False)
+        raise
+    model_router.record(model, time.monotonic() - started)
+    return result
+
+
+async def check_health() -> bool:
+    """Probe the backend's model list; cheap and independent of generation."""
+    timeout = httpx.Timeout(OLLAMA_CONNECT_TIMEOUT)
+    async with httpx.AsyncClient(timeout=timeout, transport=AsyncTracingTransport()) as client:
+        response = await client.get(f"{OLLAMA_API_URL}/api/tags")
+    return response.status_code == 200
+
+
+async def start_health_probe():
+    global _probe_task
+    if _probe_task is None:
+        _probe_task = asyncio.create_task(
+            run_health_probe(chat_breaker, check_health, CHAT_HEALTH_PROBE_INTERVAL)
+        )
+
+
+async def stop_health_probe():
+    global _probe_task
+    task, _probe_task = _probe_task, None
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
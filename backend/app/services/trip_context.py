@@ -0,0 +1,171 @@
+"""Compact trip summary used as context for the AI assistant.
+
+The summary covers members, the best date windows from the shared calendar,
+spending totals and the trip description. It is cached per ``(trip.id,
+trip.version)``: the version is bumped by every write to the trip's data, so
+a cached summary is reused until something it depends on changes and chat
+requests don't re-run these queries on every message.
+"""
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+from typing import List, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core import metrics
+from app.core.singleflight import AsyncSingleFlight
+from app.core.config import CHAT_CONTEXT_CACHE_SIZE
+from app.models.trip import Trip
+from app.models.trip_date import TripDate
+from app.models.user_availability import UserAvailability
+from app.models.user_trip import UserTrip
+from app.models.expense import Expense
+
+# keep the prompt short: small models have small context windows
+MAX_LISTED_MEMBERS = 10
+MAX_DATE_WINDOWS = 3
+MAX_LISTED_PAYERS = 3
+
+
+def _date_windows(counts: List[Tuple]) -> List[Tuple]:
+    """Group consecutive dates with the same number of free members.
+
+    ``counts`` is a date-ordered list of ``(date, free_count)``; returns
+    ``(start, end, free_count)`` runs, best first.
+    """
+    runs = []
+    for day, count in counts:
+        if count <= 0:
+            continue
+        if runs and runs[-1][2] == count and runs[-1][1] + timedelta(days=1) == day:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day, count])
+    runs.sort(key=lambda r: (-r[2], -(r[1] - r[0]).days, r[0]))
+    return [tuple(r) for r in runs]
+
+
+def build_trip_context(db: Session, trip: Trip) -> str:
+    """Query the trip's data and render the summary (uncached)."""
+    members = (
+        db.query(UserTrip.user_id, UserTrip.user_name)
+        .filter(UserTrip.trip_id == trip.id)
+        .order_by(UserTrip.id)
+        .all()
+    )
+    names = {user_id: name for user_id, name in members}
+
+    # only current members count: removing one leaves their availability behind
+    free_counts = (
+        db.query(TripDate.date, func.count(UserAvailability.id))
+        .join(UserAvailability, UserAvailability.trip_date_id == TripDate.id)
+        .join(
+            UserTrip,
+            (UserTrip.trip_id == TripDate.trip_id) & (UserTrip.user_id == UserAvailability.user_id),
+        )
+        .filter(TripDate.trip_id == trip.id, UserAvailability.status == "available")
+        .group_by(TripDate.date)
+        .order_by(TripDate.date)
+        .all()
+    )
+
+    paid = (
+        db.query(
+            Expense.payer_user_id,
+            Expense.currency,
+            func.sum(Expense.amount),
+            func.count(Expense.id),
+        )
+        .filter(Expense.trip_id == trip.id)
+        .group_by(Expense.payer_user_id, Expense.currency)
+        .all()
+    )
+
+    lines = [f'You are a helpful AI travel assistant for the trip "{trip.title}".']
+
+    member_line = f"The trip has {len(members)} members"
+    if members:
+        listed = ", ".join(name for _, name in members[:MAX_LISTED_MEMBERS])
+        if len(members) > MAX_LISTED_MEMBERS:
+            listed += ", ..."
+        member_line += f": {listed}"
+    lines.append(member_line + ".")
+
+    if trip.date_start and trip.date_end:
+        lines.append(f"The trip is planned from {trip.date_start} to {trip.date_end}.")
+
+    windows = _date_windows(free_counts)[:MAX_DATE_WINDOWS]
+    if windows:
+        parts = []
+        for start, end, count in windows:
+            span = str(start) if start == end else f"{start} to {end}"
+            parts.append(f"{span} ({count}/{len(members)} free)")
+        lines.append("Best dates so far: " + "; ".join(parts) + ".")
+
+    if paid:
+        totals = defaultdict(float)
+        expense_count = 0
+        by_payer = defaultdict(float)
+        for payer_id, currency, amount, count in paid:
+            totals[currency] += amount or 0.0
+            expense_count += count
+            by_payer[(payer_id, currency)] += amount or 0.0
+        spent = ", ".join(f"{amount:.2f} {cur}" for cur, amount in sorted(totals.items()))
+        lines.append(f"Spending: {spent} across {expense_count} expenses.")
+        top = sorted(by_payer.items(), key=lambda kv: kv[1], reverse=True)
+        payers = ", ".join(
+            f"{names.get(payer_id, f'user {payer_id}')} {amount:.2f} {cur}"
+            for (payer_id, cur), amount in top[:MAX_LISTED_PAYERS]
+        )
+        lines.append(f"Top payers: {payers}.")
+
+    if trip.description:
+        lines.append(f"Trip description: {trip.description}")
+
+    return "\n".join(lines)
+
+
+class TripContextCache:
+    """Bounded LRU of rendered summaries keyed by trip id, tagged with version."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Tuple[int, str]]" = OrderedDict()
+        self._hits = metrics.counter(
+            "trip_context_cache_hits_total", "Trip context summaries served from cache."
+        )
+        self._misses = metrics.counter(
+            "trip_context_cache_misses_total", "Trip context summaries rebuilt."
+        )
+        metrics.cache_hit_ratio("trip_context", self._hits, self._misses)
+
+    def get(self, db: Session, trip: Trip) -> str:
+        with self._lock:
+            entry = self._entries.get(trip.id)
+            if entry is not None and entry[0] == trip.version:
+                self._entries.move_to_end(trip.id)
+                self._hits.inc()
+                return entry[1]
+        self._misses.inc()
+        context = build_trip_context(db, trip)
+        with self._lock:
+            self._entries[trip.id] = (trip.version, context)
+            self._entries.move_to_end(trip.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return context
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+trip_context_cache = TripContextCache(CHAT_CONTEXT_CACHE_SIZE)
+trip_context_flight = AsyncSingleFlight("trip_context")
+
+
+def get_trip_context(db: Session, trip: Trip) -> str:
+    return trip_context_cache.get(db, trip)
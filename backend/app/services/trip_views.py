@@ -0,0 +1,477 @@
+"""Read models for a trip's calendar, dates, members and ledger.
+
+Each ``build_*`` function renders one read endpoint's payload as plain JSON
+data from a session and a trip, so the routers, the response cache and any
+endpoint that combines several views share one implementation.
+
+``cached_response`` serves those payloads through the per-trip response
+cache, and ``snapshot_response`` splices several cached payloads into one
+document. Entries are tagged with ``trip.version``, which every write bumps, so
+invalidation needs no coordination between workers. The same version yields
+the response's ETag, so a client holding the current copy gets a 304 before
+anything is looked up or built.
+
+With ``FAST_JSON_LISTS`` (and orjson installed), ``expenses_view`` switches
+the expense list to ``build_expenses_rows``/``encode_fast_json``: one Core
+query and a direct orjson encode, producing the same bytes.
+"""
+import json
+from collections import defaultdict
+from datetime import date
+from functools import partial
+from typing import Callable, Collection, List, Optional, Sequence, Tuple
+
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from pydantic_core import to_jsonable_python
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+try:
+    import orjson
+except ImportError:  # optional: only the fast list path needs it
+    orjson = None
+
+from app.core import tracing
+from app.core.etag import make_etag, etag_matches, etag_headers, not_modified
+from app.core.fieldsets import select_fields
+from app.core.config import (
+    RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_STALE_BUDGET,
+    RESPONSE_CACHE_REFRESH_WORKERS,
+    FAST_JSON_LISTS,
+)
+from app.core.response_cache import ResponseCache
+from app.db.replica import primary_pinned
+from app.db.session import batch_session
+from app.models.trip import Trip
+from app.models.trip_date import TripDate
+from app.models.user_availability import UserAvailability
+from app.models.user_trip import UserTrip
+from app.models.user import User
+from app.models.expense import Expense, ExpenseShare
+from app.schemas.trips import TripRead
+from app.schemas.dates import TripDateRead
+from app.schemas.user_trips import UserTripRead
+from app.schemas.expenses import ExpenseRead, DebtorRead, SettlementRead, SettlementsResponse
+
+response_cache = ResponseCache(
+    "trip_response",
+    max_bytes=RESPONSE_CACHE_MAX_BYTES,
+    stale_budget=RESPONSE_CACHE_STALE_BUDGET,
+    refresh_workers=RESPONSE_CACHE_REFRESH_WORKERS,
+)
+
+
+def build_trip(db: Session, trip: Trip) -> dict:
+    return jsonable_encoder(TripRead.model_validate(trip))
+
+
+def build_dates(db: Session, trip: Trip) -> list:
+    rows = db.query(TripDate).filter(TripDate.trip_id == trip.id).order_by(TripDate.date).all()
+    return jsonable_encoder([TripDateRead.model_validate(r) for r in rows])
+
+
+def build_members(db: Session, trip: Trip) -> list:
+    rows = db.query(UserTrip).filter(UserTrip.trip_id == trip.id).all()
+    return jsonable_encoder([UserTripRead.model_validate(r) for r in rows])
+
+
+def build_calendar(
+    db: Session,
+    trip: Trip,
+    user_ids: Optional[Collection[int]] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+) -> dict:
+    """Availability grid of a trip, optionally limited to some members and a date window."""
+    def window(query):
+        if date_from is not None:
+            query = query.filter(TripDate.date >= date_from)
+        if date_to is not None:
+            query = query.filter(TripDate.date <= date_to)
+        return query
+
+    def of_users(query, column):
+        return query if user_ids is None else query.filter(column.in_(user_ids))
+
+    # dates
+    dates = window(db.query(TripDate).filter(TripDate.trip_id == trip.id)).order_by(TripDate.date).all()
+    dates_list = [d.date.isoformat() for d in dates]
+
+    with tracing.span('calendar.assemble', dates=len(dates)):
+        # members
+        members = (
+            of_users(
+                db.query(UserTrip, User)
+                .join(User, User.id == UserTrip.user_id)
+                .filter(UserTrip.trip_id == trip.id),
+                UserTrip.user_id,
+            )
+            .order_by(UserTrip.id)
+            .all()
+        )
+        users = [{ 'id': str(u.id), 'displayName': m.user_name or u.user_id } for m, u in members]
+
+        # availability map
+        availability = {}
+        for m, _ in members:
+            availability[str(m.user_id)] = { day: 'unset' for day in dates_list }
+
+        rows = of_users(
+            window(
+                db.query(UserAvailability.user_id, TripDate.date, UserAvailability.status)
+                .join(TripDate, UserAvailability.trip_date_id == TripDate.id)
+                .filter(TripDate.trip_id == trip.id)
+            ),
+            UserAvailability.user_id,
+        ).all()
+        for user_id, day, status in rows:
+            availability.setdefault(str(user_id), {})[day.isoformat()] = status
+
+    return { 'dates': dates_list, 'users': users, 'availability': availability }
+
+
+def _shares_by_expense(db: Session, trip: Trip) -> dict:
+    """All expense shares of a trip in one query, grouped by expense id."""
+    shares = defaultdict(list)
+    rows = (
+        db.query(ExpenseShare)
+        .join(Expense, Expense.id == ExpenseShare.expense_id)
+        .filter(Expense.trip_id == trip.id)
+        .order_by(ExpenseShare.id)
+        .all()
+    )
+    for share in rows:
+        shares[share.expense_id].append(share)
+    return shares
+
+
+def build_expenses(db: Session, trip: Trip) -> list:
+    """All expenses of a trip with their shares, newest first."""
+    expenses = (
+        db.query(Expense)
+        .filter(Expense.trip_id == trip.id)
+        .order_by(Expense.created_at.desc(), Expense.id.desc())
+        .all()
+    )
+
+    shares_by_expense = _shares_by_expense(db, trip) if expenses else {}
+
+    result = []
+    for expense in expenses:
+        shares = shares_by_expense.get(expense.id, [])
+        result.append(
+            ExpenseRead(
+                id=str(expense.id),
+                tripId=trip.hash_id,
+                payerId=str(expense.payer_user_id),
+                amount=expense.amount,
+                currency=expense.currency,
+                description=expense.description,
+                debtors=[
+                    DebtorRead(
+                        userId=str(share.user_id),
+                        shareType=share.share_type,
+                        value=share.value,
+                    )
+                    for share in shares
+                ],
+                createdAt=expense.created_at,
+            )
+        )
+
+    return jsonable_encoder(result)
+
+
+class FastRows(list):
+    """Rows whose builder checked each float with ``plain_float`` on the way."""
+
+    plain_floats = True
+
+
+def plain_float(value: float) -> bool:
+    """Whether orjson writes ``value`` exactly as json does: no exponent, finite."""
+    return value == 0 or 1e-4 <= abs(value) < 1e16
+
+
+def build_expenses_rows(db: Session, trip: Trip) -> FastRows:
+    """``build_expenses`` from a single Core query, without ORM or Pydantic objects.
+
+    Meant for ``encode_fast_json``: ``createdAt`` stays a datetime.
+    """
+    rows = db.execute(
+        select(
+            Expense.id,
+            Expense.payer_user_id,
+            Expense.amount,
+            Expense.currency,
+            Expense.description,
+            Expense.created_at,
+            ExpenseShare.user_id,
+            ExpenseShare.share_type,
+            ExpenseShare.value,
+        )
+        .outerjoin(ExpenseShare, ExpenseShare.expense_id == Expense.id)
+        .where(Expense.trip_id == trip.id)
+        .order_by(Expense.created_at.desc(), Expense.id.desc(), ExpenseShare.id)
+    )
+
+    result = FastRows()
+    current = None
+    for expense_id, payer_id, amount, currency, description, created_at, user_id, share_type, value in rows:
+        if expense_id != current:
+            current = expense_id
+            debtors = []
+            amount = float(amount)
+            if not plain_float(amount):
+                result.plain_floats = False
+            result.append({
+                "id": str(expense_id),
+                "tripId": trip.hash_id,
+                "payerId": str(payer_id),
+                "amount": amount,
+                "currency": currency,
+                "description": description,
+                "debtors": debtors,
+                "createdAt": created_at,
+            })
+        if user_id is not None:
+            value = float(value)
+            if not plain_float(value):
+                result.plain_floats = False
+            debtors.append({"userId": str(user_id), "shareType": share_type, "value": value})
+    return result
+
+
+def match_settlements(balances, currency: str) -> List[SettlementRead]:
+    """Greedily pair the largest debtors with the largest creditors."""
+    # Separate creditors (positive balance) and debtors (negative balance)
+    creditors = [
+        (user_id, amount) for user_id, amount in balances.items() if amount > 0.01
+    ]
+    debtors = [
+        (user_id, -amount) for user_id, amount in balances.items() if amount < -0.01
+    ]
+
+    # Sort by amount (largest first) for greedy algorithm
+    creditors.sort(key=lambda x: x[1], reverse=True)
+    debtors.sort(key=lambda x: x[1], reverse=True)
+
+    # Calculate settlements using greedy algorithm
+    settlements = []
+    i, j = 0, 0
+
+    while i < len(creditors) and j < len(debtors):
+        creditor_id, credit_amount = creditors[i]
+        debtor_id, debt_amount = debtors[j]
+
+        # Settle the minimum of what's owed and what's due
+        settle_amount = min(credit_amount, debt_amount)
+
+        settlements.append(
+            SettlementRead(
+                fromUser=str(debtor_id),
+                toUser=str(creditor_id),
+                amount=round(settle_amount, 2),
+                currency=currency,
+            )
+        )
+
+        # Update remaining amounts
+        creditors[i] = (creditor_id, credit_amount - settle_amount)
+        debtors[j] = (debtor_id, debt_amount - settle_amount)
+
+        # Move to next creditor or debtor if fully settled
+        if creditors[i][1] < 0.01:
+            i += 1
+        if debtors[j][1] < 0.01:
+            j += 1
+
+    return settlements
+
+
+def build_settlements(db: Session, trip: Trip) -> dict:
+    """Who owes whom, using a greedy algorithm to minimize transactions."""
+    # Get all expenses for this trip
+    expenses = db.query(Expense).filter(Expense.trip_id == trip.id).all()
+
+    if not expenses:
+        return jsonable_encoder(SettlementsResponse(balances=[]))
+
+    # Assume all expenses are in the same currency (use the first expense's currency)
+    currency = expenses[0].currency
+
+    # Calculate net balance for each user
+    # Positive balance = they should receive money
+    # Negative balance = they owe money
+    balances = defaultdict(float)
+    shares_by_expense = _shares_by_expense(db, trip)
+
+    for expense in expenses:
+        # Payer paid the full amount
+        balances[expense.payer_user_id] += expense.amount
+
+        # Each debtor owes their share
+        for share in shares_by_expense.get(expense.id, []):
+            balances[share.user_id] -= share.value
+
+    with tracing.span("settlements.match", balances=len(balances)):
+        settlements = match_settlements(balances, currency)
+
+    return jsonable_encoder(SettlementsResponse(balances=settlements))
+
+
+def encode_json(data) -> bytes:
+    """Encode like FastAPI's JSONResponse so cached bodies are byte-identical."""
+    return json.dumps(
+        data, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def _plain_floats(data) -> bool:
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        kind = type(value)
+        if kind is float:
+            if not plain_float(value):
+                return False
+        elif kind is dict:
+            stack.extend(value.values())
+        elif kind is list or kind is FastRows:
+            stack.extend(value)
+    return True
+
+
+def encode_fast_json(data) -> bytes:
+    """Same bytes as ``encode_json`` of the equivalent Pydantic dump, via orjson.
+
+    Datetimes are encoded like Pydantic does (UTC as ``Z``). Payloads with
+    floats that the two encoders format differently (orjson writes 1e16 and
+    0.00001 where json writes 1e+16 and 1e-05) take the slow path. ``FastRows``
+    already know whether they hold any; other payloads are walked to find out.
+    """
+    plain = data.plain_floats if isinstance(data, FastRows) else _plain_floats(data)
+    if not plain:
+        return encode_json(to_jsonable_python(data))
+    return orjson.dumps(data, option=orjson.OPT_UTC_Z)
+
+
+def expenses_view():
+    """The ``(build, encoder)`` pair serving the expense list."""
+    if FAST_JSON_LISTS and orjson is not None:
+        return build_expenses_rows, encode_fast_json
+    return build_expenses, encode_json
+
+
+def cached_body(
+    route: str,
+    db: Session,
+    trip: Trip,
+    build: Callable,
+    params: tuple = (),
+    encoder: Callable = encode_json,
+) -> Tuple[int, bytes]:
+    """``(version, body)``: encoded ``build(db, trip)``, cached per ``trip.version``.
+
+    The version is that of the body returned, which lags ``trip.version``
+    while a stale body is served during a slow or failed rebuild. Callers
+    pinned to the primary after a write never get a stale body.
+    """
+    if db is batch_session.get():
+        # a transactional batch may still roll back the version it sees
+        return trip.version, encoder(build(db, trip))
+    trip_id = trip.id
+    bind = db.get_bind()
+
+    def refresh():
+        # runs on a cache worker thread: it must not share the request session
+        with Session(bind=bind) as session:
+            return encoder(build(session, session.get(Trip, trip_id)))
+
+    return response_cache.get(
+        (route, trip_id, params),
+        trip.version,
+        lambda: encoder(build(db, trip)),
+        refresh,
+        allow_stale=not primary_pinned.get(),
+    )
+
+
+def _build_fields(build: Callable, fields: Tuple[str, ...], db: Session, trip: Trip):
+    return select_fields(build(db, trip), fields)
+
+
+def trip_etag(route: str, trip: Trip, params: tuple = (), version: Optional[int] = None) -> str:
+    """ETag of ``route`` for ``trip``, at ``version`` if given (default: current)."""
+    return make_etag(route, trip.id, trip.version if version is None else version, *params)
+
+
+def cached_response(
+    route: str,
+    db: Session,
+    trip: Trip,
+    build: Callable,
+    params: tuple = (),
+    if_none_match: Optional[str] = None,
+    fields: Optional[Tuple[str, ...]] = None,
+    encoder: Callable = encode_json,
+) -> Response:
+    """``build``'s payload as a conditional, cached JSON response.
+
+    ``params`` must identify any arguments bound into ``build``; they are part
+    of the cache key and the ETag. ``fields`` trims the payload to a sparse
+    fieldset (see ``app.core.fieldsets``). ``encoder`` must produce the same
+    bytes as ``encode_json`` for the same payload, since entries are shared.
+    """
+    if fields is not None:
+        build = partial(_build_fields, build, fields)
+        params = params + (("fields",) + fields,)
+    etag = trip_etag(route, trip, params)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    version, body = cached_body(route, db, trip, build, params, encoder)
+    return Response(
+        content=body,
+        media_type="application/json",
+        # label the body with the version it was built at, not the current one
+        headers=etag_headers(trip_etag(route, trip, params, version)),
+    )
+
+
+# sections of a trip snapshot, in document order; each key is also the
+# route name its payload is cached under, so the snapshot and the single
+# endpoints share entries
+SNAPSHOT_SECTIONS = {
+    "trip": build_trip,
+    "members": build_members,
+    "calendar": build_calendar,
+    "expenses": build_expenses,
+    "settlements": build_settlements,
+}
+
+
+def snapshot_response(
+    db: Session,
+    trip: Trip,
+    sections: Sequence[str],
+    if_none_match: Optional[str] = None,
+) -> Response:
+    """One JSON object holding the requested sections, under a single ETag.
+
+    ``sections`` must be in ``SNAPSHOT_SECTIONS`` order. The body is spliced
+    together from the cached, already encoded payloads of each section.
+    """
+    etag = trip_etag("snapshot", trip, tuple(sections))
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    bodies = [(name, cached_body(name, db, trip, SNAPSHOT_SECTIONS[name])) for name in sections]
+    parts = [encode_json(name) + b":" + body for name, (_, body) in bodies]
+    # a stale section makes the whole document as old as that section
+    version = min(version for _, (version, _) in bodies)
+    return Response(
+        content=b"{" + b",".join(parts) + b"}",
+        media_type="application/json",
+        headers=etag_headers(trip_etag("snapshot", trip, tuple(sections), version)),
+    )
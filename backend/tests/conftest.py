@@ -3,13 +3,20 @@
 import pytest
 from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from fastapi.testclient import TestClient
 
-from app.db.session import Base, get_db
+from app.db.session import Base, get_db, get_async_db, batch_session
+from app.db.replica import get_read_db, get_async_read_db
 from app.main import app
 from app.models.user import User
 from app.models.trip import Trip
 from app.models.user_trip import UserTrip
+from app.core.rate_limit import get_store
+from app.services.known_ids import trip_hashes, user_tokens
+from app.services.trip_context import trip_context_cache
+from app.services.trip_views import response_cache
 
 
 # Use in-memory SQLite for testing
@@ -19,6 +26,17 @@ engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# the identifier filters load and look up values on their own sessions
+trip_hashes.session_factory = user_tokens.session_factory = TestingSessionLocal
+
+# Async endpoints read the same SQLite file through aiosqlite. NullPool keeps
+# connections from outliving the event loop of a single TestClient.
+async_engine = create_async_engine(
+    "sqlite+aiosqlite:///./test.db", poolclass=NullPool
+)
+TestingAsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
 
 
 # Workaround for SQLite not supporting ARRAY type
@@ -69,17 +87,38 @@ def db_session():
         Base.metadata.drop_all(bind=engine)
 
 
+@pytest.fixture(autouse=True)
+def reset_caches():
+    """Drop in-process caches; ids and versions restart with every fresh DB."""
+    for known in (trip_hashes, user_tokens):
+        # rebuilt from the test database when a client starts the app
+        known.reset()
+    yield
+    trip_context_cache.clear()
+    response_cache.clear()
+    get_store().reset()
+
+
 @pytest.fixture(scope="function")
 def client(db_session):
     """Create a test client with database dependency override."""
 
     def override_get_db():
         try:
-            yield db_session
+            # a transactional batch brings its own session, as with get_db
+            shared = batch_session.get()
+            yield shared if shared is not None else db_session
         finally:
             pass
 
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as session:
+            yield session
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    app.dependency_overrides[get_async_read_db] = override_get_async_db
     with TestClient(app) as test_client:
         yield test_client
     app.dependency_overrides.clear()
@@ -152,3 +191,32 @@ def auth_headers(test_user):
 def auth_headers2(test_user2):
     """Return authentication headers for the second test user."""
     return {"X-User-Hash": test_user2.token}
+
+
+def _statement_count(server_timing):
+    """Pull the statement count out of the ``db`` Server-Timing metric."""
+    for metric in (server_timing or "").split(","):
+        name, *params = [p.strip() for p in metric.split(";")]
+        if name == "db":
+            for param in params:
+                if param.startswith("desc="):
+                    return int(param[len('desc="'):].split()[0])
+    raise AssertionError(f"no db metric in Server-Timing: {server_timing!r}")
+
+
+@pytest.fixture
+def query_budget(client):
+    """Issue a request and assert it ran at most ``max_statements`` SQL statements."""
+
+    def request(method, url, max_statements, **kwargs):
+        # budgets are for a warm worker, whose filters are already loaded
+        for known in (trip_hashes, user_tokens):
+            known.load()
+        response = client.request(method, url, **kwargs)
+        used = _statement_count(response.headers.get("server-timing"))
+        assert used <= max_statements, (
+            f"{method} {url} ran {used} SQL statements (budget {max_statements})"
+        )
+        return response
+
+    return request
@@ -274,6 +274,79 @@ class TestGetCalendar:
         assert response.status_code == 200
 
 
+class TestCalendarWindow:
+    """Tests for the users/from/to filters of GET /trips/{trip_hash}/calendar."""
+
+    @pytest.fixture
+    def calendar_trip(self, db_session, test_trip_with_multiple_users, test_user, test_user2):
+        trip = test_trip_with_multiple_users
+        for day in range(1, 6):
+            trip_date = TripDate(trip_id=trip.id, date=date(2026, 8, day))
+            db_session.add(trip_date)
+            db_session.flush()
+            db_session.add_all([
+                UserAvailability(trip_date_id=trip_date.id, user_id=test_user.id, status="available"),
+                UserAvailability(trip_date_id=trip_date.id, user_id=test_user2.id, status="maybe"),
+            ])
+        db_session.commit()
+        return trip
+
+    def test_own_row(self, client, calendar_trip, test_user, auth_headers):
+        """Test users=me returns only the caller's row."""
+        response = client.get(
+            f"/api/v1/trips/{calendar_trip.hash_id}/calendar?users=me", headers=auth_headers
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert [u["id"] for u in data["users"]] == [str(test_user.id)]
+        assert list(data["availability"]) == [str(test_user.id)]
+        assert len(data["dates"]) == 5
+
+    def test_me_requires_auth(self, client, calendar_trip):
+        """Test users=me needs X-User-Hash."""
+        response = client.get(f"/api/v1/trips/{calendar_trip.hash_id}/calendar?users=me")
+
+        assert response.status_code == 401
+
+    def test_user_ids(self, client, calendar_trip, test_user2):
+        """Test selecting members by id."""
+        response = client.get(
+            f"/api/v1/trips/{calendar_trip.hash_id}/calendar?users={test_user2.id}"
+        )
+
+        assert list(response.json()["availability"]) == [str(test_user2.id)]
+
+    def test_invalid_users(self, client, calendar_trip):
+        """Test unparseable users values are rejected."""
+        response = client.get(f"/api/v1/trips/{calendar_trip.hash_id}/calendar?users=bob")
+
+        assert response.status_code == 400
+
+    def test_date_window(self, client, calendar_trip, test_user):
+        """Test from/to limit dates and availability to the window, inclusive."""
+        response = client.get(
+            f"/api/v1/trips/{calendar_trip.hash_id}/calendar?from=2026-08-02&to=2026-08-03"
+        )
+
+        data = response.json()
+        assert data["dates"] == ["2026-08-02", "2026-08-03"]
+        assert data["availability"][str(test_user.id)] == {
+            "2026-08-02": "available",
+            "2026-08-03": "available",
+        }
+
+    def test_window_has_own_etag(self, client, calendar_trip, auth_headers):
+        """Test filtered views are cached and validated separately from the full grid."""
+        url = f"/api/v1/trips/{calendar_trip.hash_id}/calendar"
+        full = client.get(url, headers=auth_headers)
+        window = client.get(f"{url}?from=2026-08-04", headers=auth_headers)
+
+        assert full.headers["etag"] != window.headers["etag"]
+        assert len(window.json()["dates"]) == 2
+        assert len(client.get(url, headers=auth_headers).json()["dates"]) == 5
+
+
 class TestAvailabilityStatuses:
     """Tests for different availability status values."""
 
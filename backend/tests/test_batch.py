@@ -0,0 +1,222 @@
+"""Tests for the POST /batch endpoint."""
+
+from datetime import date
+
+from app.models.expense import Expense
+from app.models.trip_date import TripDate
+from app.routers import batch as batch_router
+
+
+def _expense(user, description="Lunch", amount=20):
+    return {
+        "amount": amount,
+        "description": description,
+        "currency": "EUR",
+        "debtors": [{"userId": str(user.id), "shareType": "equal", "value": amount}],
+    }
+
+
+class TestBatch:
+    """Tests for POST /batch."""
+
+    def test_items_run_in_order(self, client, test_trip, test_user, auth_headers):
+        """Test a write is visible to a later read and each item reports its own result."""
+        url = f"/api/v1/trips/{test_trip.hash_id}/expenses"
+        response = client.post(
+            "/api/v1/batch",
+            json={"requests": [
+                {"method": "POST", "path": url, "body": _expense(test_user)},
+                {"method": "GET", "path": url},
+                {"method": "GET", "path": "/api/v1/trips/missing/expenses"},
+            ]},
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["committed"] is None
+        created, listed, missing = data["responses"]
+        assert created["status"] == 200
+        assert created["body"]["description"] == "Lunch"
+        assert listed["status"] == 200
+        assert [e["id"] for e in listed["body"]] == [created["body"]["id"]]
+        assert missing == {"status": 404, "body": {"detail": "Trip not found"}}
+
+    def test_requires_auth(self, client, test_trip):
+        """Test the batch itself must be authenticated."""
+        response = client.post(
+            "/api/v1/batch",
+            json={"requests": [{"method": "GET", "path": "/api/v1/trips"}]},
+        )
+
+        assert response.status_code == 401
+
+    def test_authenticates_once(self, query_budget, test_trip, auth_headers):
+        """Test items reuse the batch's user instead of looking it up again."""
+        members = {"method": "GET", "path": f"/api/v1/trips/{test_trip.hash_id}/members"}
+        query_budget("POST", "/api/v1/batch", 3, json={"requests": [members]}, headers=auth_headers)
+
+        # one user lookup for the batch, then one trip lookup per cached read
+        response = query_budget(
+            "POST", "/api/v1/batch", 4, json={"requests": [members] * 3}, headers=auth_headers
+        )
+        assert [r["status"] for r in response.json()["responses"]] == [200, 200, 200]
+
+    def test_async_endpoint_and_query_string(self, client, test_trip, auth_headers):
+        """Test items reach async handlers and get their query parameters."""
+        response = client.post(
+            "/api/v1/batch",
+            json={"requests": [
+                {"method": "GET", "path": f"/api/v1/trips/{test_trip.hash_id}"},
+                {"method": "GET", "path": "/api/v1/dashboard?limit=1"},
+            ]},
+            headers=auth_headers,
+        )
+
+        trip, dashboard = response.json()["responses"]
+        assert trip["body"]["hash_id"] == test_trip.hash_id
+        assert dashboard["body"]["limit"] == 1
+
+    def test_item_headers(self, client, test_trip, auth_headers):
+        """Test item headers such as If-None-Match are passed through."""
+        url = f"/api/v1/trips/{test_trip.hash_id}/members"
+        etag = client.get(url, headers=auth_headers).headers["etag"]
+
+        response = client.post(
+            "/api/v1/batch",
+            json={"requests": [{"method": "GET", "path": url, "headers": {"If-None-Match": etag}}]},
+            headers=auth_headers,
+        )
+
+        assert response.json()["responses"] == [{"status": 304, "body": None}]
+
+    def test_unencodable_header_per_item(self, client, test_trip, auth_headers):
+        """Test a header that can't be sent over HTTP fails its own item, not the batch."""
+        url = f"/api/v1/trips/{test_trip.hash_id}/members"
+        response = client.post(
+            "/api/v1/batch",
+            json={"requests": [
+                {"method": "GET", "path": url, "headers": {"If-None-Match": "\u0142"}},
+                {"method": "GET", "path": url},
+            ]},
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        assert [r["status"] for r in response.json()["responses"]] == [400, 200]
+
+    def test_reads_after_write_skip_stale_cache(self, client, db_session, test_trip, test_user, auth_headers, monkeypatch):
+        """Test a read after a write in the same batch sees the write, even while rebuilds fail."""
+        db_session.add(TripDate(trip_id=test_trip.id, date=date(2026, 7, 15)))
+        db_session.commit()
+        calendar = f"/api/v1/trips/{test_trip.hash_id}/calendar"
+        assert client.get(calendar).json()["availability"][str(test_user.id)]["2026-07-15"] == "unset"
+
+        def unavailable(*args, **kwargs):
+            raise RuntimeError("database unavailable")
+
+        # a background rebuild would fail and fall back to the old body
+        monkeypatch.setattr("app.services.trip_views.Session", unavailable)
+        response = client.post(
+            "/api/v1/batch",
+            json={"requests": [
+                {
+                    "method": "POST",
+                    "path": f"/api/v1/trips/{test_trip.hash_id}/availability",
+                    "body": {"updates": [{"date": "2026-07-15", "status": "available"}]},
+                },
+                {"method": "GET", "path": calendar},
+            ]},
+            headers=auth_headers,
+        )
+
+        updated, read = response.json()["responses"]
+        assert updated == {"status": 200, "body": {"updated": 1}}
+        assert read["body"]["availability"][str(test_user.id)]["2026-07-15"] == "available"
+
+    def test_validation_error_per_item(self, client, test_trip, auth_headers):
+        """Test an invalid item body yields a 422 for that item only."""
+        response = client.post(
+            "/api/v1/batch",
+            json={"requests": [
+                {"method": "POST", "path": f"/api/v1/trips/{test_trip.hash_id}/expenses", "body": {}},
+                {"method": "GET", "path": "/api/v1/trips"},
+            ]},
+            headers=auth_headers,
+        )
+
+        assert [r["status"] for r in response.json()["responses"]] == [422, 200]
+
+    def test_rejects_foreign_and_nested_paths(self, client, test_user, auth_headers):
+        """Test only API paths other than the batch itself are dispatched."""
+        response = client.post(
+            "/api/v1/batch",
+            json={"requests": [
+                {"method": "GET", "path": "/health"},
+                {"method": "POST", "path": "/api/v1/batch", "body": {"requests": []}},
+            ]},
+            headers=auth_headers,
+        )
+
+        assert [r["status"] for r in response.json()["responses"]] == [400, 400]
+
+    def test_too_many_requests(self, client, test_user, auth_headers, monkeypatch):
+        """Test the per-batch item limit."""
+        monkeypatch.setattr(batch_router, "BATCH_MAX_REQUESTS", 2)
+        item = {"method": "GET", "path": "/api/v1/trips"}
+
+        response = client.post("/api/v1/batch", json={"requests": [item] * 3}, headers=auth_headers)
+
+        assert response.status_code == 400
+
+
+class TestTransactionalBatch:
+    """Tests for POST /batch with transaction=true."""
+
+    def test_commits_when_all_succeed(self, client, db_session, test_trip, test_user, auth_headers):
+        """Test all writes are kept and later items see earlier ones."""
+        url = f"/api/v1/trips/{test_trip.hash_id}/expenses"
+        response = client.post(
+            "/api/v1/batch",
+            json={
+                "transaction": True,
+                "requests": [
+                    {"method": "POST", "path": url, "body": _expense(test_user, "Taxi")},
+                    {"method": "POST", "path": url, "body": _expense(test_user, "Museum")},
+                    {"method": "GET", "path": url},
+                ],
+            },
+            headers=auth_headers,
+        )
+
+        data = response.json()
+        assert data["committed"] is True
+        assert [r["status"] for r in data["responses"]] == [200, 200, 200]
+        assert len(data["responses"][2]["body"]) == 2
+        assert db_session.query(Expense).count() == 2
+
+    def test_rolls_back_on_failure(self, client, db_session, test_trip, test_user, auth_headers):
+        """Test a failing item undoes earlier writes and skips later items."""
+        url = f"/api/v1/trips/{test_trip.hash_id}/expenses"
+        response = client.post(
+            "/api/v1/batch",
+            json={
+                "transaction": True,
+                "requests": [
+                    {"method": "POST", "path": url, "body": _expense(test_user, "Taxi")},
+                    {"method": "GET", "path": "/api/v1/trips/missing/expenses"},
+                    {"method": "POST", "path": url, "body": _expense(test_user, "Museum")},
+                ],
+            },
+            headers=auth_headers,
+        )
+
+        data = response.json()
+        assert data["committed"] is False
+        assert [r["status"] for r in data["responses"]] == [200, 404, 424]
+        assert db_session.query(Expense).count() == 0
+
+        # the rolled back version must not have left a cached body behind
+        client.post(url, json=_expense(test_user, "Dinner"), headers=auth_headers)
+        listed = client.get(url, headers=auth_headers).json()
+        assert [e["description"] for e in listed] == ["Dinner"]
@@ -0,0 +1,569 @@
+"""Unit tests for the chat endpoints and the LLM resilience helpers."""
+
+import asyncio
+from datetime import date
+
+import httpx
+import pytest
+
+from app.core.admission import AdmissionController, AdmissionRejected
+from app.core.circuit_breaker import (
+    CircuitBreaker,
+    CircuitOpenError,
+    run_health_probe,
+    CLOSED,
+    OPEN,
+    HALF_OPEN,
+)
+from app.services import ollama
+from app.services.chat_jobs import ChatJob, ChatJobQueue, FairJobQueue, chat_jobs
+from app.services.trip_context import build_trip_context, get_trip_context, trip_context_cache
+from app.services.model_router import ModelRouter, LatencyWindow
+from app.models.trip_date import TripDate
+from app.models.user_availability import UserAvailability
+from app.models.user_trip import UserTrip
+from app.models.expense import Expense
+
+
+@pytest.fixture
+def fake_generate(monkeypatch):
+    """Replace the Ollama call with a canned response and record prompts."""
+    prompts = []
+
+    async def _generate(prompt, model=None):
+        prompts.append(prompt)
+        return "Pack sunscreen."
+
+    monkeypatch.setattr(ollama, "generate", _generate)
+    return prompts
+
+
+class TestSendChatMessage:
+    """Tests for POST /trips/{trip_hash}/chat endpoint."""
+
+    def test_chat_success(self, client, test_trip, auth_headers, fake_generate):
+        """Test a successful chat round trip includes trip context."""
+        response = client.post(
+            f"/api/v1/trips/{test_trip.hash_id}/chat",
+            json={"message": "What should I pack?"},
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        assert response.json()["response"] == "Pack sunscreen."
+        assert "Test Trip" in fake_generate[0]
+        assert "What should I pack?" in fake_generate[0]
+
+    def test_chat_not_member(self, client, test_trip, auth_headers2, fake_generate):
+        """Test that non-members cannot chat about a trip."""
+        response = client.post(
+            f"/api/v1/trips/{test_trip.hash_id}/chat",
+            json={"message": "Hi"},
+            headers=auth_headers2,
+        )
+
+        assert response.status_code == 403
+
+    def test_chat_backend_unavailable(self, client, test_trip, auth_headers, monkeypatch):
+        """Test that connection errors map to 503."""
+
+        async def _fail(prompt, model=None):
+            raise httpx.ConnectError("connection refused")
+
+        monkeypatch.setattr(ollama, "generate", _fail)
+
+        response = client.post(
+            f"/api/v1/trips/{test_trip.hash_id}/chat",
+            json={"message": "Hi"},
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 503
+
+    def test_chat_rejected_when_queue_full(
+        self, client, test_trip, auth_headers, fake_generate, monkeypatch
+    ):
+        """Test that a full admission queue returns 429 with Retry-After."""
+
+        async def _reject(trip_key, user_key):
+            raise AdmissionRejected("queue_full", 7)
+
+        monkeypatch.setattr(ollama.chat_admission, "acquire", _reject)
+
+        response = client.post(
+            f"/api/v1/trips/{test_trip.hash_id}/chat",
+            json={"message": "Hi"},
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "7"
+        assert fake_generate == []
+
+
+class TestChatJobs:
+    """Tests for the asynchronous chat job endpoints."""
+
+    def test_create_and_poll_job(self, client, test_trip, auth_headers, fake_generate):
+        """Test that a job is accepted immediately and its result can be polled."""
+        url = f"/api/v1/trips/{test_trip.hash_id}/chat/jobs"
+        response = client.post(url, json={"message": "Plan day one"}, headers=auth_headers)
+
+        assert response.status_code == 202
+        job = response.json()
+        assert job["status"] in ("queued", "running", "succeeded")
+
+        result = client.get(f"{url}/{job['id']}?wait=5", headers=auth_headers)
+
+        assert result.status_code == 200
+        data = result.json()
+        assert data["status"] == "succeeded"
+        assert data["response"] == "Pack sunscreen."
+        assert data["finished_at"] is not None
+
+    def test_job_failure_is_reported(self, client, test_trip, auth_headers, monkeypatch):
+        """Test that backend errors end the job as failed with an error message."""
+
+        async def _fail(prompt, model=None):
+            raise httpx.ConnectError("connection refused")
+
+        monkeypatch.setattr(ollama, "generate", _fail)
+        url = f"/api/v1/trips/{test_trip.hash_id}/chat/jobs"
+        job = client.post(url, json={"message": "Hi"}, headers=auth_headers).json()
+
+        data = client.get(f"{url}/{job['id']}?wait=5", headers=auth_headers).json()
+
+        assert data["status"] == "failed"
+        assert "AI service" in data["error"]
+
+    def test_job_hidden_from_other_users(
+        self, client, test_trip_with_multiple_users, auth_headers, auth_headers2, fake_generate
+    ):
+        """Test that a job can only be read by the user who created it."""
+        url = f"/api/v1/trips/{test_trip_with_multiple_users.hash_id}/chat/jobs"
+        job = client.post(url, json={"message": "Hi"}, headers=auth_headers).json()
+
+        response = client.get(f"{url}/{job['id']}", headers=auth_headers2)
+
+        assert response.status_code == 404
+
+    def test_job_queue_full(self, client, test_trip, auth_headers, fake_generate, monkeypatch):
+        """Test that a full job queue rejects with 429."""
+        monkeypatch.setattr(chat_jobs, "max_pending", 0)
+
+        response = client.post(
+            f"/api/v1/trips/{test_trip.hash_id}/chat/jobs",
+            json={"message": "Hi"},
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 429
+        assert "Retry-After" in response.headers
+
+    def test_unknown_job(self, client, test_trip, auth_headers):
+        """Test polling a job id that does not exist."""
+        response = client.get(
+            f"/api/v1/trips/{test_trip.hash_id}/chat/jobs/doesnotexist",
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 404
+
+    def test_fair_queue_round_robin(self):
+        """Test that pending jobs alternate between trips, then between users of a trip."""
+        def job(trip, user, n):
+            return ChatJob(id=f"{trip}-{user}-{n}", trip_hash=trip, user_id=user, prompt="p", model="m")
+
+        async def drain():
+            queue = FairJobQueue()
+            for item in (job("a", 1, 1), job("a", 1, 2), job("a", 1, 3), job("a", 2, 1), job("b", 3, 1)):
+                queue.put_nowait(item)
+            assert queue.qsize() == 5
+            return [(await queue.get()).id for _ in range(5)]
+
+        assert asyncio.run(drain()) == ["a-1-1", "b-3-1", "a-2-1", "a-1-2", "a-1-3"]
+
+    def test_backlog_does_not_block_other_users(self, monkeypatch):
+        """Test that one user's queued jobs don't hold back another user's job."""
+        order = []
+
+        async def generate(prompt, model=None):
+            order.append(prompt)
+            await asyncio.sleep(0)
+            return "ok"
+
+        monkeypatch.setattr(ollama, "generate", generate)
+
+        async def run():
+            queue = ChatJobQueue(workers=1, max_pending=10, ttl=60)
+            await queue.start()
+            try:
+                jobs = [queue.submit("t", 1, f"busy-{i}", "m") for i in range(4)]
+                jobs.append(queue.submit("t", 2, "other", "m"))
+                await asyncio.gather(*(job.done.wait() for job in jobs))
+            finally:
+                await queue.stop()
+
+        asyncio.run(run())
+        assert order.index("other") == 1
+
+    def test_finished_jobs_expire(self):
+        """Test that finished jobs are swept after their TTL."""
+        job = ChatJob(id="expired", trip_hash="t", user_id=1, prompt="p", model="m")
+        job.finish("succeeded", response="ok")
+        chat_jobs._jobs[job.id] = job
+
+        chat_jobs.purge_expired(now=job.finished_at + chat_jobs.ttl + 1)
+
+        assert chat_jobs.get("expired") is None
+
+
+class TestTripContext:
+    """Tests for the cached trip context summary."""
+
+    def _seed(self, db_session, trip, users):
+        days = [date(2026, 7, d) for d in (1, 2, 3, 4)]
+        rows = [TripDate(trip_id=trip.id, date=d) for d in days]
+        db_session.add_all(rows)
+        db_session.flush()
+        # both free on the 2nd and 3rd, only one on the 1st
+        free = {users[0].id: days[:3], users[1].id: days[1:3]}
+        for td in rows:
+            for user in users:
+                status = "available" if td.date in free[user.id] else "unavailable"
+                db_session.add(
+                    UserAvailability(trip_date_id=td.id, user_id=user.id, status=status)
+                )
+        db_session.add(
+            Expense(trip_id=trip.id, payer_user_id=users[1].id, amount=120.0,
+                    currency="EUR", description="Hotel")
+        )
+        db_session.add(
+            Expense(trip_id=trip.id, payer_user_id=users[0].id, amount=30.0,
+                    currency="EUR", description="Taxi")
+        )
+        db_session.commit()
+
+    def test_summary_contents(
+        self, db_session, test_trip_with_multiple_users, test_user, test_user2
+    ):
+        """Test that the summary covers members, dates, spending and description."""
+        trip = test_trip_with_multiple_users
+        self._seed(db_session, trip, [test_user, test_user2])
+
+        context = get_trip_context(db_session, trip)
+
+        assert "2 members: User One, User Two" in context
+        assert "2026-07-02 to 2026-07-03 (2/2 free)" in context
+        assert "150.00 EUR across 2 expenses" in context
+        assert "Top payers: User Two 120.00 EUR" in context
+        assert "A trip with multiple users" in context
+
+    def test_removed_members_not_counted_free(
+        self, db_session, test_trip_with_multiple_users, test_user, test_user2
+    ):
+        """Test that availability left behind by a removed member is ignored."""
+        trip = test_trip_with_multiple_users
+        self._seed(db_session, trip, [test_user, test_user2])
+        db_session.query(UserTrip).filter(UserTrip.user_id == test_user2.id).delete()
+        db_session.commit()
+
+        context = build_trip_context(db_session, trip)
+
+        assert "2026-07-01 to 2026-07-03 (1/1 free)" in context
+
+    def test_cached_until_version_changes(
+        self, client, db_session, test_trip, auth_headers, fake_generate
+    ):
+        """Test that the summary is reused until a write bumps the trip version."""
+        hits = trip_context_cache._hits
+        misses = trip_context_cache._misses
+        url = f"/api/v1/trips/{test_trip.hash_id}/chat"
+
+        before_misses = misses.value()
+        client.post(url, json={"message": "Hi"}, headers=auth_headers)
+        before_hits = hits.value()
+        client.post(url, json={"message": "Hi again"}, headers=auth_headers)
+
+        assert misses.value() == before_misses + 1
+        assert hits.value() == before_hits + 1
+
+        client.put(
+            f"/api/v1/trips/{test_trip.hash_id}",
+            json={"description": "Now with mountains"},
+            headers=auth_headers,
+        )
+        client.post(url, json={"message": "And now?"}, headers=auth_headers)
+
+        assert misses.value() == before_misses + 2
+        assert "Now with mountains" in fake_generate[-1]
+
+
+class TestModelRouter:
+    """Tests for latency-aware model routing."""
+
+    def _router(self, **kwargs):
+        options = dict(
+            small_model="small",
+            large_model="large",
+            long_prompt_chars=100,
+            large_p95_budget=10.0,
+            window_seconds=60.0,
+        )
+        options.update(kwargs)
+        return ModelRouter(**options)
+
+    def test_short_question_uses_small_model(self):
+        """Test that short factual questions go to the small model."""
+        assert self._router().choose("Is it warm in May?") == ("small", "short_question")
+
+    def test_planning_intent_uses_large_model(self):
+        """Test that planning-style prompts go to the large model."""
+        assert self._router().choose("Make an itinerary for Rome")[0] == "large"
+
+    def test_long_prompt_uses_large_model(self):
+        """Test that long prompts go to the large model."""
+        assert self._router().choose("x" * 150) == ("large", "long_prompt")
+
+    def test_single_model_configuration(self):
+        """Test that without a large model everything uses the small one."""
+        router = self._router(large_model="")
+        assert router.choose("Plan a week-long itinerary") == ("small", "single_model")
+
+    def test_falls_back_when_large_model_over_budget(self):
+        """Test SLO fallback to the small model when large p95 is too high."""
+        router = self._router()
+        for _ in range(10):
+            router.record("large", 30.0)
+
+        assert router.choose("Plan our trip") == ("small", "slo_fallback")
+
+    def test_slow_samples_age_out(self):
+        """Test that samples outside the window no longer count."""
+        window = LatencyWindow(window_seconds=60.0)
+        for _ in range(10):
+            window.add(30.0, now=0.0)
+
+        assert window.p95(now=10.0) == 30.0
+        assert window.p95(now=100.0) is None
+
+    def test_chat_passes_routed_model(
+        self, client, test_trip, auth_headers, monkeypatch
+    ):
+        """Test that the chat endpoint calls the backend with the chosen model."""
+        models = []
+
+        async def _generate(prompt, model=None):
+            models.append(model)
+            return "ok"
+
+        monkeypatch.setattr(ollama, "generate", _generate)
+        monkeypatch.setattr("app.routers.chat.model_router", self._router())
+
+        client.post(
+            f"/api/v1/trips/{test_trip.hash_id}/chat",
+            json={"message": "Plan day 2 for us"},
+            headers=auth_headers,
+        )
+
+        assert models == ["large"]
+
+
+class TestAdmissionController:
+    """Tests for the fair, bounded admission queue."""
+
+    def _controller(self, **kwargs):
+        options = dict(
+            max_concurrency=1, max_queue=4, max_queued_per_user=4, queue_timeout=5.0
+        )
+        options.update(kwargs)
+        return AdmissionController("test_chat", **options)
+
+    def test_rejects_when_queue_full(self):
+        """Test immediate rejection once the wait queue is at capacity."""
+        controller = self._controller(max_queue=1)
+
+        async def scenario():
+            await controller.acquire("trip", "u1")
+            waiter = asyncio.ensure_future(controller.acquire("trip", "u2"))
+            await asyncio.sleep(0)
+            with pytest.raises(AdmissionRejected) as exc:
+                await controller.acquire("trip", "u3")
+            controller.release()
+            await waiter
+            controller.release()
+            return exc.value
+
+        rejected = asyncio.run(scenario())
+        assert rejected.reason == "queue_full"
+        assert rejected.retry_after >= 1
+        assert controller.in_flight == 0
+        assert controller.queued == 0
+
+    def test_rejects_per_user_limit(self):
+        """Test that one user cannot occupy the whole queue."""
+        controller = self._controller(max_queued_per_user=1)
+
+        async def scenario():
+            await controller.acquire("trip", "u1")
+            waiter = asyncio.ensure_future(controller.acquire("trip", "u1"))
+            await asyncio.sleep(0)
+            with pytest.raises(AdmissionRejected) as exc:
+                await controller.acquire("trip", "u1")
+            # another user is still welcome
+            other = asyncio.ensure_future(controller.acquire("trip", "u2"))
+            await asyncio.sleep(0)
+            for _ in range(3):
+                controller.release()
+                await asyncio.sleep(0)
+            await asyncio.gather(waiter, other)
+            return exc.value
+
+        assert asyncio.run(scenario()).reason == "user_queue_full"
+
+    def test_round_robin_across_trips(self):
+        """Test that waiters from different trips are interleaved."""
+        controller = self._controller(max_queue=10)
+        order = []
+
+        async def worker(trip, user):
+            async with controller.slot(trip, user):
+                order.append(trip)
+                await asyncio.sleep(0)
+
+        async def scenario():
+            await controller.acquire("busy", "holder")
+            tasks = [asyncio.ensure_future(worker("busy", f"u{i}")) for i in range(3)]
+            tasks.append(asyncio.ensure_future(worker("quiet", "q")))
+            await asyncio.sleep(0)
+            controller.release()
+            await asyncio.gather(*tasks)
+
+        asyncio.run(scenario())
+        assert order == ["busy", "quiet", "busy", "busy"]
+
+    def test_queue_timeout(self):
+        """Test that waiters give up after the queue timeout."""
+        controller = self._controller(queue_timeout=0.01)
+
+        async def scenario():
+            await controller.acquire("trip", "u1")
+            with pytest.raises(AdmissionRejected) as exc:
+                await controller.acquire("trip", "u2")
+            controller.release()
+            return exc.value
+
+        assert asyncio.run(scenario()).reason == "queue_timeout"
+        assert controller.queued == 0
+        assert controller.in_flight == 0
+
+
+class TestCircuitBreaker:
+    """Tests for the chat backend circuit breaker."""
+
+    def _breaker(self, **kwargs):
+        options = dict(failure_threshold=2, slow_call_seconds=10.0, open_seconds=60.0)
+        options.update(kwargs)
+        return CircuitBreaker("test_chat", **options)
+
+    def test_opens_after_consecutive_failures(self):
+        """Test that the breaker opens and then fails fast."""
+        breaker = self._breaker()
+        breaker.record_failure("boom")
+        assert breaker.state == CLOSED
+        breaker.record_failure("boom")
+        assert breaker.state == OPEN
+
+        with pytest.raises(CircuitOpenError) as exc:
+            breaker.before_call()
+        assert exc.value.retry_after >= 1
+
+    def test_success_resets_failures(self):
+        """Test that a success in between keeps the breaker closed."""
+        breaker = self._breaker()
+        breaker.record_failure()
+        breaker.record_success(0.1)
+        breaker.record_failure()
+
+        assert breaker.state == CLOSED
+
+    def test_slow_calls_count_as_failures(self):
+        """Test that calls over the slow-call threshold open the breaker."""
+        breaker = self._breaker(slow_call_seconds=1.0)
+        breaker.record_success(5.0)
+        breaker.record_success(5.0)
+
+        assert breaker.state == OPEN
+
+    def test_half_open_allows_single_trial(self):
+        """Test that after the open window a single trial call is let through."""
+        breaker = self._breaker(open_seconds=0.0)
+        breaker.record_failure()
+        breaker.record_failure()
+
+        breaker.before_call()
+        assert breaker.state == HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success(0.1)
+        assert breaker.state == CLOSED
+
+    def test_probe_closes_breaker(self):
+        """Test that a healthy probe closes an open breaker."""
+        breaker = self._breaker()
+        breaker.record_failure()
+        breaker.record_failure()
+
+        async def probe():
+            return True
+
+        async def scenario():
+            task = asyncio.ensure_future(run_health_probe(breaker, probe, 0.001))
+            for _ in range(100):
+                await asyncio.sleep(0.001)
+                if breaker.state == CLOSED:
+                    break
+            task.cancel()
+
+        asyncio.run(scenario())
+        assert breaker.state == CLOSED
+
+    def test_open_breaker_fails_chat_fast(
+        self, client, test_trip, auth_headers, fake_generate, monkeypatch
+    ):
+        """Test that /chat returns 503 without calling the model while open."""
+        breaker = self._breaker()
+        breaker.record_failure()
+        breaker.record_failure()
+        monkeypatch.setattr(ollama, "chat_breaker", breaker)
+        monkeypatch.setattr("app.routers.chat.chat_breaker", breaker)
+
+        response = client.post(
+            f"/api/v1/trips/{test_trip.hash_id}/chat",
+            json={"message": "Hi"},
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
+        assert fake_generate == []
+
+        health = client.get("/health").json()
+        assert health["chat_backend"]["state"] == "open"
+
+
+def test_health_reports_chat_backend(client):
+    """Test that /health includes the chat backend circuit state."""
+    data = client.get("/health").json()
+
+    assert data["status"] == "ok"
+    assert data["chat_backend"]["state"] in ("closed", "open", "half_open")
+
+
+def test_metrics_endpoint_exposes_admission(client):
+    """Test that queue depth and wait time appear on /metrics."""
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert "chat_admission_queue_depth" in response.text
+    assert "chat_admission_wait_seconds_bucket" in response.text
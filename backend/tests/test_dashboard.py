@@ -0,0 +1,147 @@
+"""Tests for the GET /dashboard endpoint."""
+
+from datetime import date
+
+import pytest
+
+from app.models.trip import Trip
+from app.models.trip_date import TripDate
+from app.models.user_availability import UserAvailability
+from app.models.user_trip import UserTrip
+from app.models.expense import Expense, ExpenseShare
+
+
+def _add_trips(db_session, user, count, start=0):
+    trips = []
+    for i in range(start, start + count):
+        trip = Trip(title=f"Trip {i}", hash_id=f"dash_trip_{i}")
+        db_session.add(trip)
+        db_session.flush()
+        db_session.add(UserTrip(user_id=user.id, trip_id=trip.id, user_name="Me"))
+        trip_date = TripDate(trip_id=trip.id, date=date(2025, 7, 1 + i))
+        db_session.add(trip_date)
+        db_session.flush()
+        db_session.add(UserAvailability(trip_date_id=trip_date.id, user_id=user.id, status="available"))
+        expense = Expense(trip_id=trip.id, payer_user_id=user.id, amount=10.0, currency="EUR", description="x")
+        db_session.add(expense)
+        db_session.flush()
+        db_session.add(ExpenseShare(expense_id=expense.id, user_id=user.id, share_type="equal", value=10.0))
+        trips.append(trip)
+    db_session.commit()
+    return trips
+
+
+class TestDashboard:
+    """Tests for GET /dashboard."""
+
+    def test_requires_auth(self, client):
+        """Test the dashboard is only available to authenticated users."""
+        assert client.get("/api/v1/dashboard").status_code == 401
+
+    def test_summary_figures(self, client, db_session, test_trip_with_multiple_users, test_user, test_user2, auth_headers):
+        """Test member count, date range, free dates and money per trip."""
+        trip = test_trip_with_multiple_users
+        d1, d2, d3 = (TripDate(trip_id=trip.id, date=date(2025, 8, day)) for day in (1, 2, 5))
+        db_session.add_all([d1, d2, d3])
+        db_session.flush()
+        db_session.add_all([
+            # d1: both free, d2: only one, d3: one free, one not
+            UserAvailability(trip_date_id=d1.id, user_id=test_user.id, status="available"),
+            UserAvailability(trip_date_id=d1.id, user_id=test_user2.id, status="available"),
+            UserAvailability(trip_date_id=d2.id, user_id=test_user.id, status="available"),
+            UserAvailability(trip_date_id=d3.id, user_id=test_user.id, status="available"),
+            UserAvailability(trip_date_id=d3.id, user_id=test_user2.id, status="unavailable"),
+        ])
+        paid_by_me = Expense(trip_id=trip.id, payer_user_id=test_user.id, amount=100.0, currency="EUR", description="hotel")
+        paid_by_other = Expense(trip_id=trip.id, payer_user_id=test_user2.id, amount=30.0, currency="EUR", description="dinner")
+        in_dollars = Expense(trip_id=trip.id, payer_user_id=test_user2.id, amount=20.0, currency="USD", description="taxi")
+        db_session.add_all([paid_by_me, paid_by_other, in_dollars])
+        db_session.flush()
+        db_session.add_all([
+            ExpenseShare(expense_id=paid_by_me.id, user_id=test_user.id, share_type="equal", value=50.0),
+            ExpenseShare(expense_id=paid_by_me.id, user_id=test_user2.id, share_type="equal", value=50.0),
+            ExpenseShare(expense_id=paid_by_other.id, user_id=test_user.id, share_type="equal", value=15.0),
+            ExpenseShare(expense_id=paid_by_other.id, user_id=test_user2.id, share_type="equal", value=15.0),
+            ExpenseShare(expense_id=in_dollars.id, user_id=test_user.id, share_type="amount", value=20.0),
+        ])
+        db_session.commit()
+
+        response = client.get("/api/v1/dashboard", headers=auth_headers)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] == 1
+        card = data["items"][0]
+        assert card["hash_id"] == "multi_trip_123"
+        assert card["member_count"] == 2
+        assert card["first_date"] == "2025-08-01"
+        assert card["last_date"] == "2025-08-05"
+        assert card["date_count"] == 3
+        assert card["free_dates"] == 1
+        assert card["total_spent"] == {"EUR": 130.0, "USD": 20.0}
+        assert card["my_balance"] == {"EUR": 35.0, "USD": -20.0}
+
+    def test_removed_members_not_counted(self, client, db_session, test_trip_with_multiple_users, test_user, test_user2, auth_headers):
+        """Test availability left behind by a removed member doesn't make a date free."""
+        trip = test_trip_with_multiple_users
+        day = TripDate(trip_id=trip.id, date=date(2025, 8, 1))
+        db_session.add(day)
+        db_session.flush()
+        db_session.add_all([
+            UserAvailability(trip_date_id=day.id, user_id=test_user.id, status="unavailable"),
+            UserAvailability(trip_date_id=day.id, user_id=test_user2.id, status="available"),
+        ])
+        db_session.query(UserTrip).filter(UserTrip.user_id == test_user2.id).delete()
+        db_session.commit()
+
+        card = client.get("/api/v1/dashboard", headers=auth_headers).json()["items"][0]
+
+        assert card["member_count"] == 1
+        assert card["free_dates"] == 0
+
+    def test_trip_without_dates_or_expenses(self, client, test_trip, auth_headers):
+        """Test an empty trip yields zeroes rather than missing figures."""
+        card = client.get("/api/v1/dashboard", headers=auth_headers).json()["items"][0]
+
+        assert card["member_count"] == 1
+        assert card["first_date"] is None
+        assert card["date_count"] == 0
+        assert card["free_dates"] == 0
+        assert card["total_spent"] == {}
+        assert card["my_balance"] == {}
+
+    def test_only_own_trips(self, client, db_session, test_trip, test_user2, auth_headers2):
+        """Test trips the caller is not a member of are not listed."""
+        _add_trips(db_session, test_user2, 1)
+
+        data = client.get("/api/v1/dashboard", headers=auth_headers2).json()
+
+        assert data["total"] == 1
+        assert [c["hash_id"] for c in data["items"]] == ["dash_trip_0"]
+
+    def test_pagination(self, client, db_session, test_user, auth_headers):
+        """Test limit and offset page through trips, newest first."""
+        _add_trips(db_session, test_user, 5)
+
+        first = client.get("/api/v1/dashboard?limit=2", headers=auth_headers).json()
+        last = client.get("/api/v1/dashboard?limit=2&offset=4", headers=auth_headers).json()
+
+        assert first["total"] == 5
+        assert [c["hash_id"] for c in first["items"]] == ["dash_trip_4", "dash_trip_3"]
+        assert [c["hash_id"] for c in last["items"]] == ["dash_trip_0"]
+        assert (last["limit"], last["offset"]) == (2, 4)
+
+    @pytest.mark.parametrize("query", ["limit=0", "limit=101", "offset=-1"])
+    def test_invalid_paging(self, client, auth_headers, query):
+        """Test out-of-range paging parameters are rejected."""
+        assert client.get(f"/api/v1/dashboard?{query}", headers=auth_headers).status_code == 422
+
+    def test_constant_statement_count(self, query_budget, db_session, test_user, auth_headers):
+        """Test the statement count does not grow with the number of trips."""
+        _add_trips(db_session, test_user, 1)
+        # auth, total, page, members, dates, free dates, spend, shares
+        query_budget("GET", "/api/v1/dashboard", 8, headers=auth_headers)
+
+        _add_trips(db_session, test_user, 20, start=1)
+        response = query_budget("GET", "/api/v1/dashboard", 8, headers=auth_headers)
+        assert len(response.json()["items"]) == 20
@@ -0,0 +1,240 @@
+"""Unit tests for database engine and session configuration."""
+
+import logging
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.core import metrics
+from app.core.config import _async_database_url, THREADPOOL_SIZE, DB_POOL_SIZE
+from app.db.pool import engine_options, instrument_engine, InstrumentedQueuePool
+from app.db.session import Base
+from app.db import replica
+from app.db.replica import ReadRouter, get_read_db, PIN_COOKIE
+from app.db.query_stats import QueryStats, QueryStatsMiddleware, statement_shape, track_queries
+from app.main import app
+from tests.conftest import TestingSessionLocal
+
+
+class TestAsyncDatabaseUrl:
+    """Tests for deriving the asyncio driver URL from DATABASE_URL."""
+
+    @pytest.mark.parametrize(
+        "url,expected",
+        [
+            ("postgresql://u:p@db:5432/app", "postgresql+asyncpg://u:p@db:5432/app"),
+            ("postgresql+psycopg2://u:p@db/app", "postgresql+asyncpg://u:p@db/app"),
+            ("sqlite:///./dev.db", "sqlite+aiosqlite:///./dev.db"),
+            ("sqlite+aiosqlite:///./dev.db", "sqlite+aiosqlite:///./dev.db"),
+        ],
+    )
+    def test_driver_mapping(self, url, expected):
+        """Test that sync URLs map to their asyncio drivers."""
+        assert _async_database_url(url) == expected
+
+    def test_async_endpoint_reads_committed_data(self, client, test_trip, auth_headers):
+        """Test that async endpoints see rows committed through the sync session."""
+        response = client.get(f"/api/v1/trips/{test_trip.hash_id}", headers=auth_headers)
+
+        assert response.status_code == 200
+        assert response.json()["title"] == "Test Trip"
+
+
+class TestPoolInstrumentation:
+    """Tests for the configurable, instrumented connection pool."""
+
+    def test_pool_configured_from_settings(self, tmp_path):
+        """Test that file databases get the sized, instrumented pool."""
+        url = f"sqlite:///{tmp_path}/pool.db"
+        engine = create_engine(url, **engine_options(url, "test_pool"))
+
+        assert isinstance(engine.pool, InstrumentedQueuePool)
+        assert engine.pool.size() == DB_POOL_SIZE
+        assert engine.pool._pre_ping is True
+        engine.dispose()
+
+    def test_checkout_metrics(self, tmp_path):
+        """Test that checkouts record wait time and in-use gauges."""
+        url = f"sqlite:///{tmp_path}/pool.db"
+        engine = create_engine(url, **engine_options(url, "test_pool"))
+        instrument_engine(engine, "test_pool")
+        wait = metrics.REGISTRY.get("db_pool_checkout_wait_seconds")
+        in_use = metrics.REGISTRY.get("db_pool_in_use")
+        before, _ = wait.snapshot(pool="test_pool")
+
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            assert in_use.value(pool="test_pool") == 1
+
+        assert in_use.value(pool="test_pool") == 0
+        assert wait.snapshot(pool="test_pool")[0] == before + 1
+        engine.dispose()
+
+    def test_threadpool_matched_to_pool(self, client):
+        """Test that startup sizes the threadpool and exports its gauges."""
+        body = client.get("/metrics").text
+
+        assert f"threadpool_tokens_total {THREADPOOL_SIZE}" in body
+        assert 'db_pool_in_use{pool="primary"}' in body
+
+
+class TestReadReplicaRouting:
+    """Tests for routing safe reads to a replica with read-your-writes."""
+
+    @pytest.fixture
+    def replica_router(self, tmp_path, monkeypatch):
+        """Route reads to an empty replica file next to the primary test.db."""
+        replica_engine = create_engine(
+            f"sqlite:///{tmp_path}/replica.db", connect_args={"check_same_thread": False}
+        )
+        Base.metadata.create_all(bind=replica_engine)
+        router = ReadRouter(TestingSessionLocal, sessionmaker(bind=replica_engine), window=5.0)
+        monkeypatch.setattr(replica, "read_router", router)
+        yield router
+        replica_engine.dispose()
+
+    def test_falls_back_to_primary_without_replica(self):
+        """Test that without a replica every read uses the primary."""
+        router = ReadRouter("primary", None)
+
+        assert router.session_factory("user") == "primary"
+
+    def test_pin_after_write(self):
+        """Test that a pinned user reads from the primary until the window ends."""
+        router = ReadRouter("primary", "replica", window=5.0)
+        assert router.session_factory("user") == "replica"
+
+        until = router.pin("user", now=100.0)
+
+        assert router.is_pinned("user", now=104.0)
+        assert not router.is_pinned("user", now=106.0)
+        assert router.is_pinned(None, cookie=str(until), now=104.0)
+        assert not router.is_pinned("other", now=104.0)
+
+    def test_primary_reads_reuse_request_session(self, replica_router):
+        """Test that a read routed to the primary shares the request's get_db session."""
+        primary = object()
+        replica_router.pin("writer")
+        assert next(get_read_db("writer", None, primary)) is primary
+
+        replica_router.replica = None
+        assert next(get_read_db("reader", None, primary)) is primary
+
+    def test_replica_reads_get_own_session(self, replica_router):
+        """Test that a read routed to the replica opens a replica session."""
+        reads = get_read_db("user", None, object())
+        db = next(reads)
+
+        assert db.get_bind() is not TestingSessionLocal.kw["bind"]
+        reads.close()
+
+    def test_reads_hit_replica_until_user_writes(
+        self, client, test_trip, auth_headers, replica_router
+    ):
+        """Test end-to-end routing with two SQLite files."""
+        app.dependency_overrides.pop(get_read_db, None)
+        hash_id = test_trip.hash_id
+        client.cookies.clear()
+
+        # the replica has not seen the trip yet
+        response = client.get(f"/api/v1/trips/{hash_id}/dates", headers=auth_headers)
+        assert response.status_code == 404
+
+        write = client.put(
+            f"/api/v1/trips/{hash_id}", json={"title": "Renamed"}, headers=auth_headers
+        )
+        assert write.status_code == 200
+        assert PIN_COOKIE in write.headers["set-cookie"]
+
+        # pinned to the primary right after writing
+        response = client.get(f"/api/v1/trips/{hash_id}/dates", headers=auth_headers)
+        assert response.status_code == 200
+
+
+class TestQueryStats:
+    """Tests for per-request SQL counting and N+1 detection."""
+
+    def test_statement_shape(self):
+        """Test that shapes ignore literal values and IN-list length."""
+        a = statement_shape("SELECT * FROM t WHERE id IN (?, ?, ?) LIMIT 1")
+        b = statement_shape("SELECT *  FROM t\nWHERE id IN (?) LIMIT 5")
+        assert a == b
+
+    def test_repeated_shapes(self):
+        """Test that only shapes above the threshold are reported."""
+        stats = QueryStats()
+        for _ in range(4):
+            stats.record("SELECT 1 FROM users WHERE id = ?", 0.001)
+        stats.record("SELECT 1 FROM trips", 0.001)
+
+        assert stats.count == 5
+        assert stats.repeated(threshold=3) == [("SELECT ? FROM users WHERE id = ?", 4)]
+        assert stats.repeated(threshold=4) == []
+
+    def test_track_queries(self, db_session):
+        """Test that statements run inside the context are counted."""
+        with track_queries() as stats:
+            db_session.execute(text("SELECT 1"))
+            db_session.execute(text("SELECT 2"))
+        db_session.execute(text("SELECT 3"))
+
+        assert stats.count == 2
+        assert stats.seconds >= 0
+
+    def test_server_timing_sync_endpoint(self, client, test_trip, auth_headers):
+        """Test that threadpool endpoints report their statements."""
+        response = client.get(
+            f"/api/v1/trips/{test_trip.hash_id}/members", headers=auth_headers
+        )
+
+        timing = response.headers["server-timing"]
+        assert timing.startswith("db;dur=")
+        assert 'desc="0 statements"' not in timing
+
+    def test_server_timing_async_endpoint(self, client, test_trip, auth_headers):
+        """Test that statements on the asyncio engine are attributed too."""
+        response = client.get(f"/api/v1/trips/{test_trip.hash_id}", headers=auth_headers)
+
+        assert 'desc="0 statements"' not in response.headers["server-timing"]
+
+    def test_query_budget(self, query_budget, test_trip, auth_headers):
+        """Test the budget fixture against a cheap endpoint."""
+        response = query_budget(
+            "GET", f"/api/v1/trips/{test_trip.hash_id}/members", 4, headers=auth_headers
+        )
+        assert response.status_code == 200
+
+        with pytest.raises(AssertionError, match="budget 1"):
+            query_budget(
+                "GET", f"/api/v1/trips/{test_trip.hash_id}/members", 1, headers=auth_headers
+            )
+
+    def test_repeat_warning(self, caplog):
+        """Test that a statement issued per row is logged as a possible N+1."""
+        rows_app = FastAPI()
+
+        @rows_app.get("/rows/{n}")
+        def per_row(n: int):
+            with TestingSessionLocal() as session:
+                for i in range(n):
+                    session.execute(text("SELECT :i"), {"i": i})
+            return {}
+
+        before = metrics.REGISTRY.get("db_repeated_statement_requests_total").value(
+            method="GET", route="/rows/{n}"
+        )
+
+        with caplog.at_level(logging.WARNING, logger="app.db.query_stats"):
+            with TestClient(QueryStatsMiddleware(rows_app, repeat_threshold=10)) as client:
+                client.get("/rows/5")
+                assert not any("possible N+1" in r.getMessage() for r in caplog.records)
+                client.get("/rows/12")
+
+        assert any("possible N+1" in r.getMessage() for r in caplog.records)
+        after = metrics.REGISTRY.get("db_repeated_statement_requests_total").value(
+            method="GET", route="/rows/{n}"
+        )
+        assert after == before + 1
@@ -0,0 +1,158 @@
+"""Tests for response compression and MessagePack negotiation."""
+
+import json
+import threading
+from datetime import date, timedelta
+
+import msgpack
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.core import encoding, metrics
+from app.core.encoding import CompressionMiddleware, MessagePackMiddleware, parse_qvalues
+from app.models.trip_date import TripDate
+
+ROWS = [{"date": f"2026-07-{d:02d}", "status": "available"} for d in range(1, 29)] * 4
+
+
+def _client(middleware=CompressionMiddleware, **options):
+    app = FastAPI()
+
+    @app.get("/rows")
+    def rows(n: int = len(ROWS)):
+        return ROWS[:n]
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(iter([b"[", b"1" * 4000, b"]"]), media_type="application/json")
+
+    return TestClient(middleware(app, **options))
+
+
+class TestParseQValues:
+    """Tests for Accept-style header parsing."""
+
+    def test_weights(self):
+        """Test q-values, defaults and malformed weights."""
+        assert parse_qvalues("gzip;q=0.5, br, *;q=0, deflate;q=x") == {
+            "gzip": 0.5, "br": 1.0, "*": 0.0, "deflate": 0.0,
+        }
+        assert parse_qvalues(None) == {}
+
+
+class TestCompression:
+    """Tests for CompressionMiddleware."""
+
+    def test_gzip_large_body(self):
+        """Test large JSON bodies are gzipped and the ratio recorded."""
+        before = metrics.REGISTRY.get("http_response_compression_ratio").snapshot(encoding="gzip")[0]
+
+        response = _client().get("/rows", headers={"Accept-Encoding": "gzip"})
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert int(response.headers["content-length"]) < len(json.dumps(ROWS))
+        assert response.json() == ROWS
+        after = metrics.REGISTRY.get("http_response_compression_ratio").snapshot(encoding="gzip")[0]
+        assert after == before + 1
+
+    def test_small_body_untouched(self):
+        """Test bodies under the threshold go out as they are."""
+        response = _client().get("/rows?n=1", headers={"Accept-Encoding": "gzip"})
+
+        assert "content-encoding" not in response.headers
+        assert response.json() == ROWS[:1]
+
+    def test_not_accepted(self):
+        """Test nothing is compressed without a matching Accept-Encoding."""
+        for value in ("identity", "gzip;q=0", "deflate"):
+            response = _client().get("/rows", headers={"Accept-Encoding": value})
+            assert "content-encoding" not in response.headers
+
+    def test_streaming_passthrough(self):
+        """Test streamed responses are forwarded untouched."""
+        response = _client().get("/stream", headers={"Accept-Encoding": "gzip"})
+
+        assert "content-encoding" not in response.headers
+        assert len(response.content) == 4002
+
+    def test_large_bodies_off_event_loop(self, monkeypatch):
+        """Test compression of large bodies runs on a worker thread."""
+        threads = []
+        original = CompressionMiddleware.reencode
+
+        def recording(self, choice, headers, body):
+            threads.append((threading.current_thread(), len(body)))
+            return original(self, choice, headers, body)
+
+        monkeypatch.setattr(CompressionMiddleware, "reencode", recording)
+
+        _client(minimum_size=100).get("/rows?n=3", headers={"Accept-Encoding": "gzip"})
+        _client().get("/rows", headers={"Accept-Encoding": "gzip"})
+
+        (small_thread, small), (large_thread, large) = threads
+        assert small < encoding.INLINE_BYTES <= large
+        assert large_thread is not small_thread
+
+    def test_brotli_preferred(self):
+        """Test brotli wins over gzip when both are acceptable."""
+        response = _client().get("/rows", headers={"Accept-Encoding": "gzip, br"})
+
+        assert response.headers["content-encoding"] == "br"
+
+    def test_gzip_without_brotli(self, monkeypatch):
+        """Test gzip is used when brotli is unavailable."""
+        monkeypatch.setattr(encoding, "brotli", None)
+
+        response = _client().get("/rows", headers={"Accept-Encoding": "br, gzip;q=0.5"})
+
+        assert response.headers["content-encoding"] == "gzip"
+
+
+class TestApiEncoding:
+    """Tests for encodings on the real API."""
+
+    def test_etag_weakened_and_revalidated(self, client, db_session, test_trip, auth_headers):
+        """Test compressed responses carry a weak ETag that still revalidates."""
+        for d in range(60):
+            db_session.add(TripDate(trip_id=test_trip.id, date=date(2026, 1, 1) + timedelta(days=d)))
+        db_session.commit()
+        url = f"/api/v1/trips/{test_trip.hash_id}/calendar"
+
+        response = client.get(url, headers={**auth_headers, "Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["etag"].startswith('W/"')
+
+        again = client.get(
+            url, headers={**auth_headers, "Accept-Encoding": "gzip", "If-None-Match": response.headers["etag"]}
+        )
+        assert again.status_code == 304
+
+
+class TestMessagePack:
+    """Tests for MessagePackMiddleware."""
+
+    def test_negotiated(self):
+        """Test msgpack is served when preferred, with the same document."""
+        response = _client(MessagePackMiddleware).get("/rows", headers={"Accept": "application/msgpack"})
+
+        assert response.headers["content-type"] == "application/msgpack"
+        assert response.headers["vary"] == "Accept"
+        assert msgpack.unpackb(response.content) == ROWS
+
+    def test_json_preferred(self):
+        """Test JSON stays when the client ranks it higher."""
+        response = _client(MessagePackMiddleware).get(
+            "/rows", headers={"Accept": "application/json, application/msgpack;q=0.5"}
+        )
+
+        assert response.headers["content-type"] == "application/json"
+
+    def test_unavailable(self, monkeypatch):
+        """Test JSON is served when msgpack is not installed."""
+        monkeypatch.setattr(encoding, "msgpack", None)
+
+        response = _client(MessagePackMiddleware).get("/rows", headers={"Accept": "application/msgpack"})
+
+        assert response.json() == ROWS
@@ -0,0 +1,86 @@
+"""Unit tests for ETag / If-None-Match conditional GETs."""
+
+import pytest
+
+from app.core.etag import make_etag, etag_matches
+from app.services.trip_views import response_cache
+
+PATHS = ["", "/calendar", "/dates", "/members", "/expenses", "/settlements"]
+
+
+class TestEtagMatching:
+    """Tests for If-None-Match comparison."""
+
+    def test_matches(self):
+        """Test list, weak and wildcard forms of If-None-Match."""
+        etag = make_etag("calendar", 1, 3)
+
+        assert etag.startswith('"') and etag.endswith('"')
+        assert etag_matches(etag, etag)
+        assert etag_matches(f'"other", W/{etag}', etag)
+        assert etag_matches("*", etag)
+        assert not etag_matches(None, etag)
+        assert not etag_matches(make_etag("calendar", 1, 4), etag)
+
+
+class TestConditionalGets:
+    """Tests for 304 responses on trip resources."""
+
+    @pytest.mark.parametrize("suffix", PATHS)
+    def test_not_modified(self, client, test_trip, auth_headers, suffix):
+        """Test that a matching ETag yields an empty 304."""
+        url = f"/api/v1/trips/{test_trip.hash_id}{suffix}"
+        first = client.get(url, headers=auth_headers)
+        etag = first.headers["etag"]
+
+        second = client.get(url, headers={**auth_headers, "If-None-Match": etag})
+
+        assert first.status_code == 200
+        assert first.headers["cache-control"] == "private, no-cache"
+        assert second.status_code == 304
+        assert second.content == b""
+        assert second.headers["etag"] == etag
+
+    @pytest.mark.parametrize("suffix", PATHS)
+    def test_etag_changes_after_write(self, client, test_trip, auth_headers, suffix):
+        """Test that any write to the trip invalidates every resource's ETag."""
+        url = f"/api/v1/trips/{test_trip.hash_id}{suffix}"
+        etag = client.get(url, headers=auth_headers).headers["etag"]
+
+        client.put(
+            f"/api/v1/trips/{test_trip.hash_id}",
+            json={"title": "Renamed"},
+            headers=auth_headers,
+        )
+        response = client.get(url, headers={**auth_headers, "If-None-Match": etag})
+
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+    def test_resources_have_distinct_etags(self, client, test_trip, auth_headers):
+        """Test that one trip's resources don't share validators."""
+        etags = {
+            client.get(f"/api/v1/trips/{test_trip.hash_id}{s}", headers=auth_headers).headers["etag"]
+            for s in PATHS
+        }
+        assert len(etags) == len(PATHS)
+
+    def test_not_modified_skips_build(self, client, test_trip, auth_headers):
+        """Test that a 304 neither builds nor reads the cached body."""
+        url = f"/api/v1/trips/{test_trip.hash_id}/expenses"
+        etag = client.get(url, headers=auth_headers).headers["etag"]
+        hits, misses = response_cache._hits.value(), response_cache._misses.value()
+
+        client.get(url, headers={**auth_headers, "If-None-Match": etag})
+
+        assert response_cache._hits.value() == hits
+        assert response_cache._misses.value() == misses
+
+    def test_membership_checked_before_304(self, client, test_trip, auth_headers, auth_headers2):
+        """Test that a non-member can't use a leaked ETag to probe a trip."""
+        url = f"/api/v1/trips/{test_trip.hash_id}/expenses"
+        etag = client.get(url, headers=auth_headers).headers["etag"]
+
+        response = client.get(url, headers={**auth_headers2, "If-None-Match": etag})
+
+        assert response.status_code == 403
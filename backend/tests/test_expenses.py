@@ -1,7 +1,22 @@
 """Unit tests for expenses API endpoints."""
 
+import json
+from datetime import datetime, timedelta, timezone
+
+import orjson
 import pytest
+from fastapi.encoders import jsonable_encoder
+
 from app.models.expense import Expense, ExpenseShare
+from app.schemas.expenses import ExpenseRead
+from app.services import trip_views
+from app.services.trip_views import (
+    build_expenses,
+    build_expenses_rows,
+    encode_fast_json,
+    encode_json,
+    response_cache,
+)
 
 
 class TestCreateExpense:
@@ -224,6 +239,111 @@ class TestGetExpenses:
         assert response.status_code == 404
 
 
+class TestFastExpenseList:
+    """Conformance of the orjson expense list path with the default one."""
+
+    @pytest.fixture
+    def ledger(self, db_session, test_trip_with_multiple_users, test_user, test_user2):
+        trip = test_trip_with_multiple_users
+        same_time = datetime(2026, 3, 1, 12, 0, 0)
+        rows = [
+            # (amount, description, created_at, shares)
+            (100.0, "Hotel", datetime(2026, 3, 2, 9, 30, 15, 123456), [(test_user, 50.0), (test_user2, 50.0)]),
+            (10, "Zażółć \u2028 \"quoted\" \\ \x1f 😀", same_time, [(test_user2, 10 / 3)]),
+            (20.0, "tie", same_time, [(test_user, 0.00001), (test_user2, 19.99999)]),
+            (1e16, "1e5 in text", datetime(2026, 2, 1), [(test_user, 1e16)]),
+            (7.5, "no debtors", datetime(2026, 1, 1), []),
+        ]
+        for amount, description, created_at, shares in rows:
+            expense = Expense(
+                trip_id=trip.id,
+                payer_user_id=test_user.id,
+                amount=amount,
+                currency="EUR",
+                description=description,
+                created_at=created_at,
+            )
+            db_session.add(expense)
+            db_session.flush()
+            for user, value in shares:
+                db_session.add(
+                    ExpenseShare(expense_id=expense.id, user_id=user.id, share_type="amount", value=value)
+                )
+        db_session.commit()
+        return trip
+
+    def test_identical_bytes(self, db_session, ledger):
+        """Test the Core/orjson path encodes exactly what the Pydantic path does."""
+        fast = encode_fast_json(build_expenses_rows(db_session, ledger))
+
+        assert fast == encode_json(build_expenses(db_session, ledger))
+        assert [e["description"] for e in json.loads(fast)][:3] == [
+            "Hotel", "tie", "Zażółć \u2028 \"quoted\" \\ \x1f 😀"
+        ]
+
+    def test_identical_bytes_without_odd_floats(self, db_session, ledger):
+        """Test the orjson output is used as is when no float needs re-encoding."""
+        db_session.query(ExpenseShare).filter(ExpenseShare.value < 0.001).delete()
+        db_session.query(Expense).filter(Expense.amount > 1e15).delete()
+        db_session.commit()
+        rows = build_expenses_rows(db_session, ledger)
+
+        assert orjson.dumps(rows, option=orjson.OPT_UTC_Z) == encode_json(build_expenses(db_session, ledger))
+
+    def test_fallback_decided_by_floats_not_text(self, db_session, ledger, monkeypatch):
+        """Test digits followed by "e" in ids or descriptions keep the orjson path."""
+        db_session.query(ExpenseShare).filter(ExpenseShare.value < 0.001).delete()
+        db_session.query(Expense).filter(Expense.amount > 1e15).delete()
+        ledger.hash_id = "1e2e3e4e5e6e"
+        db_session.commit()
+        rows = build_expenses_rows(db_session, ledger)
+        assert rows.plain_floats
+
+        def slow_path(data):
+            raise AssertionError("re-encoded without an odd float")
+
+        monkeypatch.setattr(trip_views, "encode_json", slow_path)
+        body = encode_fast_json(rows)
+        assert json.loads(body)[0]["tripId"] == "1e2e3e4e5e6e"
+        # plain lists and dicts are checked value by value
+        assert encode_fast_json([{"id": "9e9", "amount": 2.5}]) == b'[{"id":"9e9","amount":2.5}]'
+
+    def test_odd_floats_detected(self, db_session, ledger):
+        """Test exponent-form and tiny floats send the payload down the exact path."""
+        assert build_expenses_rows(db_session, ledger).plain_floats is False
+        for value in (1e16, 1e-05, -2e-7, 1e300):
+            assert not trip_views.plain_float(value)
+        for value in (0.0, -0.0, 0.0001, 9999999999999998.0, 10 / 3):
+            assert trip_views.plain_float(value)
+        assert encode_fast_json({"a": [1e16]}) == b'{"a":[1e+16]}'
+
+    def test_aware_datetimes(self):
+        """Test timezone-aware timestamps are written like Pydantic writes them."""
+        for created_at in (
+            datetime(2026, 3, 2, 9, 30, tzinfo=timezone.utc),
+            datetime(2026, 3, 2, 9, 30, 0, 5, tzinfo=timezone(timedelta(hours=-5))),
+        ):
+            expense = ExpenseRead(
+                id="1", tripId="t", payerId="2", amount=3.5, currency="EUR",
+                description="d", debtors=[], createdAt=created_at,
+            )
+            assert encode_fast_json([expense.model_dump()]) == encode_json(jsonable_encoder([expense]))
+
+    def test_endpoint(self, client, ledger, auth_headers, monkeypatch):
+        """Test the endpoint serves the same body with the fast path enabled."""
+        url = f"/api/v1/trips/{ledger.hash_id}/expenses"
+        default = client.get(url, headers=auth_headers)
+        response_cache.clear()
+        monkeypatch.setattr(trip_views, "FAST_JSON_LISTS", True)
+
+        fast = client.get(url, headers=auth_headers)
+
+        assert fast.content == default.content
+        assert fast.headers["etag"] == default.headers["etag"]
+        trimmed = client.get(f"{url}?fields=id,amount", headers=auth_headers).json()
+        assert trimmed[0] == {"id": default.json()[0]["id"], "amount": 100.0}
+
+
 class TestGetSettlements:
     """Tests for GET /trips/{trip_hash}/settlements endpoint."""
 
@@ -0,0 +1,87 @@
+"""Tests for ?fields= sparse fieldsets on trip, member and expense responses."""
+
+import pytest
+
+from app.core.fieldsets import select_fields
+
+
+class TestSelectFields:
+    """Tests for select_fields."""
+
+    def test_object_and_list(self):
+        """Test selection applies to an object and to each item of a list."""
+        item = {"a": 1, "b": 2, "c": 3}
+
+        assert select_fields(item, ("a", "c")) == {"a": 1, "c": 3}
+        assert select_fields([item, item], ("b",)) == [{"b": 2}, {"b": 2}]
+        assert select_fields(item, None) is item
+
+
+class TestTripFields:
+    """Tests for ?fields= on trip endpoints."""
+
+    def test_get_trip(self, client, test_trip, auth_headers):
+        """Test a single trip trimmed to the requested fields."""
+        response = client.get(
+            f"/api/v1/trips/{test_trip.hash_id}?fields=title,hash_id", headers=auth_headers
+        )
+
+        assert response.status_code == 200
+        assert response.json() == {"hash_id": test_trip.hash_id, "title": "Test Trip"}
+
+    def test_get_trip_etag_per_fieldset(self, client, test_trip, auth_headers):
+        """Test each fieldset validates against its own ETag."""
+        url = f"/api/v1/trips/{test_trip.hash_id}"
+        full = client.get(url, headers=auth_headers).headers["etag"]
+        trimmed = client.get(f"{url}?fields=title", headers=auth_headers).headers["etag"]
+
+        assert full != trimmed
+        again = client.get(
+            f"{url}?fields=title", headers={**auth_headers, "If-None-Match": trimmed}
+        )
+        assert again.status_code == 304
+
+    def test_list_trips(self, client, test_trip, auth_headers):
+        """Test the trip list trimmed to the requested fields."""
+        response = client.get("/api/v1/trips?fields=hash_id", headers=auth_headers)
+
+        assert response.json() == [{"hash_id": test_trip.hash_id}]
+
+    @pytest.mark.parametrize("fields", ["owner", "title,secret", ","])
+    def test_unknown_fields(self, client, test_trip, auth_headers, fields):
+        """Test unknown or empty selections are rejected."""
+        response = client.get(f"/api/v1/trips?fields={fields}", headers=auth_headers)
+
+        assert response.status_code == 400
+
+
+class TestMemberAndExpenseFields:
+    """Tests for ?fields= on members and expenses."""
+
+    def test_members(self, client, test_trip_with_multiple_users, auth_headers):
+        """Test members trimmed to the requested fields, in schema order."""
+        url = f"/api/v1/trips/{test_trip_with_multiple_users.hash_id}/members"
+
+        response = client.get(f"{url}?fields=user_name,user_id", headers=auth_headers)
+
+        assert response.status_code == 200
+        assert [list(m) for m in response.json()] == [["user_id", "user_name"]] * 2
+        # the full list is cached separately
+        assert "id" in client.get(url, headers=auth_headers).json()[0]
+
+    def test_expenses(self, client, test_trip, test_user, auth_headers):
+        """Test expenses trimmed to the requested fields."""
+        url = f"/api/v1/trips/{test_trip.hash_id}/expenses"
+        client.post(
+            url,
+            json={
+                "amount": 12.5,
+                "description": "Snacks",
+                "debtors": [{"userId": str(test_user.id), "value": 12.5}],
+            },
+            headers=auth_headers,
+        )
+
+        response = client.get(f"{url}?fields=amount,description", headers=auth_headers)
+
+        assert response.json() == [{"amount": 12.5, "description": "Snacks"}]
@@ -0,0 +1,171 @@
+"""Tests for the negative-lookup filters over trip hashes and user tokens."""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.core import config, metrics
+from app.core.bloom import BloomFilter
+from app.db.session import engine
+from app.models.trip import Trip
+from app.models.user import User
+from app.services.known_ids import KnownIds, trip_hashes, user_tokens
+from tests.conftest import TestingSessionLocal
+
+
+def _lookups(name, result):
+    return metrics.REGISTRY.get("known_ids_lookups_total").value(filter=name, result=result)
+
+
+class BlockedSession:
+    """Session whose lookups wait for ``release``, recording each query."""
+
+    def __init__(self, release, lookups):
+        self.release = release
+        self.lookups = lookups
+        self.session = TestingSessionLocal()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.session.close()
+
+    def execute(self, query):
+        self.lookups.append(query)
+        self.release.wait(2)
+        return self.session.execute(query)
+
+
+class TestBloomFilter:
+    """Unit tests for the Bloom filter itself."""
+
+    def test_no_false_negatives(self):
+        """Test that every added key is reported present."""
+        bloom = BloomFilter(1000, 0.01)
+        keys = [f"trip-{i}" for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        assert all(key in bloom for key in keys)
+        assert len(bloom) == 1000
+
+    def test_false_positive_rate_near_target(self):
+        """Test that a filter at capacity stays near its configured error rate."""
+        bloom = BloomFilter(2000, 0.01)
+        for i in range(2000):
+            bloom.add(f"trip-{i}")
+        false_positives = sum(f"other-{i}" in bloom for i in range(20000))
+        assert false_positives / 20000 < 0.02
+        assert bloom.false_positive_rate() == pytest.approx(0.01, rel=0.2)
+
+    def test_rejects_invalid_error_rate(self):
+        """Test that the error rate must be a probability."""
+        with pytest.raises(ValueError):
+            BloomFilter(10, 0)
+
+
+class TestKnownIds:
+    """Tests for filter-backed trip and user lookups."""
+
+    def test_built_at_startup(self, client, test_trip, auth_headers):
+        """Test that the filters are loaded when the app starts, before any lookup."""
+        assert trip_hashes.stats()["loaded"] is True
+        assert user_tokens.stats()["loaded"] is True
+
+    def test_unknown_trip_is_confirmed_missing(self, client, test_trip, auth_headers):
+        """Test that a hash the filter never saw is checked before the 404."""
+        rejected = _lookups("trip_hashes", "rejected")
+        response = client.get("/api/v1/trips/no_such_trip/members", headers=auth_headers)
+        assert response.status_code == 404
+        assert _lookups("trip_hashes", "rejected") == rejected + 1
+
+    def test_rows_from_other_workers_are_found(self, client, db_session, test_trip, auth_headers):
+        """Test that values missing from the filter but present in the database are served."""
+        trip_hashes.load()
+        user_tokens.load()
+        # inserted behind this worker's back, as another worker would
+        db_session.add_all(
+            [User(token="late_token", user_id="late_user"), Trip(title="Late", hash_id="late_trip")]
+        )
+        db_session.commit()
+
+        response = client.get("/api/v1/trips/late_trip", headers={"X-User-Hash": "late_token"})
+
+        assert response.status_code == 200
+        assert "late_trip" in trip_hashes._filter
+        assert "late_token" in user_tokens._filter
+
+    def test_concurrent_misses_share_a_lookup(self, db_session):
+        """Test that misses queued during a lookup are checked together in the next one."""
+        release = threading.Event()
+        lookups = []
+        known = KnownIds(
+            "test_known", Trip.hash_id, 0.01, session_factory=lambda: BlockedSession(release, lookups)
+        )
+        known._filter = BloomFilter(100, 0.01)
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            first = pool.submit(known.might_exist, "scan-0")
+            while not lookups:
+                time.sleep(0.001)
+            rest = [pool.submit(known.might_exist, f"scan-{i}") for i in range(1, 20)]
+            while len(known._pending) < 19:
+                time.sleep(0.001)
+            release.set()
+            results = [first.result()] + [f.result() for f in rest]
+
+        assert results == [False] * 20
+        assert len(lookups) == 2
+
+    def test_slow_lookup_falls_back_to_own_query(self, monkeypatch):
+        """Test that a request stops waiting for a stuck lookup and lets its own query decide."""
+        monkeypatch.setattr(config, "KNOWN_IDS_LOOKUP_TIMEOUT", 0.05)
+        release = threading.Event()
+        known = KnownIds(
+            "test_stuck", Trip.hash_id, 0.01, session_factory=lambda: BlockedSession(release, [])
+        )
+        known._filter = BloomFilter(100, 0.01)
+        try:
+            assert known.might_exist("stuck-1") is True
+            assert asyncio.run(known.might_exist_async("stuck-2")) is True
+            assert _lookups("test_stuck", "timed_out") == 2
+        finally:
+            release.set()
+
+    def test_lookups_use_own_connection(self):
+        """Test that the lookup thread does not draw on the request pool."""
+        known = KnownIds("test_own", Trip.hash_id, 0.01)
+        with known._session() as db:
+            bind = db.get_bind()
+
+        assert bind is not engine
+        assert bind.pool.size() == 1
+        bind.dispose()
+
+    def test_created_values_are_added(self, client, auth_headers, test_user):
+        """Test that trips and users created by this worker are known at once."""
+        token = client.post("/api/v1/users").json()["token"]
+        trip = client.post(
+            "/api/v1/trips", json={"title": "New", "user_name": "Me"}, headers=auth_headers
+        ).json()
+
+        assert trip["hash_id"] in trip_hashes._filter
+        assert token in user_tokens._filter
+
+    def test_disabled(self, client, monkeypatch, test_trip, auth_headers):
+        """Test that KNOWN_IDS_FILTER=false always goes to the database."""
+        monkeypatch.setattr(config, "KNOWN_IDS_FILTER", False)
+        passed = _lookups("trip_hashes", "passed")
+        assert client.get(f"/api/v1/trips/{test_trip.hash_id}/members", headers=auth_headers).status_code == 200
+        assert client.get("/api/v1/trips/no_such_trip/members", headers=auth_headers).status_code == 404
+        assert _lookups("trip_hashes", "passed") == passed
+
+    def test_stats_in_health(self, client, test_trip, auth_headers):
+        """Test that /health reports the filters' size and expected error rate."""
+        trip_hashes.load()
+        stats = client.get("/health").json()["known_ids"]
+        assert stats["trip_hashes"]["entries"] == 1
+        assert stats["user_tokens"]["loaded"] is True
+        assert 0 <= stats["trip_hashes"]["false_positive_rate"] < config.KNOWN_IDS_ERROR_RATE
@@ -0,0 +1,96 @@
+"""Unit tests for the /metrics endpoint and HTTP request metrics."""
+
+from app.core import metrics
+from app.services import ollama
+
+
+def _sample(text, name, **labels):
+    """Return the value of one sample line in the exposition text, or None."""
+    wanted = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    prefix = f"{name}{{{wanted}}} " if labels else f"{name} "
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+    return None
+
+
+class TestHTTPMetrics:
+    """Tests for per-route request counts and latency."""
+
+    def test_requests_labelled_by_route_template(self, client, test_trip, auth_headers):
+        """Test that trip hashes collapse into the route template label."""
+        route = "/api/v1/trips/{hash_id}/members"
+        before = metrics.REGISTRY.get("http_requests_total").value(
+            method="GET", route=route, status="2xx"
+        )
+
+        client.get(f"/api/v1/trips/{test_trip.hash_id}/members", headers=auth_headers)
+        client.get(f"/api/v1/trips/{test_trip.hash_id}/members", headers=auth_headers)
+
+        text = client.get("/metrics").text
+        assert _sample(text, "http_requests_total", method="GET", route=route, status="2xx") == before + 2
+        assert test_trip.hash_id not in text
+        assert f'http_request_duration_seconds_bucket{{method="GET",route="{route}",le="+Inf"}}' in text
+
+    def test_status_classes(self, client, auth_headers):
+        """Test that client errors and unmatched paths are counted separately."""
+        client.get("/api/v1/trips/missing", headers=auth_headers)
+        client.get("/no-such-route")
+
+        text = client.get("/metrics").text
+        assert _sample(
+            text, "http_requests_total", method="GET", route="/api/v1/trips/{hash_id}", status="4xx"
+        ) >= 1
+        assert _sample(
+            text, "http_requests_total", method="GET", route="unmatched", status="4xx"
+        ) >= 1
+
+    def test_in_flight_gauge(self, client):
+        """Test that the scrape itself is the only request in flight."""
+        text = client.get("/metrics").text
+        assert _sample(text, "http_requests_in_flight") == 1
+
+
+class TestExportedMetrics:
+    """Tests for pool, chat backend and cache metrics on /metrics."""
+
+    def test_cache_hit_ratio(self, client, test_trip, auth_headers, monkeypatch):
+        """Test that the trip context cache reports its hit ratio."""
+
+        async def _generate(prompt, model=None):
+            return "ok"
+
+        monkeypatch.setattr(ollama, "generate", _generate)
+        for _ in range(2):
+            client.post(
+                f"/api/v1/trips/{test_trip.hash_id}/chat",
+                json={"message": "Hi"},
+                headers=auth_headers,
+            )
+
+        ratio = _sample(client.get("/metrics").text, "cache_hit_ratio", cache="trip_context")
+        assert 0 < ratio < 1
+
+    def test_cache_hit_ratio_empty(self):
+        """Test that an unused cache reports a ratio of zero, not an error."""
+        hits = metrics.counter("test_ratio_hits_total", "Test hits.")
+        misses = metrics.counter("test_ratio_misses_total", "Test misses.")
+        metrics.cache_hit_ratio("test_ratio", hits, misses)
+        gauge = metrics.REGISTRY.get("cache_hit_ratio")
+
+        assert gauge.value(cache="test_ratio") == 0.0
+        hits.inc(3)
+        misses.inc()
+        assert gauge.value(cache="test_ratio") == 0.75
+
+    def test_chat_and_pool_metrics(self, client):
+        """Test that chat backend and pool families are declared."""
+        text = client.get("/metrics").text
+
+        for family in (
+            "chat_model_latency_seconds",
+            "chat_model_errors_total",
+            "chat_breaker_state",
+            "db_pool_checkout_wait_seconds",
+        ):
+            assert f"# TYPE {family} " in text
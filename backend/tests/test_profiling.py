@@ -0,0 +1,141 @@
+"""Unit tests for on-demand request profiling."""
+
+import json
+import pstats
+import time
+import tracemalloc
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.profiling import ProfilingMiddleware, instrument_sync_endpoints
+from app.main import app as main_app
+
+
+def _busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+
+
+def _slow_calendar():
+    _busy(0.05)
+    return {"ok": True}
+
+
+@pytest.fixture
+def profiled_app(tmp_path):
+    """A small app with one sync and one async endpoint behind the profiler."""
+    app = FastAPI()
+
+    @app.get("/sync")
+    def sync_endpoint():
+        return _slow_calendar()
+
+    @app.get("/async")
+    async def async_endpoint():
+        _busy(0.05)
+        return {"ok": True}
+
+    instrument_sync_endpoints(app)
+    app.add_middleware(ProfilingMiddleware, token="secret", directory=str(tmp_path))
+    return TestClient(app), tmp_path
+
+
+class TestProfilingMiddleware:
+    """Tests for the X-Profile gated profiler."""
+
+    def test_not_profiled_without_token(self, profiled_app):
+        """Test that requests without the admin header are untouched."""
+        client, directory = profiled_app
+
+        response = client.get("/sync")
+        wrong = client.get("/sync", headers={"X-Profile": "guess"})
+
+        assert "x-profile-id" not in response.headers
+        assert "x-profile-id" not in wrong.headers
+        assert list(directory.iterdir()) == []
+
+    def test_non_ascii_header_not_profiled(self, profiled_app):
+        """Test that a non-ASCII X-Profile value is simply a wrong token, not an error."""
+        client, directory = profiled_app
+
+        response = client.get("/sync", headers={"X-Profile": "\u00e9".encode("latin-1")})
+
+        assert response.status_code == 200
+        assert "x-profile-id" not in response.headers
+        assert list(directory.iterdir()) == []
+
+    def test_sampling_profile_sync_endpoint(self, profiled_app):
+        """Test that samples are taken from the threadpool worker."""
+        client, directory = profiled_app
+
+        response = client.get("/sync", headers={"X-Profile": "secret"})
+
+        profile_id = response.headers["x-profile-id"]
+        data = json.loads((directory / f"{profile_id}.speedscope.json").read_text())
+        names = {f["name"] for f in data["shared"]["frames"]}
+        assert data["profiles"][0]["type"] == "sampled"
+        assert data["profiles"][0]["samples"]
+        assert "_slow_calendar" in names
+
+    def test_sampling_profile_async_endpoint(self, profiled_app):
+        """Test that event loop samples are attributed to the request."""
+        client, directory = profiled_app
+
+        response = client.get("/async", headers={"X-Profile": "secret"})
+
+        data = json.loads(
+            (directory / f"{response.headers['x-profile-id']}.speedscope.json").read_text()
+        )
+        names = {f["name"] for f in data["shared"]["frames"]}
+        assert "async_endpoint" in names
+
+    def test_cprofile_mode(self, profiled_app):
+        """Test that cProfile output includes the sync endpoint's calls."""
+        client, directory = profiled_app
+
+        response = client.get(
+            "/sync", headers={"X-Profile": "secret", "X-Profile-Mode": "cprofile"}
+        )
+
+        stats = pstats.Stats(str(directory / f"{response.headers['x-profile-id']}.pstats"))
+        functions = {name for (_, _, name) in stats.stats}
+        assert "_slow_calendar" in functions
+
+    def test_tracemalloc_snapshot(self, profiled_app):
+        """Test that a memory snapshot is written when requested."""
+        client, directory = profiled_app
+
+        response = client.get(
+            "/async", headers={"X-Profile": "secret", "X-Profile-Memory": "1"}
+        )
+
+        snapshot = tracemalloc.Snapshot.load(
+            str(directory / f"{response.headers['x-profile-id']}.tracemalloc")
+        )
+        assert snapshot.traces is not None
+        assert not tracemalloc.is_tracing()
+
+    def test_profile_all_requests(self, tmp_path):
+        """Test that the environment flag profiles requests without a header."""
+        app = FastAPI()
+
+        @app.get("/ping")
+        async def ping():
+            return {"ok": True}
+
+        app.add_middleware(ProfilingMiddleware, profile_all=True, directory=str(tmp_path))
+
+        response = TestClient(app).get("/ping")
+
+        assert (tmp_path / f"{response.headers['x-profile-id']}.speedscope.json").exists()
+
+
+def test_main_app_sync_endpoints_instrumented():
+    """Test that the API's sync endpoints can join a request profile."""
+    calendar = next(
+        r for r in main_app.routes if getattr(r, "path", "") == "/api/v1/trips/{hash_id}/calendar"
+    )
+    assert getattr(calendar.dependant.call, "_joins_profile", False)
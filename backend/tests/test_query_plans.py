@@ -0,0 +1,199 @@
+"""Query-plan regression tests for the hot per-trip endpoints.
+
+Every statement issued while serving a request is captured, run through
+``EXPLAIN QUERY PLAN`` on the seeded test database and rejected when SQLite
+would scan a whole table instead of using an index. Dropping or reshaping an
+index that a router depends on makes these tests fail.
+"""
+
+import re
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.models.user import User
+from app.models.trip import Trip
+from app.models.user_trip import UserTrip
+from app.models.trip_date import TripDate
+from app.models.user_availability import UserAvailability
+from app.models.expense import Expense, ExpenseShare
+from app.services import ollama
+
+LARGE_TABLES = {
+    "users",
+    "trips",
+    "user_trips",
+    "trip_dates",
+    "user_availability",
+    "expenses",
+    "expense_shares",
+}
+
+# "SCAN trips" on newer SQLite, "SCAN TABLE trips" on older releases; index
+# scans ("SCAN t USING INDEX ...") are fine
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?!.*USING)")
+
+
+@pytest.fixture
+def seeded(db_session):
+    """A populated database: many trips, members, dates and expenses."""
+    users = [User(token=f"tok_{i}", user_id=f"user_{i}") for i in range(40)]
+    db_session.add_all(users)
+    db_session.flush()
+
+    start = date(2026, 7, 1)
+    trips = []
+    for t in range(20):
+        trip = Trip(title=f"Trip {t}", description="Seeded", hash_id=f"seed_{t}")
+        db_session.add(trip)
+        db_session.flush()
+        trips.append(trip)
+
+        members = users[t:t + 8]
+        for n, user in enumerate(members):
+            db_session.add(UserTrip(user_id=user.id, trip_id=trip.id, user_name=f"M{n}"))
+
+        for d in range(14):
+            trip_date = TripDate(trip_id=trip.id, date=start + timedelta(days=d))
+            db_session.add(trip_date)
+            db_session.flush()
+            for user in members:
+                db_session.add(
+                    UserAvailability(
+                        trip_date_id=trip_date.id,
+                        user_id=user.id,
+                        status="available" if (user.id + d) % 3 else "maybe",
+                    )
+                )
+
+        for e in range(10):
+            expense = Expense(
+                trip_id=trip.id,
+                payer_user_id=members[e % len(members)].id,
+                amount=80.0,
+                description=f"Expense {e}",
+                currency="EUR",
+            )
+            db_session.add(expense)
+            db_session.flush()
+            for user in members[:4]:
+                db_session.add(
+                    ExpenseShare(
+                        expense_id=expense.id, user_id=user.id, share_type="equal", value=20.0
+                    )
+                )
+
+    db_session.commit()
+    return {"user": users[5], "other": users[6], "trip": trips[5]}
+
+
+@pytest.fixture
+def captured_sql():
+    """Record every statement sent to any engine while the test runs."""
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(Engine, "before_cursor_execute", _record)
+    yield statements
+    event.remove(Engine, "before_cursor_execute", _record)
+
+
+def _full_scans(db_session, statements):
+    """Return ``(table, statement)`` pairs whose plan scans a large table."""
+    connection = db_session.connection()
+    offenders = []
+    for statement, parameters in statements:
+        if not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            continue
+        plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        for row in plan:
+            match = _SCAN.match(row[-1])
+            if match and match.group(1) in LARGE_TABLES:
+                offenders.append((match.group(1), statement))
+    return offenders
+
+
+class TestHotQueryPlans:
+    """Hot endpoints must be served entirely by indexed lookups."""
+
+    def _assert_indexed(self, db_session, captured_sql):
+        assert captured_sql, "no SQL captured"
+        offenders = _full_scans(db_session, captured_sql)
+        assert not offenders, "full table scans:\n" + "\n".join(
+            f"{table}: {sql}" for table, sql in offenders
+        )
+
+    def test_read_endpoints(self, client, seeded, db_session, captured_sql):
+        """Test trip, member, date, calendar and ledger reads use indexes."""
+        headers = {"X-User-Hash": seeded["user"].token}
+        hash_id = seeded["trip"].hash_id
+        for path in (
+            "/api/v1/trips",
+            f"/api/v1/trips/{hash_id}",
+            f"/api/v1/trips/{hash_id}/members",
+            f"/api/v1/trips/{hash_id}/dates",
+            f"/api/v1/trips/{hash_id}/calendar",
+            f"/api/v1/trips/{hash_id}/expenses",
+            f"/api/v1/trips/{hash_id}/settlements",
+        ):
+            response = client.get(path, headers=headers)
+            assert response.status_code == 200, path
+
+        self._assert_indexed(db_session, captured_sql)
+
+    def test_write_endpoints(self, client, seeded, db_session, captured_sql):
+        """Test availability and expense writes use indexes."""
+        headers = {"X-User-Hash": seeded["user"].token}
+        hash_id = seeded["trip"].hash_id
+
+        response = client.post(
+            f"/api/v1/trips/{hash_id}/availability",
+            json={"updates": [{"date": "2026-07-03", "status": "unavailable"}]},
+            headers=headers,
+        )
+        assert response.status_code == 200
+
+        response = client.post(
+            f"/api/v1/trips/{hash_id}/expenses",
+            json={
+                "amount": 30.0,
+                "description": "Taxi",
+                "currency": "EUR",
+                "debtors": [
+                    {"userId": str(seeded["user"].id), "shareType": "equal", "value": 15.0},
+                    {"userId": str(seeded["other"].id), "shareType": "equal", "value": 15.0},
+                ],
+            },
+            headers=headers,
+        )
+        assert response.status_code == 200
+
+        self._assert_indexed(db_session, captured_sql)
+
+    def test_chat_context(self, client, seeded, db_session, captured_sql, monkeypatch):
+        """Test building the chat trip context uses indexes."""
+
+        async def _generate(prompt, model=None):
+            return "ok"
+
+        monkeypatch.setattr(ollama, "generate", _generate)
+        response = client.post(
+            f"/api/v1/trips/{seeded['trip'].hash_id}/chat",
+            json={"message": "When should we go?"},
+            headers={"X-User-Hash": seeded["user"].token},
+        )
+        assert response.status_code == 200
+
+        self._assert_indexed(db_session, captured_sql)
+
+    def test_detects_missing_index(self, seeded, db_session, captured_sql):
+        """Test the checker flags a lookup on an unindexed column."""
+        db_session.query(Expense).filter(Expense.description == "Expense 3").all()
+
+        offenders = _full_scans(db_session, captured_sql)
+        assert [table for table, _ in offenders] == ["expenses"]
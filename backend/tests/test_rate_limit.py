@@ -0,0 +1,206 @@
+"""Tests for token-bucket rate limiting."""
+
+from typing import Optional
+
+import pytest
+from fastapi import Depends, FastAPI, Header
+from fastapi.testclient import TestClient
+
+from app.core import config, metrics, rate_limit
+from app.core.rate_limit import MemoryStore, SQLStore, parse_budget, rate_limited
+from app.routers import chat
+from app.services import ollama
+from tests.conftest import engine
+
+
+def _rejected(route, scope):
+    return metrics.REGISTRY.get("rate_limit_decisions_total").value(
+        route=route, scope=scope, decision="rejected"
+    )
+
+
+def _client(**budgets):
+    app = FastAPI()
+    limit = rate_limited("test_route", **budgets)
+
+    @app.post("/trips/{hash_id}/ping", dependencies=[Depends(limit)])
+    async def ping(hash_id: str, x_user_hash: Optional[str] = Header(None)):
+        # stands in for a handler that has authenticated the caller
+        await limit.charge(user=x_user_hash, trip=hash_id)
+        return {"ok": True}
+
+    return TestClient(app)
+
+
+class TestParseBudget:
+    """Tests for the ``N/S`` budget format."""
+
+    def test_burst_and_rate(self):
+        """Test that N/S gives a burst of N refilled at N per S seconds."""
+        assert parse_budget("20/60") == (20.0, 20.0 / 60)
+
+    def test_empty_or_zero_disables(self):
+        """Test that an empty or zero budget disables the limit."""
+        assert parse_budget("") is None
+        assert parse_budget("0/60") is None
+
+
+class TestMemoryStore:
+    """Tests for the per-process bucket store."""
+
+    def test_burst_then_wait(self):
+        """Test that a bucket allows its burst and then reports the wait."""
+        store = MemoryStore()
+        assert [store.take("k", 3, 1.0, 100.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+        assert store.take("k", 3, 1.0, 100.0) == pytest.approx(1.0)
+        assert store.take("k", 3, 1.0, 100.5) == pytest.approx(0.5)
+
+    def test_refill_is_capped_at_burst(self):
+        """Test that an idle bucket refills to its burst and no further."""
+        store = MemoryStore()
+        store.take("k", 2, 1.0, 0.0)
+        assert store.take("k", 2, 1.0, 1000.0) == 0.0
+        assert store.take("k", 2, 1.0, 1000.0) == 0.0
+        assert store.take("k", 2, 1.0, 1000.0) > 0
+
+    def test_full_buckets_are_swept(self):
+        """Test that refilled buckets are dropped once the key limit is hit."""
+        store = MemoryStore(max_keys=2)
+        store.take("a", 1, 1.0, 0.0)
+        store.take("b", 1, 1.0, 0.0)
+        store.take("c", 1, 1.0, 10.0)
+        assert set(store._buckets) == {"c"}
+
+
+class TestSQLStore:
+    """Tests for the shared store backed by ``rate_limit_buckets``."""
+
+    def test_burst_then_wait(self, db_session):
+        """Test that the table enforces the same bucket math as memory."""
+        store = SQLStore(engine)
+        assert [store.take("k", 2, 0.5, 100.0) for _ in range(2)] == [0.0, 0.0]
+        assert store.take("k", 2, 0.5, 100.0) == pytest.approx(2.0)
+        assert store.take("k", 2, 0.5, 102.0) == 0.0
+        assert store.take("other", 2, 0.5, 102.0) == 0.0
+
+    def test_stores_share_buckets(self, db_session):
+        """Test that two stores on one database (two workers) share a budget."""
+        first, second = SQLStore(engine), SQLStore(engine)
+        assert first.take("k", 2, 1.0, 0.0) == 0.0
+        assert second.take("k", 2, 1.0, 0.0) == 0.0
+        assert first.take("k", 2, 1.0, 0.0) > 0
+
+    def test_sweeps_idle_rows(self, db_session):
+        """Test that rows idle past ``idle_after`` are deleted."""
+        store = SQLStore(engine, idle_after=60, sweep_every=2)
+        store.take("idle", 1, 1.0, 0.0)
+        store.take("busy", 1, 1.0, 100.0)
+        with engine.connect() as conn:
+            keys = [row.key for row in conn.execute(store.table.select())]
+        assert keys == ["busy"]
+
+
+class TestRateLimitedDependency:
+    """Tests for the per-route limit."""
+
+    def test_unknown_scope(self):
+        """Test that budgets must name a known scope."""
+        with pytest.raises(ValueError):
+            rate_limited("test_route", header="1/60")
+
+    def test_rejects_with_retry_after(self):
+        """Test that an empty bucket answers 429 with Retry-After."""
+        client = _client(user="2/60")
+        headers = {"X-User-Hash": "alice"}
+        for _ in range(2):
+            assert client.post("/trips/t1/ping", headers=headers).status_code == 200
+        before = _rejected("test_route", "user")
+
+        response = client.post("/trips/t1/ping", headers=headers)
+
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "30"
+        assert _rejected("test_route", "user") == before + 1
+
+    def test_user_buckets_are_separate(self):
+        """Test that each user hash gets its own bucket."""
+        client = _client(user="1/60")
+        assert client.post("/trips/t1/ping", headers={"X-User-Hash": "alice"}).status_code == 200
+        assert client.post("/trips/t1/ping", headers={"X-User-Hash": "bob"}).status_code == 200
+        assert client.post("/trips/t1/ping", headers={"X-User-Hash": "alice"}).status_code == 429
+
+    def test_trip_bucket_is_shared_by_members(self):
+        """Test that the trip scope limits all callers of one trip together."""
+        client = _client(user="10/60", trip="2/60")
+        assert client.post("/trips/t1/ping", headers={"X-User-Hash": "alice"}).status_code == 200
+        assert client.post("/trips/t1/ping", headers={"X-User-Hash": "bob"}).status_code == 200
+        assert client.post("/trips/t1/ping", headers={"X-User-Hash": "carol"}).status_code == 429
+        assert client.post("/trips/t2/ping", headers={"X-User-Hash": "carol"}).status_code == 200
+
+    def test_disabled(self, monkeypatch):
+        """Test that RATE_LIMIT_ENABLED=false lets everything through."""
+        monkeypatch.setattr(config, "RATE_LIMIT_ENABLED", False)
+        client = _client(ip="1/60")
+        assert all(client.post("/trips/t1/ping").status_code == 200 for _ in range(3))
+
+    def test_store_failure_fails_open(self, monkeypatch):
+        """Test that requests pass when the store is unavailable."""
+
+        class BrokenStore(MemoryStore):
+            def take(self, *args):
+                raise RuntimeError("database is down")
+
+        monkeypatch.setattr(rate_limit, "_store", BrokenStore())
+        client = _client(ip="1/60")
+        assert all(client.post("/trips/t1/ping").status_code == 200 for _ in range(3))
+
+
+class TestUserCreateLimit:
+    """Tests for the per-address budget on anonymous sign-up."""
+
+    def test_create_user_is_limited_per_ip(self, client):
+        """Test that POST /users is rejected once the address's budget is spent."""
+        burst, _ = parse_budget(config.RATE_LIMIT_USER_CREATE_IP)
+        for _ in range(int(burst)):
+            assert client.post("/api/v1/users").status_code == 200
+
+        response = client.post("/api/v1/users")
+
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+
+
+class TestChatLimit:
+    """Tests for the chat budgets, charged only for authenticated members."""
+
+    @pytest.fixture
+    def tight_budgets(self, monkeypatch):
+        async def generate(prompt, model=None):
+            return "Pack sunscreen."
+
+        monkeypatch.setattr(ollama, "generate", generate)
+        monkeypatch.setattr(chat, "_chat_limit", rate_limited("chat", user="2/60", trip="3/60"))
+
+    def test_unauthenticated_requests_spend_nothing(self, client, test_trip, auth_headers, tight_budgets):
+        """Test that requests with made-up tokens cannot drain the trip's budget."""
+        url = f"/api/v1/trips/{test_trip.hash_id}/chat"
+        for i in range(10):
+            response = client.post(url, json={"message": "hi"}, headers={"X-User-Hash": f"fake{i}"})
+            assert response.status_code == 401
+
+        assert client.post(url, json={"message": "hi"}, headers=auth_headers).status_code == 200
+
+    def test_non_members_spend_nothing(self, client, test_trip, auth_headers, auth_headers2, tight_budgets):
+        """Test that a non-member's rejected requests leave the trip's budget alone."""
+        url = f"/api/v1/trips/{test_trip.hash_id}/chat"
+        for _ in range(5):
+            assert client.post(url, json={"message": "hi"}, headers=auth_headers2).status_code == 403
+
+        assert client.post(url, json={"message": "hi"}, headers=auth_headers).status_code == 200
+
+    def test_user_budget_keyed_on_user(self, client, test_trip, auth_headers, tight_budgets):
+        """Test that a member is limited by their own budget."""
+        url = f"/api/v1/trips/{test_trip.hash_id}/chat/jobs"
+        statuses = [client.post(url, json={"message": "hi"}, headers=auth_headers).status_code for _ in range(3)]
+
+        assert statuses == [202, 202, 429]
@@ -0,0 +1,216 @@
+"""Unit tests for the versioned per-trip response cache."""
+
+import threading
+import time
+from datetime import date
+
+from app.core.response_cache import ResponseCache, ENTRY_OVERHEAD
+from app.db.trip_version import bump_trip_version
+from app.models.trip_date import TripDate
+from app.services.trip_views import response_cache, build_calendar, encode_json
+
+
+def _cache(**kwargs):
+    options = {"max_bytes": 10_000, "stale_budget": 0.05}
+    options.update(kwargs)
+    return ResponseCache("test_response", **options)
+
+
+class TestResponseCache:
+    """Tests for versioning, eviction and stale-while-revalidate."""
+
+    def test_hit_until_version_changes(self):
+        """Test that entries are reused only for the version they were built at."""
+        cache = _cache()
+        builds = []
+
+        def build():
+            builds.append(1)
+            return b"v%d" % len(builds)
+
+        assert cache.get("k", 1, build) == (1, b"v1")
+        assert cache.get("k", 1, build) == (1, b"v1")
+        assert cache.get("k", 2, build) == (2, b"v2")
+        assert len(builds) == 2
+
+    def test_lru_bounded_by_bytes(self):
+        """Test that least recently used entries are evicted to fit the budget."""
+        cache = _cache(max_bytes=3 * (100 + ENTRY_OVERHEAD))
+        for key in "abc":
+            cache.get(key, 1, lambda: b"x" * 100)
+        cache.get("a", 1, lambda: b"unused")  # touch a
+        cache.get("d", 1, lambda: b"x" * 100)
+
+        assert len(cache) == 3
+        assert cache.size_bytes <= cache.max_bytes
+        assert cache.get("a", 1, lambda: b"rebuilt") == (1, b"x" * 100)
+        assert cache.get("b", 1, lambda: b"rebuilt") == (1, b"rebuilt")
+
+    def test_oversized_body_not_stored(self):
+        """Test that a body larger than the whole budget bypasses the cache."""
+        cache = _cache(max_bytes=500)
+        cache.get("big", 1, lambda: b"x" * 1000)
+
+        assert len(cache) == 0
+
+    def test_stale_while_revalidate(self):
+        """Test that a slow rebuild serves the old body, at its old version, and replaces it later."""
+        cache = _cache()
+        cache.get("k", 1, lambda: b"old")
+        release = threading.Event()
+
+        def slow_refresh():
+            release.wait(2)
+            return b"new"
+
+        assert cache.get("k", 2, lambda: b"inline", slow_refresh) == (1, b"old")
+        release.set()
+        deadline = time.monotonic() + 2
+        while cache.get("k", 2, lambda: b"inline", slow_refresh) != (2, b"new"):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+    def test_fast_refresh_returns_fresh(self):
+        """Test that a rebuild within the budget is returned directly."""
+        cache = _cache(stale_budget=1.0)
+        cache.get("k", 1, lambda: b"old")
+
+        assert cache.get("k", 2, lambda: b"inline", lambda: b"new") == (2, b"new")
+
+    def test_failed_refresh_serves_stale(self):
+        """Test that an error while rebuilding falls back to the old body."""
+        cache = _cache(stale_budget=1.0)
+        cache.get("k", 1, lambda: b"old")
+
+        def broken():
+            raise RuntimeError("database unavailable")
+
+        assert cache.get("k", 2, lambda: b"inline", broken) == (1, b"old")
+
+    def test_stale_not_allowed_waits_for_rebuild(self):
+        """Test that allow_stale=False rebuilds inline instead of serving the old body."""
+        cache = _cache()
+        cache.get("k", 1, lambda: b"old")
+
+        def broken():
+            raise RuntimeError("database unavailable")
+
+        assert cache.get("k", 2, lambda: b"inline", broken, allow_stale=False) == (2, b"inline")
+        assert cache.get("k", 2, lambda: b"unused") == (2, b"inline")
+
+    def test_single_refresh_per_key(self):
+        """Test that concurrent stale readers share one rebuild."""
+        cache = _cache(stale_budget=0.01)
+        cache.get("k", 1, lambda: b"old")
+        calls = []
+        release = threading.Event()
+
+        def refresh():
+            calls.append(1)
+            release.wait(2)
+            return b"new"
+
+        for _ in range(5):
+            assert cache.get("k", 2, lambda: b"inline", refresh) == (1, b"old")
+        release.set()
+        assert len(calls) == 1
+
+
+class TestTripResponseCache:
+    """Tests for the cached trip read endpoints."""
+
+    def _calendar(self, client, trip):
+        return client.get(f"/api/v1/trips/{trip.hash_id}/calendar")
+
+    def test_repeat_reads_hit_cache(self, client, test_trip, db_session):
+        """Test that an unchanged trip is served from cache, byte for byte."""
+        hits = response_cache._hits.value()
+        first = self._calendar(client, test_trip)
+        second = self._calendar(client, test_trip)
+
+        assert second.content == first.content
+        assert second.content == encode_json(build_calendar(db_session, test_trip))
+        assert response_cache._hits.value() == hits + 1
+
+    def test_write_through_api_invalidates(self, client, test_trip, test_user, auth_headers, db_session):
+        """Test that an availability update is visible on the next read."""
+        db_session.add(TripDate(trip_id=test_trip.id, date=date(2026, 7, 15)))
+        db_session.commit()
+        before = self._calendar(client, test_trip).json()
+        assert before["availability"][str(test_user.id)] == {"2026-07-15": "unset"}
+
+        client.post(
+            f"/api/v1/trips/{test_trip.hash_id}/availability",
+            json={"updates": [{"date": "2026-07-15", "status": "available"}]},
+            headers=auth_headers,
+        )
+
+        data = self._calendar(client, test_trip).json()
+        assert data["availability"][str(test_user.id)] == {"2026-07-15": "available"}
+
+    def test_version_bump_from_another_worker(self, client, test_trip, db_session):
+        """Test that a write committed elsewhere invalidates this worker's entry."""
+        self._calendar(client, test_trip)
+        db_session.add(TripDate(trip_id=test_trip.id, date=date(2026, 8, 1)))
+        bump_trip_version(db_session, test_trip.id)
+        db_session.commit()
+
+        assert len(self._calendar(client, test_trip).json()["dates"]) == 1
+
+    def test_members_and_ledger_cached(self, client, test_trip, auth_headers):
+        """Test that members, expenses and settlements keep their response shape."""
+        for path in ("members", "expenses", "settlements", "dates"):
+            first = client.get(f"/api/v1/trips/{test_trip.hash_id}/{path}", headers=auth_headers)
+            second = client.get(f"/api/v1/trips/{test_trip.hash_id}/{path}", headers=auth_headers)
+            assert first.status_code == 200, path
+            assert first.headers["content-type"] == "application/json"
+            assert second.content == first.content
+
+        members = client.get(f"/api/v1/trips/{test_trip.hash_id}/members", headers=auth_headers).json()
+        assert members[0]["user_name"] == "Test User"
+        assert client.get(
+            f"/api/v1/trips/{test_trip.hash_id}/settlements", headers=auth_headers
+        ).json() == {"balances": []}
+
+    def test_stale_body_keeps_its_etag(self, client, test_trip, db_session, monkeypatch):
+        """Test that a stale body is served under its own version's ETag, never the current one."""
+        first = self._calendar(client, test_trip)
+        bump_trip_version(db_session, test_trip.id)
+        db_session.commit()
+
+        def unavailable(*args, **kwargs):
+            raise RuntimeError("database unavailable")
+
+        # the background rebuild fails, so the old body is served
+        monkeypatch.setattr("app.services.trip_views.Session", unavailable)
+        stale = self._calendar(client, test_trip)
+        assert stale.content == first.content
+        assert stale.headers["etag"] == first.headers["etag"]
+
+        # revalidating with that ETag must not confirm the old body as current
+        monkeypatch.undo()
+        response = client.get(
+            f"/api/v1/trips/{test_trip.hash_id}/calendar",
+            headers={"If-None-Match": stale.headers["etag"]},
+        )
+        assert response.status_code == 200
+        assert response.headers["etag"] != first.headers["etag"]
+
+    def test_own_write_never_reads_stale(self, client, test_trip, test_user, auth_headers, monkeypatch):
+        """Test that a caller pinned to the primary by a write reads it, even while rebuilds fail."""
+        path = f"/api/v1/trips/{test_trip.hash_id}/members"
+        assert client.get(path, headers=auth_headers).json()[0]["user_name"] == "Test User"
+
+        def unavailable(*args, **kwargs):
+            raise RuntimeError("database unavailable")
+
+        # a background rebuild would fail and fall back to the old body
+        monkeypatch.setattr("app.services.trip_views.Session", unavailable)
+        write = client.put(
+            f"{path}/{test_user.id}",
+            json={"user_hash": test_user.token, "user_name": "Renamed"},
+            headers=auth_headers,
+        )
+        assert write.status_code == 200
+
+        assert client.get(path, headers=auth_headers).json()[0]["user_name"] == "Renamed"
@@ -0,0 +1,150 @@
+"""Unit tests for single-flight request coalescing."""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.core import metrics
+from app.core.response_cache import ResponseCache
+from app.core.singleflight import SingleFlight, AsyncSingleFlight
+
+
+def _coalesced(group):
+    return metrics.REGISTRY.get("singleflight_calls_total").value(group=group, role="coalesced")
+
+
+class TestSingleFlight:
+    """Tests for the thread-based group used by sync handlers."""
+
+    def test_concurrent_calls_share_result(self):
+        """Test that concurrent callers with one key run the function once."""
+        flight = SingleFlight("test_sync")
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(2)
+            return "calendar"
+
+        before = _coalesced("test_sync")
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            leader = pool.submit(flight.do, "trip-1", compute)
+            started.wait(2)
+            followers = [pool.submit(flight.do, "trip-1", compute) for _ in range(5)]
+            while _coalesced("test_sync") < before + 5:
+                time.sleep(0.005)
+            release.set()
+            results = [leader.result()] + [f.result() for f in followers]
+
+        assert results == ["calendar"] * 6
+        assert len(calls) == 1
+
+    def test_error_shared(self):
+        """Test that followers receive the leader's exception."""
+        flight = SingleFlight("test_sync_error")
+        started = threading.Event()
+        release = threading.Event()
+
+        def broken():
+            started.set()
+            release.wait(2)
+            raise ValueError("db down")
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(flight.do, "k", broken)
+            started.wait(2)
+            follower = pool.submit(flight.do, "k", lambda: "unused")
+            while _coalesced("test_sync_error") < 1:
+                time.sleep(0.005)
+            release.set()
+            for future in (leader, follower):
+                with pytest.raises(ValueError, match="db down"):
+                    future.result()
+
+    def test_no_caching_after_completion(self):
+        """Test that later calls compute again."""
+        flight = SingleFlight("test_sync_seq")
+        counter = iter(range(10))
+
+        assert flight.do("k", lambda: next(counter)) == 0
+        assert flight.do("k", lambda: next(counter)) == 1
+
+
+class TestAsyncSingleFlight:
+    """Tests for the asyncio group used by async handlers."""
+
+    def test_concurrent_coroutines_share_result(self):
+        """Test that gathered callers await one computation."""
+        flight = AsyncSingleFlight("test_async")
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.02)
+            return "context"
+
+        async def main():
+            return await asyncio.gather(*(flight.do("trip-1", compute) for _ in range(5)))
+
+        assert asyncio.run(main()) == ["context"] * 5
+        assert len(calls) == 1
+
+    def test_follower_takes_over_after_leader_cancelled(self):
+        """Test that a cancelled leader doesn't fail the callers sharing its work."""
+        flight = AsyncSingleFlight("test_async_cancel")
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return len(calls)
+
+        async def main():
+            leader = asyncio.create_task(flight.do("k", compute))
+            await asyncio.sleep(0.01)
+            follower = asyncio.create_task(flight.do("k", compute))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await leader
+            return await follower
+
+        assert asyncio.run(main()) == 2
+
+    def test_error_shared(self):
+        """Test that every waiter sees the leader's exception."""
+        flight = AsyncSingleFlight("test_async_error")
+
+        async def broken():
+            await asyncio.sleep(0.01)
+            raise ValueError("backend down")
+
+        async def main():
+            return await asyncio.gather(
+                *(flight.do("k", broken) for _ in range(3)), return_exceptions=True
+            )
+
+        assert all(isinstance(r, ValueError) for r in asyncio.run(main()))
+
+
+def test_response_cache_coalesces_misses():
+    """Test that concurrent misses on one trip view build it once."""
+    cache = ResponseCache("test_flight_cache", max_bytes=10_000, stale_budget=0)
+    builds = []
+
+    def build():
+        builds.append(1)
+        time.sleep(0.05)
+        return b"{}"
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: cache.get(("calendar", 1, ()), 1, build), range(8)))
+
+    assert results == [(1, b"{}")] * 8
+    assert len(builds) == 1
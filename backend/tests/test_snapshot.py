@@ -0,0 +1,115 @@
+"""Tests for the GET /trips/{hash_id}/snapshot endpoint."""
+
+from datetime import date
+
+from app.db.trip_version import bump_trip_version
+from app.models.trip_date import TripDate
+from app.services.trip_views import response_cache
+from app.models.user_availability import UserAvailability
+from app.models.expense import Expense, ExpenseShare
+
+
+def _seed(db_session, trip, users, expenses, first_day=1):
+    for day in range(first_day, first_day + 3):
+        trip_date = TripDate(trip_id=trip.id, date=date(2025, 9, day))
+        db_session.add(trip_date)
+        db_session.flush()
+        for user in users:
+            db_session.add(UserAvailability(trip_date_id=trip_date.id, user_id=user.id, status="available"))
+    for i in range(expenses):
+        payer = users[i % len(users)]
+        expense = Expense(trip_id=trip.id, payer_user_id=payer.id, amount=12.0, currency="EUR", description=f"e{i}")
+        db_session.add(expense)
+        db_session.flush()
+        for user in users:
+            db_session.add(ExpenseShare(expense_id=expense.id, user_id=user.id, share_type="equal", value=12.0 / len(users)))
+    db_session.commit()
+
+
+class TestTripSnapshot:
+    """Tests for GET /trips/{hash_id}/snapshot."""
+
+    url = "/api/v1/trips/multi_trip_123/snapshot"
+
+    def test_matches_single_endpoints(self, client, db_session, test_trip_with_multiple_users, test_user, test_user2, auth_headers):
+        """Test each section equals the payload of its own endpoint."""
+        _seed(db_session, test_trip_with_multiple_users, [test_user, test_user2], 3)
+
+        response = client.get(self.url, headers=auth_headers)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert list(data) == ["trip", "members", "calendar", "expenses", "settlements"]
+        base = "/api/v1/trips/multi_trip_123"
+        assert data["trip"] == client.get(base, headers=auth_headers).json()
+        for section in ("members", "calendar", "expenses", "settlements"):
+            assert data[section] == client.get(f"{base}/{section}", headers=auth_headers).json()
+
+    def test_selected_sections(self, client, test_trip_with_multiple_users, auth_headers):
+        """Test only requested sections are returned, in canonical order."""
+        response = client.get(f"{self.url}?sections=settlements, members", headers=auth_headers)
+
+        assert response.status_code == 200
+        assert list(response.json()) == ["members", "settlements"]
+
+    def test_unknown_section(self, client, test_trip_with_multiple_users, auth_headers):
+        """Test unknown section names are rejected."""
+        response = client.get(f"{self.url}?sections=members,photos", headers=auth_headers)
+
+        assert response.status_code == 400
+        assert "photos" in response.json()["detail"]
+
+    def test_requires_membership(self, client, db_session, test_trip, test_user2, auth_headers2):
+        """Test that non-members cannot read a trip snapshot."""
+        response = client.get(f"/api/v1/trips/{test_trip.hash_id}/snapshot", headers=auth_headers2)
+
+        assert response.status_code == 403
+
+    def test_trip_not_found(self, client, test_user, auth_headers):
+        """Test snapshot of a missing trip."""
+        response = client.get("/api/v1/trips/nope/snapshot", headers=auth_headers)
+
+        assert response.status_code == 404
+
+    def test_single_etag(self, client, test_trip_with_multiple_users, test_user, auth_headers):
+        """Test one ETag covers the document and changes with any write."""
+        first = client.get(self.url, headers=auth_headers)
+        etag = first.headers["etag"]
+
+        again = client.get(self.url, headers={**auth_headers, "If-None-Match": etag})
+        assert again.status_code == 304
+
+        other = client.get(f"{self.url}?sections=members", headers=auth_headers)
+        assert other.headers["etag"] != etag
+
+        client.post(
+            "/api/v1/trips/multi_trip_123/expenses",
+            json={
+                "payerId": str(test_user.id),
+                "amount": 10,
+                "currency": "EUR",
+                "description": "coffee",
+                "debtors": [{"userId": str(test_user.id), "shareType": "equal", "value": 10}],
+            },
+            headers=auth_headers,
+        )
+        after = client.get(self.url, headers={**auth_headers, "If-None-Match": etag})
+        assert after.status_code == 200
+        assert after.json()["expenses"][0]["description"] == "coffee"
+
+    def test_statements_independent_of_size(self, query_budget, db_session, test_trip_with_multiple_users, test_user, test_user2, auth_headers):
+        """Test an uncached snapshot costs the same statements for small and large trips."""
+        # auth, trip, membership, members, calendar (3), expenses (2), settlements (2)
+        budget = 11
+        _seed(db_session, test_trip_with_multiple_users, [test_user, test_user2], 1)
+        query_budget("GET", self.url, budget, headers=auth_headers)
+
+        _seed(db_session, test_trip_with_multiple_users, [test_user, test_user2], 15, first_day=10)
+        bump_trip_version(db_session, test_trip_with_multiple_users.id)
+        db_session.commit()
+        # rebuild inline rather than refreshing a stale entry off-request
+        response_cache.clear()
+        query_budget("GET", self.url, budget, headers=auth_headers)
+
+        # a cached snapshot only resolves the caller and the trip
+        query_budget("GET", self.url, 3, headers=auth_headers)
@@ -0,0 +1,232 @@
+"""Unit tests for request tracing and OTLP export."""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.core import tracing
+from app.services import ollama
+
+INCOMING = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+
+
+class _Collector:
+    def __init__(self):
+        self.traces = []
+
+    def submit(self, trace):
+        self.traces.append(trace)
+
+
+@pytest.fixture
+def collector(monkeypatch):
+    """Capture finished traces instead of exporting them."""
+    collector = _Collector()
+    monkeypatch.setattr(tracing, "_processor", collector)
+    return collector
+
+
+@pytest.fixture
+def trusted(monkeypatch):
+    """Honour traceparent headers from the test client, as from our own gateway."""
+    monkeypatch.setattr(tracing, "trusted_parents", tracing.TrustedSources("*"))
+
+
+def _names(trace):
+    return [s.name for s in trace.spans]
+
+
+class TestTraceparent:
+    """Tests for W3C traceparent parsing."""
+
+    def test_parse_valid(self):
+        """Test that a sampled traceparent is parsed."""
+        assert tracing.parse_traceparent(INCOMING) == (
+            "0af7651916cd43dd8448eb211c80319c", "b7ad6b7169203331", True
+        )
+
+    @pytest.mark.parametrize(
+        "value",
+        ["", "garbage", "00-xyz-b7ad6b7169203331-01", "00-" + "0" * 32 + "-b7ad6b7169203331-01"],
+    )
+    def test_parse_invalid(self, value):
+        """Test that malformed headers are ignored."""
+        assert tracing.parse_traceparent(value) is None
+
+
+class TestTracingMiddleware:
+    """Tests for request, SQL and computation spans."""
+
+    def test_unsampled_by_default(self, client, collector, test_trip, auth_headers):
+        """Test that requests are not traced at the default sample rate."""
+        response = client.get(f"/api/v1/trips/{test_trip.hash_id}/members", headers=auth_headers)
+
+        assert "traceparent" not in response.headers
+        assert collector.traces == []
+
+    def test_not_sampled_flag_respected(self, client, collector, trusted, test_trip, auth_headers):
+        """Test that an upstream decision not to sample is honoured."""
+        client.get(
+            f"/api/v1/trips/{test_trip.hash_id}/members",
+            headers={**auth_headers, "traceparent": INCOMING[:-2] + "00"},
+        )
+
+        assert collector.traces == []
+
+    def test_untrusted_traceparent_ignored(self, client, collector, test_trip, auth_headers):
+        """Test that an outside client cannot force a trace (and SQL export) with a sampled flag."""
+        response = client.get(
+            f"/api/v1/trips/{test_trip.hash_id}/members",
+            headers={**auth_headers, "traceparent": INCOMING},
+        )
+
+        assert "traceparent" not in response.headers
+        assert collector.traces == []
+
+    def test_trusted_sources(self):
+        """Test that only listed addresses and networks are trusted."""
+        sources = tracing.TrustedSources("10.0.0.0/8, 192.168.1.5")
+
+        assert "10.1.2.3" in sources
+        assert "192.168.1.5" in sources
+        assert "192.168.1.6" not in sources
+        assert "testclient" not in sources
+        assert None not in sources
+        assert "203.0.113.9" not in tracing.TrustedSources("")
+        assert "203.0.113.9" in tracing.TrustedSources("*")
+
+    def test_no_exporter_no_tracing(self, monkeypatch):
+        """Test that without an exporter requests are not traced, whatever the sample rate."""
+        monkeypatch.setattr(tracing, "_processor", None)
+        monkeypatch.setattr(tracing, "TRACE_EXPORTER", "")
+        seen = []
+
+        async def app(scope, receive, send):
+            seen.append(tracing.current_span())
+
+        middleware = tracing.TracingMiddleware(app, sample_rate=1.0)
+        asyncio.run(middleware({"type": "http", "method": "GET", "path": "/", "headers": []}, None, None))
+
+        assert seen == [None]
+
+    def test_settlements_trace(self, client, collector, trusted, test_trip_with_multiple_users, test_user, test_user2, auth_headers):
+        """Test that auth, SQL and settlement matching appear as child spans."""
+        client.post(
+            f"/api/v1/trips/{test_trip_with_multiple_users.hash_id}/expenses",
+            json={
+                "amount": 40.0,
+                "description": "Fuel",
+                "currency": "EUR",
+                "debtors": [{"userId": str(test_user2.id), "shareType": "equal", "value": 40.0}],
+            },
+            headers=auth_headers,
+        )
+        response = client.get(
+            f"/api/v1/trips/{test_trip_with_multiple_users.hash_id}/settlements",
+            headers={**auth_headers, "traceparent": INCOMING},
+        )
+
+        assert response.status_code == 200
+        (trace,) = collector.traces
+        root = trace.spans[0]
+        assert trace.trace_id == "0af7651916cd43dd8448eb211c80319c"
+        assert root.parent_id == "b7ad6b7169203331"
+        assert root.name == "GET /api/v1/trips/{trip_hash}/settlements"
+        assert root.attributes["http.status_code"] == 200
+        assert response.headers["traceparent"] == root.traceparent
+
+        names = _names(trace)
+        assert "auth" in names
+        assert "settlements.match" in names
+        assert "SELECT" in names
+        assert all(s.end is not None for s in trace.spans)
+        assert all(s.parent_id for s in trace.spans[1:])
+
+    def test_calendar_and_async_sql(self, client, collector, trusted, test_trip, auth_headers):
+        """Test calendar assembly and asyncio engine statements are traced."""
+        headers = {**auth_headers, "traceparent": INCOMING}
+        client.get(f"/api/v1/trips/{test_trip.hash_id}/calendar", headers=headers)
+        client.get(f"/api/v1/trips/{test_trip.hash_id}", headers=headers)
+
+        calendar, trip = collector.traces
+        assert "calendar.assemble" in _names(calendar)
+        assert "SELECT" in _names(trip)
+        assert any(s.attributes.get("db.system") == "sqlite" for s in trip.spans)
+
+    def test_sample_rate(self):
+        """Test that a sample rate of one traces every request."""
+        middleware = tracing.TracingMiddleware(None, sample_rate=1.0)
+        root = middleware._start({"method": "GET", "path": "/health", "headers": []})
+
+        assert root is not None and root.parent_id is None
+        assert tracing.TracingMiddleware(None, sample_rate=0.0)._start(
+            {"method": "GET", "path": "/health", "headers": []}
+        ) is None
+
+
+class TestOutboundCalls:
+    """Tests for httpx client spans."""
+
+    def test_generate_span_propagates_traceparent(self, monkeypatch):
+        """Test that the Ollama call gets a client span and traceparent header."""
+        sent = []
+
+        async def _fake_send(transport, request):
+            sent.append(request)
+            return httpx.Response(200, json={"response": " hi "})
+
+        monkeypatch.setattr(httpx.AsyncHTTPTransport, "handle_async_request", _fake_send)
+        root = tracing.Trace().root("test")
+        token = tracing._current.set(root)
+        try:
+            result = asyncio.run(ollama.generate("prompt", model="m"))
+        finally:
+            tracing._current.reset(token)
+
+        assert result == "hi"
+        client_span = next(s for s in root.trace.spans if s.name == "HTTP POST")
+        assert client_span.kind == tracing.KIND_CLIENT
+        assert client_span.attributes["http.status_code"] == 200
+        assert sent[0].headers["traceparent"] == client_span.traceparent
+        parent = next(s for s in root.trace.spans if s.span_id == client_span.parent_id)
+        assert parent.name == "ollama.generate"
+
+
+class TestExport:
+    """Tests for OTLP/JSON encoding and the file exporter."""
+
+    def test_encode_otlp(self):
+        """Test the OTLP/JSON document layout."""
+        trace = tracing.Trace()
+        root = trace.root("GET /x", **{"http.status_code": 200})
+        with tracing.span("never"):  # no current span: no-op
+            pass
+        child = root.child("work", ok=True, ratio=0.5)
+        child.finish()
+        root.finish()
+
+        doc = tracing.encode_otlp(trace, service_name="svc")
+        resource = doc["resourceSpans"][0]
+        spans = resource["scopeSpans"][0]["spans"]
+        assert resource["resource"]["attributes"][0]["value"] == {"stringValue": "svc"}
+        assert [s["name"] for s in spans] == ["GET /x", "work"]
+        assert "parentSpanId" not in spans[0]
+        assert spans[1]["parentSpanId"] == spans[0]["spanId"]
+        assert {"key": "http.status_code", "value": {"intValue": "200"}} in spans[0]["attributes"]
+        assert {"key": "ok", "value": {"boolValue": True}} in spans[1]["attributes"]
+
+    def test_file_exporter(self, tmp_path):
+        """Test that traces are appended as OTLP/JSON lines off-thread."""
+        path = tmp_path / "traces.jsonl"
+        processor = tracing.BatchProcessor(tracing.FileExporter(str(path)))
+        for _ in range(2):
+            trace = tracing.Trace()
+            trace.root("GET /health").finish()
+            processor.submit(trace)
+        processor.flush()
+
+        lines = path.read_text().splitlines()
+        assert len(lines) == 2
+        assert json.loads(lines[0])["resourceSpans"][0]["scopeSpans"][0]["spans"][0]["name"] == "GET /health"
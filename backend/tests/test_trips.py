@@ -48,6 +48,24 @@ class TestCreateTrip:
         assert data["title"] == "Quick Trip"
         assert data["description"] is None
 
+    def test_create_trip_retries_hash_collision(self, client, auth_headers, test_trip, monkeypatch):
+        """Test that a clashing hash_id is retried with a fresh one instead of failing."""
+        hashes = iter([test_trip.hash_id, "fresh_hash_1"])
+        monkeypatch.setattr("app.routers.trips._new_hash", lambda: next(hashes))
+        payload = {"title": "Second Trip", "user_name": "Alice"}
+
+        response = client.post("/api/v1/trips", json=payload, headers=auth_headers)
+
+        assert response.status_code == 200
+        assert response.json()["hash_id"] == "fresh_hash_1"
+
+    def test_create_trip_skips_existence_check(self, query_budget, auth_headers):
+        """Test that creation writes without first querying for the new hash."""
+        payload = {"title": "Quick Trip", "user_name": "Alice"}
+        # auth, trip insert, membership insert, refresh
+        response = query_budget("POST", "/api/v1/trips", 4, json=payload, headers=auth_headers)
+        assert response.status_code == 200
+
     def test_create_trip_unauthorized(self, client):
         """Test creating trip without authentication."""
         payload = {"title": "Test Trip", "user_name": "Test User"}
@@ -267,6 +285,21 @@ class TestUpdateTrip:
         assert data["description"] == "New description"
         assert data["date_start"] == "2026-09-01"
 
+    def test_update_trip_bumps_version(self, client, test_trip, auth_headers, db_session):
+        """Test that writes to a trip bump its data version."""
+        assert test_trip.version == 1
+
+        response = client.put(
+            f"/api/v1/trips/{test_trip.hash_id}",
+            json={"title": "Renamed"},
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        db_session.expire_all()
+        trip = db_session.query(Trip).filter(Trip.id == test_trip.id).first()
+        assert trip.version == 2
+
     def test_update_trip_not_found(self, client, auth_headers):
         """Test updating non-existent trip."""
         payload = {"title": "New Title"}
@@ -1,5 +1,7 @@
 """Unit tests for users API endpoints."""
 
+from types import SimpleNamespace
+
 import pytest
 from app.models.user import User
 
@@ -64,6 +66,24 @@ class TestCreateUser:
         assert len(users) == 5
 
 
+    def test_create_user_retries_token_collision(self, client, test_user, monkeypatch):
+        """Test that a clashing token is retried with fresh identifiers."""
+        hexes = iter(["aaaaaaaa0000", test_user.token, "bbbbbbbb0000", "fresh_token"])
+        fake_uuid = SimpleNamespace(uuid4=lambda: SimpleNamespace(hex=next(hexes)))
+        monkeypatch.setattr("app.routers.users.uuid", fake_uuid)
+
+        response = client.post("/api/v1/users")
+
+        assert response.status_code == 200
+        assert response.json()["user_id"] == "bbbbbbbb"
+        assert response.json()["token"] == "fresh_token"
+
+    def test_create_user_is_a_single_write(self, query_budget):
+        """Test that creation inserts without first querying for its identifiers."""
+        # insert, refresh
+        response = query_budget("POST", "/api/v1/users", 2)
+        assert response.status_code == 200
+
 class TestAuthentication:
     """Tests for authentication mechanism."""
 